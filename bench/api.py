@@ -0,0 +1,101 @@
+"""Compare response bytes and latency of the JSON API and the HTML pages.
+
+    python3 -m bench.api --beans 5000 --requests 200
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from csgobeans import create_app
+from csgobeans import ctx
+from csgobeans.beans import Bean
+
+from .steam_client import percentile
+
+
+PAIRS = [
+    ('catalog', '/', '/api/v1/beans'),
+    ('inventory', '/beans', '/api/v1/inventory'),
+    ('trades', '/history', '/api/v1/trades'),
+]
+
+
+def seed(app, beans, trades):
+    with app.app_context():
+        db = ctx.get_db()
+        db.migrate()
+        db.populate_beans(
+            Bean('bean %06d' % i, 'description of bean %d' % i,
+                 1 + i % 9, 1 + i % 4)
+            for i in range(beans))
+        user_id = db.login_steam_user('76561197960265728')
+        bean_ids = [bean_id for bean_id, _ in db.list_beans()]
+        db.redeem_items(user_id, [
+            ('item %d' % i, bean_ids[i % len(bean_ids)], 1 + i % 9)
+            for i in range(trades)])
+    return user_id
+
+
+def run(client, url, requests):
+    samples = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - t0)
+        assert response.status_code == 200, (url, response.status_code)
+    data = response.get_data()
+    return {
+        'url': url,
+        'bytes': len(data),
+        'gzip_bytes': len(gzip.compress(data, 6)),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--beans', type=int, default=5000)
+    parser.add_argument('--trades', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    instance_dir = tempfile.mkdtemp()
+    try:
+        # Caching is disabled to measure what each uncached request costs.
+        app = create_app({
+            'DATABASE_FILE': os.path.join(instance_dir, 'bench.sqlite'),
+            'INVENTORY_CACHE_DIR': os.path.join(instance_dir, 'cache'),
+            'TEMPLATE_CACHE_DIR': os.path.join(instance_dir, 'templates'),
+            'INVENTORY_PREFETCH_WORKERS': 0,
+            'PAGE_CACHE_SIZE': 0,
+            'PAGE_SIZE': args.page_size,
+        })
+        user_id = seed(app, args.beans, args.trades)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+
+        results = []
+        for name, html_url, api_url in PAIRS:
+            html = run(client, html_url, args.requests)
+            api = run(client, api_url, args.requests)
+            results.append({
+                'listing': name,
+                'html': html,
+                'api': api,
+                'bytes_ratio': api['bytes'] / html['bytes'],
+                'p50_speedup': html['p50_ms'] / api['p50_ms'],
+            })
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(instance_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure time and allocations of building Bean objects from rows.
+
+Compares the original dict-backed Bean, built per row in a list
+comprehension, with the tuple-backed Bean built by a row factory.
+
+    python3 -m bench.bean_rows --rows 100000
+"""
+import argparse
+import json
+import sqlite3
+import time
+import tracemalloc
+
+from csgobeans import beans
+
+
+class LegacyBean:
+    def __init__(self, name, short_desc, color, quality):
+        if not isinstance(color, beans.Color):
+            color = beans.Color(color)
+        if not isinstance(quality, beans.Quality):
+            quality = beans.Quality(quality)
+        self.name = name
+        self.short_desc = short_desc
+        self.color = color
+        self.quality = quality
+
+
+def connect(rows):
+    connection = sqlite3.connect(':memory:')
+    connection.execute(
+        'CREATE TABLE beans (bean_id INTEGER PRIMARY KEY, bean_name TEXT,'
+        ' short_desc TEXT, color INTEGER, quality INTEGER)')
+    connection.executemany(
+        'INSERT INTO beans VALUES (?, ?, ?, ?, ?)',
+        ((i, 'bean %d' % i, 'a bean', 1 + i % 9, 1 + i % 4)
+         for i in range(rows)))
+    return connection
+
+
+QUERY = 'SELECT bean_id, bean_name, short_desc, color, quality FROM beans'
+
+
+def legacy(connection):
+    return [
+        (row[0], LegacyBean(row[1], row[2], row[3], row[4]))
+        for row in connection.execute(QUERY).fetchall()
+    ]
+
+
+def bean_row(cursor, row):
+    return (row[0], beans.bean_from_columns(row[1], row[2], row[3], row[4]))
+
+
+def row_factory(connection):
+    cursor = connection.cursor()
+    cursor.row_factory = bean_row
+    return cursor.execute(QUERY).fetchall()
+
+
+def measure(label, build, connection, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(connection)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    result = build(connection)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        'bean': label,
+        'rows': rows,
+        'ms': best * 1000,
+        'retained_bytes_per_row': retained / rows,
+        'peak_bytes_per_row': peak / rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    connection = connect(args.rows)
+    results = [
+        measure('legacy', legacy, connection, args.rows, args.repeat),
+        measure('tuple', row_factory, connection, args.rows, args.repeat),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Measure bulk bean grants against the per-user give_user_id_beans path.
+
+    python3 -m bench.grants --users 100000 --rows 1000000 --shards 0
+
+Both runs grant the same rows to freshly seeded databases; the per-user
+path is only run on the first --baseline-rows rows.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from csgobeans import grants
+from csgobeans.db import Database
+
+
+def seed(path, users, shards):
+    db = Database(path, shards=shards)
+    db.migrate()
+    db.populate_beans_from_file()
+    with db.db:
+        for steam_id in range(users):
+            db.login_steam_user(steam_id)
+    return db
+
+
+def write_grants(path, names, users, rows):
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('steam_id,bean_name,qty\n')
+        for _ in range(rows):
+            f.write('%d,%s,%d\n' % (
+                rng.randrange(users), rng.choice(names), rng.randint(1, 3)))
+
+
+def bulk(db, path, args):
+    result = grants.grant_beans(
+        db, 'bench', path, chunk_size=args.chunk_size)
+    return {
+        'path': 'grant_beans',
+        'rows': result.granted,
+        'rows_per_sec': result.granted / result.elapsed,
+        'seconds': result.elapsed,
+    }
+
+
+def baseline(db, path, args):
+    bean_ids = dict(
+        (bean.name, bean_id) for bean_id, bean in db.list_beans())
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        next(f)
+        for line, _ in zip(f, range(args.baseline_rows)):
+            steam_id, name, qty = line.rstrip('\n').split(',')
+            rows.append((int(steam_id), name, int(qty)))
+
+    start = time.perf_counter()
+    for steam_id, name, qty in rows:
+        user_id = db.user_id_from_steam_id(steam_id)
+        db.give_user_id_beans(user_id, [(bean_ids[name], qty)])
+    elapsed = time.perf_counter() - start
+    return {
+        'path': 'give_user_id_beans',
+        'rows': len(rows),
+        'rows_per_sec': len(rows) / elapsed,
+        'seconds': elapsed,
+    }
+
+
+def run(measure, args):
+    db_dir = tempfile.mkdtemp()
+    try:
+        db = seed(os.path.join(db_dir, 'bench.sqlite'), args.users,
+                  args.shards)
+        names = [bean.name for _, bean in db.list_beans()]
+        path = os.path.join(db_dir, 'grants.csv')
+        write_grants(path, names, args.users, args.rows)
+        result = measure(db, path, args)
+        db.close()
+        return result
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--shards', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--baseline-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    results = [run(baseline, args), run(bulk, args)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
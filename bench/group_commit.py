@@ -0,0 +1,111 @@
+"""Measure trades per second for each database durability mode.
+
+    python3 -m bench.group_commit --threads 32 --trades 200
+
+Every thread redeems its own items through ctx.redeem_items, the same
+path POST /trade takes, so each mode is measured with its real commits.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from csgobeans import create_app
+from csgobeans import ctx
+from csgobeans import groupcommit
+
+from .steam_client import percentile
+
+
+def seed(app, threads):
+    with app.app_context():
+        db = ctx.get_db()
+        db.migrate()
+        db.populate_beans_from_file()
+        return [db.login_steam_user(str(i)) for i in range(threads)]
+
+
+def run(durability, args):
+    instance_dir = tempfile.mkdtemp()
+    try:
+        app = create_app({
+            'DATABASE_FILE': os.path.join(instance_dir, 'bench.sqlite'),
+            'TEMPLATE_CACHE_DIR': os.path.join(instance_dir, 'templates'),
+            'DATABASE_SYNCHRONOUS': args.synchronous,
+            'DATABASE_POOL_SIZE': args.threads,
+            'DATABASE_POOL_TIMEOUT': 60,
+            'DATABASE_BUSY_TIMEOUT': 60000,
+            'DATABASE_DURABILITY': durability,
+            'DATABASE_GROUP_COMMIT_SIZE': args.batch_size,
+            'DATABASE_GROUP_COMMIT_DELAY': args.delay,
+            'INVENTORY_PREFETCH_WORKERS': 0,
+        })
+        user_ids = seed(app, args.threads)
+        latencies = []
+        start = threading.Barrier(args.threads + 1)
+
+        def trade(user_id):
+            samples = []
+            start.wait()
+            for i in range(args.trades):
+                with app.app_context():
+                    t0 = time.perf_counter()
+                    ctx.redeem_items(
+                        user_id, [('%d-%d' % (user_id, i), 1, 1)])
+                    samples.append(time.perf_counter() - t0)
+            latencies.extend(samples)
+
+        workers = [
+            threading.Thread(target=trade, args=(user_id,))
+            for user_id in user_ids]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - t0
+
+        result = {
+            'durability': durability,
+            'trades': len(latencies),
+            'trades_per_sec': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+        writer = app.extensions.get('db_writer')
+        if writer is not None:
+            stats = writer.stats()
+            writer.close()
+            result['mean_batch'] = stats['committed'] / max(
+                1, stats['batches'])
+        return result
+    finally:
+        shutil.rmtree(instance_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--trades', type=int, default=200,
+                        help='Trades per thread.')
+    parser.add_argument('--synchronous', default='FULL',
+                        help='FULL syncs every commit, NORMAL only at'
+                             ' WAL checkpoints.')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--delay', type=float, default=0.002)
+    parser.add_argument('--mode', action='append',
+                        choices=groupcommit.DURABILITY_MODES)
+    args = parser.parse_args()
+
+    results = [
+        run(durability, args)
+        for durability in args.mode or groupcommit.DURABILITY_MODES]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
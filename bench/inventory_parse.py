@@ -0,0 +1,99 @@
+"""Compare peak memory and time of whole-body and streaming inventory parsing.
+
+    python3 -m bench.inventory_parse --items 5000
+
+Each parser runs in a fresh interpreter so that peak RSS is its own.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from csgobeans.inventory import parse_csgo_inventory
+
+from .stub_steam import make_inventory
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_whole(body):
+    """What load_csgo_inventory did before: json.loads, then map."""
+    response_json = json.loads(body.decode('utf-8'))
+    inventory = response_json['rgInventory']
+    descriptions = response_json['rgDescriptions']
+    return [
+        (item['id'], descriptions[
+            item['classid'] + '_' + item['instanceid']]['market_name'])
+        for item in inventory.values()
+    ]
+
+
+def parse_streaming(body):
+    chunks = (
+        body[i:i + CHUNK_SIZE].decode('utf-8')
+        for i in range(0, len(body), CHUNK_SIZE))
+    items, _, _ = parse_csgo_inventory(chunks)
+    return items
+
+
+PARSERS = {
+    'whole': parse_whole,
+    'streaming': parse_streaming,
+}
+
+
+def measure(parser, items):
+    body = json.dumps(make_inventory('76561197960265728', items)).encode()
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    parsed = PARSERS[parser](body)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(parsed) == items
+
+    # Timed again without tracemalloc, which slows allocation down.
+    started = time.perf_counter()
+    PARSERS[parser](body)
+    untraced = time.perf_counter() - started
+
+    return {
+        'parser': parser,
+        'items': items,
+        'body_bytes': len(body),
+        'parse_ms': untraced * 1000,
+        'traced_parse_ms': elapsed * 1000,
+        'peak_alloc_bytes': peak,
+        'peak_rss_growth_kb':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            - baseline_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--parser', choices=sorted(PARSERS))
+    args = parser.parse_args()
+
+    if args.parser is not None:
+        print(json.dumps(measure(args.parser, args.items)))
+        return
+
+    results = []
+    for name in PARSERS:
+        output = subprocess.check_output([
+            sys.executable, '-m', 'bench.inventory_parse',
+            '--items', str(args.items), '--parser', name])
+        results.append(json.loads(output))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
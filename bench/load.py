@@ -0,0 +1,269 @@
+"""Drive login, trade and browse flows with concurrent virtual users.
+
+    python3 -m bench.load --scale 0.01 --users 16 --duration 30
+
+--scale 1 seeds the full volumes (100k users, 10M inventory rows and 50M
+trades). Pass --database to keep the seeded file between runs; it is only
+seeded when it does not exist yet.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from csgobeans import create_app
+from csgobeans import metrics
+from csgobeans.db import Database
+
+from .steam_client import percentile
+from .stub_steam import StubSteamServer
+
+
+FIRST_STEAM_ID = 76561197960265728
+FULL_USERS = 100000
+FULL_INVENTORY_ROWS = 10000000
+FULL_TRADES = 50000000
+CATALOG_SIZE = 1000
+SEED_CHUNK = 100000
+SEED_START = datetime.datetime(2019, 1, 1)
+
+OPERATIONS = ('login', 'trade_get', 'trade_post', 'beans', 'history')
+
+
+def _chunked(rows, size=SEED_CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(database_file_path, users, inventory_rows, trades):
+    """Fills a new database with users, inventories and trade histories."""
+    db = Database(database_file_path)
+    db.migrate()
+    db.close()
+
+    connection = sqlite3.connect(database_file_path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = OFF')
+
+    def insert(query, rows):
+        for chunk in _chunked(rows):
+            with connection:
+                connection.executemany(query, chunk)
+
+    insert(
+        'INSERT INTO beans (bean_name, short_desc, color, quality)'
+        ' VALUES (?, ?, ?, ?)',
+        (('Bean %04d' % i, 'Seeded bean number %d' % i,
+          1 + i % 9, 1 + i % 4)
+         for i in range(CATALOG_SIZE)))
+    insert(
+        'INSERT INTO auth (user_id, username, password_hash)'
+        ' VALUES (?, ?, ?)',
+        ((i + 1, str(FIRST_STEAM_ID + i), '') for i in range(users)))
+    insert(
+        'INSERT INTO steam (steam_id, user_id) VALUES (?, ?)',
+        ((FIRST_STEAM_ID + i, i + 1) for i in range(users)))
+
+    per_user = min(CATALOG_SIZE, max(1, inventory_rows // users))
+    insert(
+        'INSERT INTO inventory (user_id, bean_id, qty) VALUES (?, ?, ?)',
+        ((user_id, 1 + (user_id * 7 + j) % CATALOG_SIZE, 1 + j % 9)
+         for user_id in range(1, users + 1)
+         for j in range(per_user)))
+
+    def trade_rows():
+        for n in range(trades):
+            timestamp = SEED_START + datetime.timedelta(seconds=n)
+            yield (
+                1 + n % users,
+                'seeded-%d' % n,
+                timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+    insert(
+        'INSERT INTO trades (user_id, item, trade_timestamp)'
+        ' VALUES (?, ?, ?)',
+        trade_rows())
+
+    connection.execute('ANALYZE')
+    connection.close()
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, steam_id, deadline, relogin_every, results):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.steam_id = steam_id
+        self.deadline = deadline
+        self.relogin_every = relogin_every
+        self.results = results
+        self.session = requests.Session()
+
+    def timed(self, operation, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                self.base_url + path,
+                allow_redirects=False,
+                **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        self.results[operation].append((time.perf_counter() - started, ok))
+
+    def login(self):
+        self.timed('login', 'GET', '/login', params={
+            'openid.identity':
+                'https://steamcommunity.com/openid/id/%d' % self.steam_id,
+            'openid.mode': 'id_res',
+        })
+
+    def run(self):
+        iteration = 0
+        while time.perf_counter() < self.deadline:
+            if iteration % self.relogin_every == 0:
+                self.login()
+            self.timed('trade_get', 'GET', '/trade')
+            # Stub inventories number items steam_id * 100000 + i, so later
+            # rounds replay already traded items.
+            self.timed('trade_post', 'POST', '/trade', data={
+                'item_id': str(self.steam_id * 100000 + iteration % 25),
+                'item_name': 'Stub Skin',
+            })
+            self.timed('beans', 'GET', '/beans')
+            self.timed('history', 'GET', '/history')
+            iteration += 1
+        self.session.close()
+
+
+def summarize(samples, elapsed):
+    latencies = [latency for latency, _ in samples]
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def queries_per_request(before):
+    """Mean SQL statements per request by endpoint since `before`."""
+    histogram = metrics.REQUEST_SQL_STATEMENTS
+    result = {}
+    for labels in histogram.series():
+        count = histogram.count(*labels) - before.get(labels, (0, 0))[0]
+        total = histogram.sum(*labels) - before.get(labels, (0, 0))[1]
+        if count:
+            result[labels[0]] = total / count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.01)
+    parser.add_argument('--database')
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--relogin-every', type=int, default=10)
+    parser.add_argument('--steam-latency', type=float, default=0.05)
+    parser.add_argument('--inventory-size', type=int, default=25)
+    parser.add_argument('--prefetch-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    users = max(1, int(FULL_USERS * args.scale))
+    instance_dir = tempfile.mkdtemp()
+    database_file_path = args.database or os.path.join(
+        instance_dir, 'load.sqlite')
+
+    report = {
+        'scale': args.scale,
+        'virtual_users': args.users,
+        'duration_s': args.duration,
+        'steam_latency_s': args.steam_latency,
+    }
+    stub = StubSteamServer(
+        latency=args.steam_latency, inventory_size=args.inventory_size)
+    stub.start()
+    server = None
+    try:
+        if not os.path.exists(database_file_path):
+            started = time.perf_counter()
+            seed(
+                database_file_path,
+                users,
+                int(FULL_INVENTORY_ROWS * args.scale),
+                int(FULL_TRADES * args.scale))
+            report['seed_s'] = time.perf_counter() - started
+
+        app = create_app({
+            'DATABASE_FILE': os.path.abspath(database_file_path),
+            'INVENTORY_CACHE_DIR': os.path.join(instance_dir, 'cache'),
+            'TEMPLATE_CACHE_DIR': os.path.join(instance_dir, 'templates'),
+            'INVENTORY_PREFETCH_WORKERS': args.prefetch_workers,
+            'STEAM_BASE_URL': stub.base_url,
+        })
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:%d' % server.server_port
+
+        histogram = metrics.REQUEST_SQL_STATEMENTS
+        before = {
+            labels: (histogram.count(*labels), histogram.sum(*labels))
+            for labels in histogram.series()
+        }
+        results = {operation: [] for operation in OPERATIONS}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        virtual_users = [
+            VirtualUser(
+                base_url,
+                FIRST_STEAM_ID + i % users,
+                deadline,
+                args.relogin_every,
+                results)
+            for i in range(args.users)
+        ]
+        for user in virtual_users:
+            user.start()
+        for user in virtual_users:
+            user.join()
+        elapsed = time.perf_counter() - started
+
+        report['requests'] = sum(len(s) for s in results.values())
+        report['throughput_rps'] = report['requests'] / elapsed
+        report['operations'] = {
+            operation: summarize(samples, elapsed)
+            for operation, samples in results.items()
+        }
+        report['queries_per_request'] = queries_per_request(before)
+        report['steam_requests'] = stub.counters['requests']
+    finally:
+        if server is not None:
+            server.shutdown()
+        stub.stop()
+        shutil.rmtree(instance_dir)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
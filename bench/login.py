@@ -0,0 +1,70 @@
+"""Compare Steam login throughput of the password-hash path and the fast path.
+
+    python3 -m bench.login --users 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from csgobeans.db import Database
+
+
+FIRST_STEAM_ID = 76561197960265728
+
+
+def hashed_login(db, steam_id):
+    user_id = db.check_username_and_password(steam_id, "")
+    if user_id is None:
+        db.register_user(steam_id, "")
+        user_id = db.check_username_and_password(steam_id, "")
+        db.associate_user_id_with_steam_id(user_id, steam_id)
+    return user_id
+
+
+def fast_login(db, steam_id):
+    return db.login_steam_user(steam_id)
+
+
+def run(label, login, users):
+    db_dir = tempfile.mkdtemp()
+    db_path = os.path.join(db_dir, 'bench.sqlite')
+    db = Database(db_path)
+    db.migrate()
+
+    results = []
+    try:
+        steam_ids = [str(FIRST_STEAM_ID + i) for i in range(users)]
+        for phase in ('first', 'returning'):
+            start = time.perf_counter()
+            for steam_id in steam_ids:
+                login(db, steam_id)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'path': label,
+                'phase': phase,
+                'logins': users,
+                'logins_per_sec': users / elapsed,
+            })
+    finally:
+        db.close()
+        for name in os.listdir(db_dir):
+            os.remove(os.path.join(db_dir, name))
+        os.rmdir(db_dir)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    results = run('hashed', hashed_login, args.users)
+    results += run('fast', fast_login, args.users)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compare the Database multi-get APIs with per-key query loops.
+
+    python3 -m bench.multiget --sizes 10 1000 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from csgobeans.beans import Bean
+from csgobeans.db import Database
+
+
+def seed(db, rows):
+    db.populate_beans(
+        Bean('bean %d' % i, 'desc', 1 + i % 9, 1 + i % 4)
+        for i in range(rows))
+    db.db.executemany(
+        'INSERT INTO auth (username, password_hash) VALUES (?, ?)',
+        (('user %d' % i, '') for i in range(rows)))
+    db.db.executemany(
+        'INSERT INTO steam (steam_id, user_id) VALUES (?, ?)',
+        ((76561197960265728 + i, i + 1) for i in range(rows)))
+    db.db.executemany(
+        'INSERT INTO trades (user_id, item) VALUES (?, ?)',
+        ((1, 'item %d' % i) for i in range(0, rows, 2)))
+    db.db.commit()
+
+
+def bean_loop(db, keys):
+    return [db.list_beans_from_bean_ids([key])[0] for key in keys]
+
+
+def username_loop(db, keys):
+    return [db.username_from_user_id(key) for key in keys]
+
+
+def steam_id_loop(db, keys):
+    return [db.steam_id_from_user_id(key) for key in keys]
+
+
+def traded_loop(db, keys):
+    return [db.already_traded(1, key) for key in keys]
+
+
+def cases(db, rows):
+    return [
+        ('list_beans_from_bean_ids', bean_loop,
+            db.list_beans_from_bean_ids, lambda i: i),
+        ('usernames_from_user_ids', username_loop,
+            db.usernames_from_user_ids, lambda i: i),
+        ('steam_ids_from_user_ids', steam_id_loop,
+            db.steam_ids_from_user_ids, lambda i: i),
+        ('already_traded_many', traded_loop,
+            lambda keys: db.already_traded_many(1, keys),
+            lambda i: 'item %d' % i),
+    ]
+
+
+def timed(fn, keys):
+    start = time.perf_counter()
+    result = fn(keys)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    args = parser.parse_args()
+
+    rows = max(args.sizes)
+    db_dir = tempfile.mkdtemp()
+    db = Database(os.path.join(db_dir, 'bench.sqlite'))
+    try:
+        db.migrate()
+        seed(db, rows)
+
+        results = []
+        rng = random.Random(0)
+        for size in args.sizes:
+            ids = [rng.randint(1, rows) for _ in range(size)]
+            for name, loop, multi_get, make_key in cases(db, rows):
+                keys = [make_key(i) for i in ids]
+                loop_time, loop_result = timed(lambda k: loop(db, k), keys)
+                multi_time, multi_result = timed(multi_get, keys)
+                assert loop_result == multi_result
+                results.append({
+                    'api': name,
+                    'keys': size,
+                    'loop_ms': loop_time * 1000,
+                    'multi_get_ms': multi_time * 1000,
+                    'speedup': loop_time / multi_time,
+                })
+        print(json.dumps(results, indent=2))
+    finally:
+        db.close()
+        shutil.rmtree(db_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Measure worker cold start: import time and first-request latency.
+
+    python3 -m bench.startup --runs 5
+
+Each run is a fresh interpreter that imports csgobeans, creates the app and
+requests a few pages, once with an empty template cache and once after
+`flask warmup` has filled it.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PATHS = ('/', '/leaderboard')
+
+
+def app_config(instance_dir):
+    return {
+        'DATABASE_FILE': os.path.join(instance_dir, 'bench.sqlite'),
+        'INVENTORY_CACHE_DIR': os.path.join(instance_dir, 'inventory_cache'),
+        'TEMPLATE_CACHE_DIR': os.path.join(instance_dir, 'template_cache'),
+        'INVENTORY_PREFETCH_WORKERS': 0,
+    }
+
+
+def measure(instance_dir):
+    """Runs in the child: everything csgobeans costs happens in here."""
+    started = time.perf_counter()
+    import csgobeans
+    imported = time.perf_counter()
+    app = csgobeans.create_app(app_config(instance_dir))
+    created = time.perf_counter()
+
+    client = app.test_client()
+    first_requests = {}
+    for path in PATHS:
+        t0 = time.perf_counter()
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        first_requests[path] = (time.perf_counter() - t0) * 1000
+
+    return {
+        'import_ms': (imported - started) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'first_request_ms': first_requests,
+        'requests_imported': 'requests' in sys.modules,
+    }
+
+
+def seed(instance_dir):
+    from csgobeans import create_app
+    from csgobeans import ctx
+
+    app = create_app(app_config(instance_dir))
+    with app.app_context():
+        db = ctx.get_db()
+        db.migrate()
+        db.populate_beans_from_file()
+    return app
+
+
+def child(instance_dir):
+    output = subprocess.check_output([
+        sys.executable, '-m', 'bench.startup', '--child', instance_dir])
+    return json.loads(output)
+
+
+def summarize(label, samples):
+    return {
+        'cache': label,
+        'runs': len(samples),
+        'import_ms': statistics.median(s['import_ms'] for s in samples),
+        'create_app_ms': statistics.median(
+            s['create_app_ms'] for s in samples),
+        'first_request_ms': dict(
+            (path, statistics.median(
+                s['first_request_ms'][path] for s in samples))
+            for path in PATHS),
+        'requests_imported': any(s['requests_imported'] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', metavar='INSTANCE_DIR',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child)))
+        return
+
+    instance_dir = tempfile.mkdtemp()
+    try:
+        app = seed(instance_dir)
+        cache_dir = app.config['TEMPLATE_CACHE_DIR']
+
+        cold = []
+        for _ in range(args.runs):
+            shutil.rmtree(cache_dir)
+            os.mkdir(cache_dir)
+            cold.append(child(instance_dir))
+
+        from csgobeans import warmup
+        warmup.compile_templates(app)
+        warm = [child(instance_dir) for _ in range(args.runs)]
+
+        print(json.dumps(
+            [summarize('cold', cold), summarize('warm', warm)], indent=2))
+    finally:
+        shutil.rmtree(instance_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compare per-call connections with the pooled SteamClient.
+
+    python3 -m bench.steam_client --calls 200 --latency 0.005
+"""
+import argparse
+import json
+import statistics
+import time
+
+import requests
+
+from csgobeans import steam
+from csgobeans.inventory import load_csgo_inventory
+
+from .stub_steam import StubSteamServer
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(label, server, calls, fetch):
+    server.counters.update(connections=0, requests=0)
+    samples = []
+    start = time.perf_counter()
+    for i in range(calls):
+        t0 = time.perf_counter()
+        fetch(76561197960265728 + i)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        'client': label,
+        'calls': calls,
+        'calls_per_sec': calls / elapsed,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+        'connections': server.counters['connections'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--inventory-size', type=int, default=25)
+    args = parser.parse_args()
+
+    with StubSteamServer(
+        latency=args.latency, inventory_size=args.inventory_size
+    ) as server:
+        def unpooled(steam_id):
+            requests.get(
+                server.base_url + steam.CSGO_INVENTORY_PATH % steam_id
+            ).json()
+
+        client = steam.SteamClient(base_url=server.base_url)
+
+        def pooled(steam_id):
+            load_csgo_inventory(steam_id, client)
+
+        results = [
+            run('requests.get', server, args.calls, unpooled),
+            run('SteamClient', server, args.calls, pooled),
+        ]
+        client.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
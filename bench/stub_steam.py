@@ -0,0 +1,265 @@
+"""Local stand-in for the parts of Steam that csgobeans talks to.
+
+Serves OpenID `check_authentication` and the legacy CSGO inventory JSON so
+that clients can be benchmarked offline. Run standalone with:
+
+    python3 -m bench.stub_steam --port 8765 --latency 0.05
+"""
+import argparse
+import http.server
+import json
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+
+
+INVENTORY_PATH_RE = re.compile(r'^/profiles/(\d+)/inventory/json/730/2$')
+PAGED_INVENTORY_PATH_RE = re.compile(r'^/inventory/(\d+)/730/2$')
+
+
+def item_id(steam_id, i):
+    return str(int(steam_id) * 100000 + i)
+
+
+def make_description(i):
+    # Roughly the size and shape of a real CSGO item description.
+    return {
+        'appid': 730,
+        'classid': str(1000 + i),
+        'instanceid': '0',
+        'icon_url': 'x' * 120,
+        'name': 'Stub Skin %d' % i,
+        'market_name': 'Stub Skin %d (Field-Tested)' % i,
+        'market_hash_name': 'Stub Skin %d (Field-Tested)' % i,
+        'type': 'Classified Rifle',
+        'tradable': 1,
+        'marketable': 1,
+        'descriptions': [
+            {'type': 'html', 'value': 'Exterior: Field-Tested'},
+            {'type': 'html', 'value': 'A stub skin used for benchmarks. ' * 4},
+        ],
+        'tags': [
+            {'category': 'Type', 'internal_name': 'CSGO_Type_Rifle',
+             'localized_tag_name': 'Rifle'},
+            {'category': 'Rarity', 'internal_name': 'Rarity_Legendary',
+             'localized_tag_name': 'Classified'},
+        ],
+    }
+
+
+def make_inventory(steam_id, count):
+    inventory = {}
+    descriptions = {}
+    for i in range(count):
+        description = make_description(i)
+        classid = description['classid']
+        instanceid = description['instanceid']
+        inventory[item_id(steam_id, i)] = {
+            'id': item_id(steam_id, i),
+            'classid': classid,
+            'instanceid': instanceid,
+            'amount': '1',
+            'pos': i + 1,
+        }
+        descriptions[classid + '_' + instanceid] = description
+    return {
+        'success': True,
+        'rgInventory': inventory,
+        'rgDescriptions': descriptions,
+        'more': False,
+        'more_start': False,
+    }
+
+
+def make_inventory_page(steam_id, total, count, start_assetid=None):
+    """Builds one page of the paginated inventory format."""
+    first = 0
+    if start_assetid is not None:
+        first = int(start_assetid) - int(item_id(steam_id, 0)) + 1
+    last = min(total, first + count)
+    assets = []
+    descriptions = []
+    for i in range(first, last):
+        description = make_description(i)
+        assets.append({
+            'appid': 730,
+            'contextid': '2',
+            'assetid': item_id(steam_id, i),
+            'classid': description['classid'],
+            'instanceid': description['instanceid'],
+            'amount': '1',
+        })
+        descriptions.append(description)
+    page = {
+        'assets': assets,
+        'descriptions': descriptions,
+        'total_inventory_count': total,
+        'success': 1,
+        'rwgrsn': -2,
+    }
+    if last < total:
+        page['more_items'] = 1
+        page['last_assetid'] = item_id(steam_id, last - 1)
+    return page
+
+
+class StubSteamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count('requests')
+        self.server.delay()
+
+        path, _, query = self.path.partition('?')
+        legacy = INVENTORY_PATH_RE.match(path)
+        paged = PAGED_INVENTORY_PATH_RE.match(path)
+        if legacy is None and paged is None:
+            return self.respond(404, b'', 'text/plain')
+
+        if self.server.throttled():
+            return self.respond(
+                429, b'', 'text/plain', {'Retry-After': '60'})
+
+        if legacy is not None:
+            inventory = make_inventory(
+                legacy.group(1), self.server.inventory_size)
+        else:
+            params = urllib.parse.parse_qs(query)
+            start_assetid = params.get('start_assetid', [None])[0]
+            if self.server.broken_cursor == 'repeat':
+                start_assetid = None
+            inventory = make_inventory_page(
+                paged.group(1),
+                self.server.inventory_size,
+                int(params.get('count', ['5000'])[0]),
+                start_assetid)
+            if self.server.broken_cursor == 'missing':
+                inventory.pop('last_assetid', None)
+        body = json.dumps(inventory).encode('utf-8')
+        self.respond(200, body, 'application/json')
+
+    def do_POST(self):
+        self.server.count('requests')
+        self.server.delay()
+
+        length = int(self.headers.get('Content-Length', 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+
+        if self.path != '/openid/login':
+            return self.respond(404, b'', 'text/plain')
+
+        mode = form.get('openid.mode', [''])[0]
+        valid = 'true' if mode == 'check_authentication' else 'false'
+        body = (
+            'ns:http://specs.openid.net/auth/2.0\n'
+            'is_valid:%s\n' % valid).encode('utf-8')
+        self.respond(200, body, 'text/plain')
+
+    def respond(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubSteamServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=('127.0.0.1', 0),
+        latency=0.0,
+        inventory_size=25,
+        throttle_every=0,
+        broken_cursor=None
+    ):
+        super().__init__(address, StubSteamHandler)
+        self.latency = latency
+        self.inventory_size = inventory_size
+        self.throttle_every = throttle_every
+        # 'missing' leaves last_assetid out of pages that have more items,
+        # 'repeat' serves the first page whatever start_assetid asks for.
+        self.broken_cursor = broken_cursor
+        self.counters = {'connections': 0, 'requests': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def handle_error(self, request, client_address):
+        # Clients that give up on slow responses are expected here.
+        if not isinstance(
+            sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)
+        ):
+            super().handle_error(request, client_address)
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def delay(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def throttled(self):
+        if self.throttle_every <= 0:
+            return False
+        with self._lock:
+            return self.counters['requests'] % self.throttle_every == 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--inventory-size', type=int, default=25)
+    parser.add_argument('--throttle-every', type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubSteamServer(
+        (args.host, args.port),
+        latency=args.latency,
+        inventory_size=args.inventory_size,
+        throttle_every=args.throttle_every)
+    print('Stub Steam listening on %s' % server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
+import hashlib
+import os
+
 import flask
-from werkzeug.security import check_password_hash, generate_password_hash
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 
+from . import api
 from . import cli
 from . import ctx
 from . import auth
 from . import inventory
+from . import leaderboard
+from . import metrics
 
 
 def create_app(config=None):
@@ -13,13 +20,47 @@ def create_app(config=None):
     configure(app, config)
     setup(app)
 
+    def render_catalog(version, cursor):
+        def render():
+            page = ctx.get_page(
+                ctx.get_db().list_beans,
+                lambda row: (row[1].name,))
+            return Markup(flask.render_template(
+                "catalog.html", beans=page.items, page=page))
+        return ctx.cached_render(('catalog', version, cursor), render)
+
     @app.route("/")
     def index():
-        beans = ctx.get_db().list_beans()
-        return ctx.render_template_with_context("index.html", beans=beans)
+        version, modified = ctx.get_catalog_version()
+        args = flask.request.args
+        cursor = (args.get('after'), args.get('before'))
+
+        if ctx.get_user_id() is not None or ctx.has_pending_flashes():
+            return ctx.render_template_with_context(
+                "index.html", catalog=render_catalog(version, cursor))
+
+        # Anonymous pages are identical for everyone, so the whole page is
+        # cached and can be revalidated by browsers and the CDN.
+        html = ctx.cached_render(
+            ('index', version, cursor),
+            lambda: flask.render_template(
+                "index.html",
+                username=None,
+                catalog=render_catalog(version, cursor)))
+        response = flask.make_response(html)
+        response.set_etag('catalog-%d-%s' % (
+            version,
+            hashlib.sha1(repr(cursor).encode()).hexdigest()[:16]))
+        response.last_modified = modified
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
 
     app.register_blueprint(auth.create_blueprint())
     app.register_blueprint(inventory.create_blueprint())
+    app.register_blueprint(api.create_blueprint())
+    app.register_blueprint(leaderboard.create_blueprint())
+    app.register_blueprint(metrics.create_blueprint())
 
     return app
 
@@ -28,11 +69,65 @@ def configure(app, config):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE_FILE='csgobeans.sqlite',
+        DATABASE_POOL_SIZE=8,
+        DATABASE_POOL_TIMEOUT=5.0,
+        DATABASE_JOURNAL_MODE='WAL',
+        DATABASE_SYNCHRONOUS='NORMAL',
+        DATABASE_BUSY_TIMEOUT=5000,
+        DATABASE_MMAP_SIZE=64 * 1024 * 1024,
+        DATABASE_CACHE_SIZE=-8000,
+        DATABASE_SHARDS=0,
+        DATABASE_DURABILITY='request',
+        DATABASE_GROUP_COMMIT_SIZE=64,
+        DATABASE_GROUP_COMMIT_DELAY=0.002,
+        DATABASE_GROUP_COMMIT_QUEUE_SIZE=1024,
+        PAGE_SIZE=50,
+        PAGE_CACHE_SIZE=256,
+        CATALOG_VERSION_TTL=1.0,
+        TRADE_BATCH_LIMIT=500,
+        LEADERBOARD_SIZE=100,
+        TEMPLATE_CACHE_DIR='template_cache',
+        API_GZIP_MIN_SIZE=512,
+        API_GZIP_LEVEL=6,
+        INVENTORY_CACHE_DIR='inventory_cache',
+        INVENTORY_CACHE_TTL=300,
+        INVENTORY_CACHE_STALE_TTL=3600,
+        INVENTORY_CACHE_SIZE=1024,
+        INVENTORY_PREFETCH_WORKERS=4,
+        INVENTORY_PREFETCH_QUEUE_SIZE=256,
+        INVENTORY_PREFETCH_DEADLINE=15,
+        STEAM_DEFAULT_BACKOFF=60,
+        STEAM_BASE_URL='https://steamcommunity.com',
+        STEAM_CONNECT_TIMEOUT=3.05,
+        STEAM_READ_TIMEOUT=10,
+        STEAM_RETRIES=2,
+        STEAM_RETRY_BACKOFF=0.25,
+        STEAM_POOL_SIZE=10,
+        STEAM_INVENTORY_PAGE_SIZE=0,
+        STEAM_INVENTORY_MAX_PAGES=100,
+        STEAM_RATE_LIMIT=5,
+        STEAM_RATE_BURST=20,
+        STEAM_RATE_LIMIT_WAIT=0.5,
+        STEAM_RATE_LIMIT_FILE='steam_rate.sqlite',
     )
 
     if config is not None:
         app.config.from_mapping(config)
 
 def setup(app):
+    configure_templates(app)
     cli.init_cli(app)
     ctx.register_teardowns(app)
+
+def configure_templates(app):
+    # Compiled templates are kept on disk, so a new worker loads them instead
+    # of compiling each one on its first render. Jinja checks each entry
+    # against a checksum of the template source, so templates changed by a
+    # deploy are compiled again.
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if not cache_dir:
+        return
+    cache_dir = ctx.app_local_path(app, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = dict(
+        app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir))
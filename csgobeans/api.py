@@ -0,0 +1,121 @@
+import functools
+import gzip
+
+import flask
+
+from . import ctx
+
+
+BEAN_FIELDS = ('bean_id', 'bean_name', 'short_desc', 'color', 'quality')
+INVENTORY_FIELDS = (
+    'bean_id', 'qty', 'bean_name', 'short_desc', 'color', 'quality')
+TRADE_FIELDS = ('trade_id', 'item', 'trade_timestamp')
+
+
+def api_login_required(f):
+    @functools.wraps(f)
+    def decorator():
+        if ctx.get_user_id() is None:
+            response = flask.jsonify(error="Login required")
+            response.status_code = 401
+            return response
+        return f()
+    return decorator
+
+
+def not_modified(etag):
+    if flask.request.if_none_match.contains_weak(etag):
+        response = flask.Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def json_page(page, fields, etag):
+    """Serves a page of rows as arrays, with the column names once."""
+    response = flask.jsonify(
+        fields=fields,
+        items=page.items,
+        next=page.next_cursor,
+        prev=page.prev_cursor)
+    # Weak, since the same ETag is served gzipped and uncompressed.
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def gzip_response(response):
+    config = flask.current_app.config
+    response.vary.add('Accept-Encoding')
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or 'gzip' not in flask.request.accept_encodings
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < config['API_GZIP_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, config['API_GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def create_blueprint():
+    bp = flask.Blueprint('api', __name__, url_prefix='/api/v1')
+    bp.after_request(gzip_response)
+
+    @bp.route("/beans")
+    def beans():
+        version, modified = ctx.get_catalog_version()
+        etag = 'catalog-%d-%s' % (version, ctx.url_digest())
+        response = not_modified(etag)
+        if response is None:
+            page = ctx.get_page(
+                functools.partial(ctx.get_db().list_beans, raw=True),
+                lambda row: (row[1],))
+            response = json_page(page, BEAN_FIELDS, etag)
+        response.last_modified = modified
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response
+
+    @bp.route("/inventory")
+    @api_login_required
+    def inventory():
+        user_id = ctx.get_user_id()
+        etag = ctx.user_etag(user_id)
+        response = not_modified(etag)
+        if response is None:
+            page = ctx.get_page(
+                functools.partial(
+                    ctx.get_db().list_inventory_from_user_id,
+                    user_id,
+                    raw=True),
+                lambda row: (row[2],))
+            response = json_page(page, INVENTORY_FIELDS, etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    @bp.route("/trades")
+    @api_login_required
+    def trades():
+        user_id = ctx.get_user_id()
+        etag = ctx.user_etag(user_id)
+        response = not_modified(etag)
+        if response is None:
+            page = ctx.get_page(
+                functools.partial(
+                    ctx.get_db().list_trades_from_user_id, user_id),
+                lambda row: (str(row[2]), row[0]))
+            page = page._replace(items=[
+                (trade_id, item, str(timestamp))
+                for trade_id, item, timestamp in page.items])
+            response = json_page(page, TRADE_FIELDS, etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    return bp
@@ -1,22 +1,24 @@
 import json
-import requests
+import math
 import urllib
 
 import flask
 
 from . import ctx
 from . import db
+from . import inventory
+from . import steam
 from .decorators import redirect_on_err
 from .flash import *
 
 
 OPENID_NS = "http://specs.openid.net/auth/2.0"
 OPENID_SPEC = "http://specs.openid.net/auth/2.0/identifier_select"
-STEAM_OPENID_URL = 'https://steamcommunity.com/openid/login'
 
 
 def steam_auth_url(host, base_url):
-    return STEAM_OPENID_URL + "?" + urllib.parse.urlencode({
+    openid_url = ctx.get_steam_client().url(steam.OPENID_LOGIN_PATH)
+    return openid_url + "?" + urllib.parse.urlencode({
         'openid.ns': OPENID_NS,
         'openid.identity': OPENID_SPEC,
         'openid.claimed_id': OPENID_SPEC,
@@ -29,7 +31,8 @@ def validate_login(login_info):
     data = dict()
     data.update(login_info)
     data["openid.mode"] = "check_authentication"
-    response = requests.post(STEAM_OPENID_URL, data=data)
+    response = ctx.get_steam_client().post(
+        steam.OPENID_LOGIN_PATH, data=data)
 
     if "is_valid:true" in response.text:
         return True
@@ -48,20 +51,22 @@ def create_blueprint():
             return flask.redirect(
                 steam_auth_url(flask.request.host, flask.request.base_url))
 
-        if not validate_login(flask.request.args):
+        try:
+            valid = validate_login(flask.request.args)
+        except steam.SteamRateLimited as error:
+            raise FlashError(
+                "Steam is busy, please try again in %d seconds"
+                % max(1, math.ceil(error.retry_after)))
+        if not valid:
             raise FlashError("Login failed")
 
         steam_id = identity.split('/')[-1]
 
-        db = ctx.get_db()
-        user_id = db.check_username_and_password(steam_id, "")
-        if user_id is None:
-            db.register_user(steam_id, "")
-            user_id = db.check_username_and_password(steam_id, "")
-            db.associate_user_id_with_steam_id(user_id, steam_id)
+        user_id = ctx.get_db().login_steam_user(steam_id)
 
         ctx.clear_session()
         ctx.set_user_id(user_id)
+        inventory.get_inventory_prefetcher().submit(steam_id)
 
         flash_success("Logged in with Steam ID %s" % steam_id)
         ctx.logger().debug("User logged in '%s'", steam_id)
@@ -1,4 +1,5 @@
 import enum
+import operator
 
 class Quality(enum.Enum):
     COMMON = 1
@@ -17,16 +18,40 @@ class Color(enum.Enum):
     GREY = 8
     WHITE = 9
 
-class Bean:
-    def __init__(self, name, short_desc, color, quality):
-        if not isinstance(color , Color):
-            color = Color(color)
-        if not isinstance(quality , Quality):
-            quality = Quality(quality)
-        self.name = name
-        self.short_desc = short_desc
-        self.color = color
-        self.quality = quality
+COLORS = {color.value: color for color in Color}
+QUALITIES = {quality.value: quality for quality in Quality}
+
+_new_tuple = tuple.__new__
+
+
+def _lookup(enum_type, table, value):
+    if value.__class__ is enum_type:
+        return value
+    try:
+        return table[value]
+    except (KeyError, TypeError):
+        return enum_type(value)
+
+
+class Bean(tuple):
+    """Immutable (name, short_desc, color, quality) record."""
+
+    __slots__ = ()
+
+    def __new__(cls, name, short_desc, color, quality):
+        return _new_tuple(cls, (
+            name,
+            short_desc,
+            _lookup(Color, COLORS, color),
+            _lookup(Quality, QUALITIES, quality)))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    name = property(operator.itemgetter(0))
+    short_desc = property(operator.itemgetter(1))
+    color = property(operator.itemgetter(2))
+    quality = property(operator.itemgetter(3))
 
     def __str__(self):
         return "Bean(\"{}\", \"{}\", {}, {})".format(
@@ -35,9 +60,8 @@ class Bean:
     def __repr__(self):
         return str(self)
 
-    def __eq__(self, other):
-        return all((
-            self.name == other.name,
-            self.short_desc == other.short_desc,
-            self.color == other.color,
-            self.quality == other.quality))
+
+def bean_from_columns(name, short_desc, color, quality):
+    """Builds a Bean from beans table columns, skipping validation."""
+    return _new_tuple(
+        Bean, (name, short_desc, COLORS[color], QUALITIES[quality]))
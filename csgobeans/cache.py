@@ -0,0 +1,264 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# An inventory fetched at `fetched_at` (None if never fetched), plus the time
+# until which Steam asked us not to call it again for this id.
+CacheEntry = collections.namedtuple(
+    'CacheEntry', ['fetched_at', 'items', 'backoff_until'])
+
+
+class DiskStore:
+    """Stores one JSON file per steam id so that all workers share entries."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, steam_id):
+        key = hashlib.sha1(str(steam_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def load(self, steam_id):
+        try:
+            with open(self._path(steam_id), encoding='utf-8') as entry_file:
+                data = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+        items = data.get('items', None)
+        if items is not None:
+            items = [tuple(item) for item in items]
+        return CacheEntry(
+            data.get('fetched_at', None),
+            items,
+            data.get('backoff_until', 0))
+
+    def store(self, steam_id, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as entry_file:
+                json.dump(entry._asdict(), entry_file)
+            os.replace(tmp_path, self._path(steam_id))
+        except OSError:
+            LOGGER.exception("Failed to store inventory for '%s'", steam_id)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class _Flight:
+    """One in-flight load that concurrent callers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InventoryCache:
+    """Two-tier TTL cache in front of a Steam inventory loader.
+
+    Entries younger than `ttl` are served directly. Entries younger than
+    `ttl + stale_ttl` are served while a background refresh runs. Older
+    entries, and misses, block on the loader. Concurrent loads of the same
+    steam id within a process share a single call to the loader.
+    """
+
+    def __init__(
+        self,
+        directory,
+        ttl=300,
+        stale_ttl=3600,
+        max_size=1024,
+        default_backoff=60
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.default_backoff = default_backoff
+        self.memory = LRUCache(max_size)
+        self.disk = DiskStore(directory)
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._flights = {}
+        self._counters = collections.Counter()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        for name in (
+            'hit', 'miss', 'stale', 'backoff', 'refresh', 'coalesced', 'error'
+        ):
+            stats.setdefault(name, 0)
+        stats['size'] = len(self.memory)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, steam_id, loader):
+        now = time.time()
+
+        entry = self.memory.get(steam_id)
+        if entry is None or not self._is_fresh(entry, now):
+            disk_entry = self.disk.load(steam_id)
+            if disk_entry is not None:
+                entry = _newest(entry, disk_entry)
+                self.memory.put(steam_id, entry)
+
+        if entry is not None and self._is_fresh(entry, now):
+            self._count('hit')
+            return (entry.items, False, 0)
+
+        if entry is not None and entry.backoff_until > now:
+            self._count('backoff')
+            if entry.items is not None:
+                return (entry.items, False, 0)
+            return ([], True, int(entry.backoff_until - now) + 1)
+
+        if entry is not None and self._is_stale(entry, now):
+            self._count('stale')
+            self._refresh_in_background(steam_id, loader)
+            return (entry.items, False, 0)
+
+        self._count('miss')
+        return self._refresh(steam_id, loader, entry)
+
+    def invalidate(self, steam_id):
+        self.memory.pop(steam_id)
+        self.disk.store(steam_id, CacheEntry(None, None, 0))
+
+    def _is_fresh(self, entry, now):
+        return entry.items is not None and now - entry.fetched_at < self.ttl
+
+    def _is_stale(self, entry, now):
+        return (
+            entry.items is not None
+            and now - entry.fetched_at < self.ttl + self.stale_ttl)
+
+    def _refresh(self, steam_id, loader, previous=None):
+        with self._lock:
+            flight = self._flights.get(steam_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[steam_id] = _Flight()
+
+        if not leader:
+            self._count('coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._load(steam_id, loader, previous)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[steam_id]
+            flight.done.set()
+        return flight.result
+
+    def _load(self, steam_id, loader, previous):
+        self._count('refresh')
+        inventory, too_many, retry_after = loader(steam_id)
+        now = time.time()
+
+        if too_many:
+            backoff_until = now + self._backoff_seconds(retry_after)
+            if previous is not None:
+                entry = previous._replace(backoff_until=backoff_until)
+            else:
+                entry = CacheEntry(None, None, backoff_until)
+        else:
+            entry = CacheEntry(now, [tuple(item) for item in inventory], 0)
+            inventory = entry.items
+
+        self.memory.put(steam_id, entry)
+        self.disk.store(steam_id, entry)
+
+        return (inventory, too_many, retry_after)
+
+    def _refresh_in_background(self, steam_id, loader):
+        with self._lock:
+            if steam_id in self._refreshing:
+                return
+            self._refreshing.add(steam_id)
+
+        def run():
+            try:
+                self._refresh(steam_id, loader, self.memory.get(steam_id))
+            except Exception:
+                self._count('error')
+                LOGGER.exception("Failed to refresh inventory '%s'", steam_id)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(steam_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _backoff_seconds(self, retry_after):
+        try:
+            retry_after = int(retry_after)
+        except (TypeError, ValueError):
+            retry_after = -1
+        if retry_after <= 0:
+            return self.default_backoff
+        return retry_after
+
+
+def _newest(entry, other):
+    if entry is None:
+        return other
+    fetched_at = entry.fetched_at or 0
+    other_fetched_at = other.fetched_at or 0
+    newest = entry if fetched_at >= other_fetched_at else other
+    return newest._replace(
+        backoff_until=max(entry.backoff_until, other.backoff_until))
@@ -0,0 +1,137 @@
+import array
+import os
+import random
+import threading
+import time
+
+from .beans import Quality
+
+
+QUALITY_WEIGHTS = {
+    Quality.COMMON: 50,
+    Quality.UNCOMMON: 25,
+    Quality.RARE: 10,
+    Quality.MYTHIC: 2,
+}
+
+
+class BeanCatalog:
+    """Immutable in-memory copy of the beans table.
+
+    Drops are weighted by bean quality and sampled in O(1) with Walker's
+    alias method.
+    """
+
+    def __init__(self, beans, weights=QUALITY_WEIGHTS, version=None):
+        self.version = version
+        self.bean_ids = array.array('q', (bean_id for bean_id, _ in beans))
+        self.beans = [bean for _, bean in beans]
+        self._build_alias_table([weights[bean.quality] for bean in self.beans])
+
+    def __len__(self):
+        return len(self.beans)
+
+    def _build_alias_table(self, weights):
+        count = len(weights)
+        total = sum(weights)
+        self._probability = array.array('d', bytes(8 * count))
+        self._alias = array.array('q', bytes(8 * count))
+
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Whatever is left has probability one, up to rounding error.
+        for i in small + large:
+            self._probability[i] = 1
+            self._alias[i] = i
+
+    def _draw(self, rng):
+        column = int(rng.random() * len(self.beans))
+        if rng.random() < self._probability[column]:
+            return column
+        return self._alias[column]
+
+    def sample(self, rng=random):
+        if not self.beans:
+            raise IndexError("Cannot sample from an empty catalog")
+        index = self._draw(rng)
+        return (self.bean_ids[index], self.beans[index])
+
+    def sample_many(self, count, rng=random):
+        if not self.beans:
+            raise IndexError("Cannot sample from an empty catalog")
+        return [
+            (self.bean_ids[index], self.beans[index])
+            for index in (self._draw(rng) for _ in range(count))
+        ]
+
+
+# Catalogs are shared by every thread in the process and keyed by database
+# file. Each key carries a generation so that a catalog loaded concurrently
+# with an invalidation is never stored. Writes from other processes are
+# picked up through the catalog version, which is re-read at most once per
+# `max_age` seconds.
+_catalogs = {}
+_generations = {}
+_versions = {}
+_lock = threading.Lock()
+
+
+def _key(database_file_path):
+    return os.path.realpath(database_file_path)
+
+
+def current_version(database_file_path, fetch, max_age=1.0):
+    """Returns the (version, modified) of the catalog, calling fetch() for
+    it only when the last known version is older than max_age seconds.
+    """
+    key = _key(database_file_path)
+    now = time.monotonic()
+    with _lock:
+        checked = _versions.get(key)
+    if checked is not None and now - checked[0] < max_age:
+        return checked[1]
+
+    version = fetch()
+    with _lock:
+        _versions[key] = (now, version)
+    return version
+
+
+def get_catalog(db, max_age=1.0):
+    key = _key(db.database_file_path)
+    version, _ = current_version(
+        db.database_file_path, db.catalog_version, max_age)
+
+    with _lock:
+        catalog = _catalogs.get(key)
+        generation = _generations.get(key, 0)
+    if catalog is not None and catalog.version == version:
+        return catalog
+
+    catalog = BeanCatalog(db.list_beans(), version=version)
+
+    with _lock:
+        if _generations.get(key, 0) == generation:
+            _catalogs[key] = catalog
+    return catalog
+
+
+def invalidate(database_file_path):
+    key = _key(database_file_path)
+    with _lock:
+        _catalogs.pop(key, None)
+        _versions.pop(key, None)
+        _generations[key] = _generations.get(key, 0) + 1
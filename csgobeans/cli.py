@@ -1,10 +1,17 @@
 import os
+import time
 
 import click
 import flask
 
 from . import ctx
 from . import db
+from . import export
+from . import grants
+from . import importer
+from . import migrate
+from . import shards
+from . import warmup
 
 @click.command('init')
 @flask.cli.with_appcontext
@@ -14,11 +21,308 @@ def init():
 
 def init_db(app):
     os.makedirs(app.instance_path, exist_ok=True)
-    database = db.Database(ctx.database_local_path(app))
-    click.echo('Initializing from schema')
-    database.initialize_from_schema()
-    click.echo('Populating with beans')
-    database.populate_beans_from_file()
+    database = db.Database(
+        ctx.database_local_path(app), shards=app.config['DATABASE_SHARDS'])
+    click.echo('Migrating schema')
+    database.migrate(progress=click.echo)
+    if not database.list_beans(count=1):
+        click.echo('Populating with beans')
+        database.populate_beans_from_file()
+    database.close()
+
+@click.command('migrate')
+@click.option('--target', type=int, default=migrate.LATEST_VERSION,
+              help='Schema version to migrate to.')
+@click.option('--batch-size', type=int, default=10000,
+              help='Rows copied per transaction by online index builds.')
+@click.option('--pause', type=float, default=0.01,
+              help='Seconds to sleep between batches.')
+@flask.cli.with_appcontext
+def migrate_command(target, batch_size, pause):
+    app = flask.current_app
+    os.makedirs(app.instance_path, exist_ok=True)
+    database = db.Database(
+        ctx.database_local_path(app), shards=app.config['DATABASE_SHARDS'])
+    click.echo('Schema version %d' % database.schema_version())
+    applied = database.migrate(
+        target=target,
+        progress=click.echo,
+        batch_size=batch_size,
+        pause=pause)
+    click.echo('Applied %d migrations, schema version %d' % (
+        len(applied), database.schema_version()))
+    database.close()
+
+@click.command('import-beans')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(importer.FORMATS),
+              help='File format, guessed from the extension by default.')
+@click.option('--chunk-size', type=int, default=5000,
+              help='Beans written per transaction.')
+@click.option('--restart', is_flag=True,
+              help='Ignore progress saved by an interrupted import.')
+@click.option('--rejects', type=click.File('w', encoding='utf-8'),
+              help='Write rejected lines to this file.')
+@flask.cli.with_appcontext
+def import_beans(path, file_format, chunk_size, restart, rejects):
+    database = db.Database(ctx.database_local_path(flask.current_app))
+
+    def on_progress(line_no, imported, rejected, elapsed):
+        click.echo('line %d: %d imported, %d rejected (%.0f rows/s)' % (
+            line_no, imported, rejected, (imported + rejected) / elapsed
+            if elapsed > 0 else 0))
+
+    def on_reject(rejected):
+        if rejects is not None:
+            rejects.write('%d\t%s\t%s\n' % rejected)
+        else:
+            click.echo('rejected line %d: %s' % (
+                rejected.line_no, rejected.reason), err=True)
+
+    result = importer.import_beans(
+        database,
+        path,
+        file_format,
+        chunk_size=chunk_size,
+        resume=not restart,
+        on_progress=on_progress,
+        on_reject=on_reject)
+    database.close()
+
+    if result.resumed_from:
+        click.echo('Resumed after line %d' % result.resumed_from)
+    click.echo('Imported %d beans, rejected %d lines' % (
+        result.imported, result.rejected))
+
+@click.command('grant-beans')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--campaign', required=True,
+              help='Name of the drop. Re-running a campaign never grants'
+                   ' the same line twice.')
+@click.option('--format', 'file_format', type=click.Choice(grants.FORMATS),
+              help='File format, guessed from the extension by default.')
+@click.option('--chunk-size', type=int, default=5000,
+              help='Rows written per transaction.')
+@click.option('--pause', type=float, default=0.0,
+              help='Seconds to sleep between chunks.')
+@click.option('--unknown', 'unknown_file',
+              type=click.File('w', encoding='utf-8'),
+              help='Write lines with unknown steam ids or beans to this file.')
+@flask.cli.with_appcontext
+def grant_beans(path, campaign, file_format, chunk_size, pause,
+                unknown_file):
+    app = flask.current_app
+    database = db.Database(
+        ctx.database_local_path(app), shards=app.config['DATABASE_SHARDS'])
+
+    def on_progress(line_no, granted, unknown, elapsed):
+        click.echo('line %d: %d granted, %d unknown (%.0f rows/s)' % (
+            line_no, granted, unknown, (granted + unknown) / elapsed
+            if elapsed > 0 else 0))
+
+    def on_unknown(unknown):
+        if unknown_file is not None:
+            unknown_file.write('%d\t%s\t%s\n' % unknown)
+        else:
+            click.echo('line %d: %s' % (unknown.line_no, unknown.reason),
+                       err=True)
+
+    result = grants.grant_beans(
+        database,
+        campaign,
+        path,
+        file_format,
+        chunk_size=chunk_size,
+        pause=pause,
+        on_progress=on_progress,
+        on_unknown=on_unknown)
+    database.close()
+
+    if result.resumed_from:
+        click.echo('Resumed after line %d' % result.resumed_from)
+    rows = result.granted + result.skipped + result.unknown
+    click.echo('Granted %d rows, skipped %d already granted, %d unknown'
+               ' (%.0f rows/s)' % (
+                   result.granted, result.skipped, result.unknown,
+                   rows / result.elapsed if result.elapsed > 0 else 0))
+
+@click.command('export')
+@click.argument('output', type=click.Path(file_okay=False, allow_dash=True))
+@click.option('--table', 'tables', multiple=True,
+              type=click.Choice(sorted(export.TABLES)),
+              help='Table to export, may be repeated. Defaults to all.')
+@click.option('--format', 'file_format', type=click.Choice(export.FORMATS),
+              default='jsonl')
+@click.option('--gzip/--no-gzip', 'compress', default=True)
+@click.option('--user-id', type=int, help='Only export rows of this user.')
+@click.option('--since', help='Only export trades at or after this time.')
+@click.option('--until', help='Only export trades before this time.')
+@flask.cli.with_appcontext
+def export_command(output, tables, file_format, compress, user_id, since,
+                   until):
+    tables = tables or sorted(export.TABLES)
+    if output == '-' and len(tables) != 1:
+        raise click.UsageError('Exactly one --table is needed for stdout')
+    if output != '-':
+        os.makedirs(output, exist_ok=True)
+
+    def progress(table, path, count):
+        click.echo('Exported %d rows from %s to %s' % (count, table, path),
+                   err=True)
+
+    app = flask.current_app
+    connection = export.connect_readonly(
+        ctx.database_local_path(app), app.config['DATABASE_SHARDS'])
+    export.export_tables(
+        connection,
+        tables,
+        output,
+        file_format,
+        compress,
+        progress=progress,
+        shards=app.config['DATABASE_SHARDS'],
+        user_id=user_id,
+        since=since,
+        until=until)
+    connection.close()
+
+@click.command('snapshot')
+@click.argument('destination', type=click.Path(dir_okay=False))
+@click.option('--pages', type=int, default=-1,
+              help='Pages copied per step, or -1 (the default) to copy'
+                   ' each file in one step.')
+@click.option('--sleep', type=float, default=0.01,
+              help='Seconds to sleep between steps.')
+@click.option('--max-restarts', type=int, default=10,
+              help='Give up after writes restarted a stepped copy this'
+                   ' many times.')
+@flask.cli.with_appcontext
+def snapshot(destination, pages, sleep, max_restarts):
+    app = flask.current_app
+    database_file_path = ctx.database_local_path(app)
+    count = app.config['DATABASE_SHARDS']
+    copies = [(database_file_path, destination)] + [
+        (shards.shard_path(database_file_path, index),
+         shards.shard_path(destination, index))
+        for index in range(count)]
+    for _, copy_path in copies:
+        if os.path.exists(copy_path):
+            raise click.UsageError('%s already exists' % copy_path)
+
+    def progress(status, remaining, total):
+        click.echo('Copied %d of %d pages' % (total - remaining, total))
+
+    # Shards are copied one after another, so the copies are consistent
+    # per file but not with each other.
+    for source_path, copy_path in copies:
+        connection = export.connect_readonly(source_path)
+        try:
+            export.snapshot(
+                connection, copy_path, pages=pages, sleep=sleep,
+                progress=progress, max_restarts=max_restarts)
+        except export.SnapshotError as e:
+            raise click.ClickException(str(e))
+        finally:
+            connection.close()
+        click.echo('Wrote snapshot to %s' % copy_path)
+
+@click.command('rebalance-shards')
+@click.option('--to', 'count', type=int, required=True,
+              help='Number of shards to move users to, or 0 to unshard.')
+@click.option('--batch-size', type=int, default=500,
+              help='Users moved per transaction.')
+@flask.cli.with_appcontext
+def rebalance_shards(count, batch_size):
+    """Moves users between shard files when the number of shards changes.
+
+    Stop the application first and set DATABASE_SHARDS to the new count
+    once this finishes. An interrupted run can simply be started again.
+    """
+    try:
+        shards.check_count(count)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    database_file_path = ctx.database_local_path(flask.current_app)
+    database = db.Database(database_file_path)
+    current = shards.stored_shards(database.db)
+    database.close()
+    if current is None:
+        raise click.UsageError("Run 'flask migrate' first")
+
+    database = db.Database(database_file_path, shards=max(current, count))
+    database.migrate_shards(count, progress=click.echo)
+    try:
+        moved = shards.rebalance(
+            database.db, current, count, batch_size, progress=click.echo)
+    except shards.ShardLayoutError as e:
+        database.close()
+        raise click.ClickException(str(e))
+    shards.store_shards(database.db, count)
+    database.close()
+    click.echo('Moved %d users from %d to %d shards' % (
+        moved, current, count))
+    if count < current:
+        click.echo('The files of shards %d to %d are no longer used' % (
+            count, current - 1))
+
+@click.command('shard-stats')
+@flask.cli.with_appcontext
+def shard_stats():
+    database_file_path = ctx.database_local_path(flask.current_app)
+    count = flask.current_app.config['DATABASE_SHARDS']
+    paths = shards.shard_paths(database_file_path, count) or [
+        database_file_path]
+    results = shards.fan_out(
+        paths,
+        'SELECT ' + ', '.join(
+            '(SELECT COUNT(*) FROM {})'.format(table)
+            for table in shards.SHARDED_TABLES))
+    click.echo('\t'.join(('file',) + shards.SHARDED_TABLES))
+    for path, rows in zip(paths, results):
+        click.echo('\t'.join(
+            [os.path.basename(path)] + [str(n) for n in rows[0]]))
+
+@click.command('rebuild-stats')
+@click.option('--check', is_flag=True,
+              help='Only report users whose stats have drifted.')
+@flask.cli.with_appcontext
+def rebuild_stats(check):
+    """Recomputes the leaderboard and per-user stats from inventories."""
+    app = flask.current_app
+    database = db.Database(
+        ctx.database_local_path(app), shards=app.config['DATABASE_SHARDS'])
+    drifted = database.check_stats()
+    click.echo('%d users have drifted stats' % drifted)
+    if not check:
+        database.rebuild_stats(progress=click.echo)
+        click.echo('Rebuilt stats')
+    database.close()
+    if check and drifted:
+        raise SystemExit(1)
+
+@click.command('warmup')
+@flask.cli.with_appcontext
+def warmup_command():
+    """Compiles every template into the bytecode cache and loads the bean
+    catalog, so the first requests after a deploy do not pay for either."""
+    app = flask.current_app
+    started = time.perf_counter()
+    names = warmup.compile_templates(app)
+    click.echo('Compiled %d templates in %.1fms' % (
+        len(names), (time.perf_counter() - started) * 1000))
+    started = time.perf_counter()
+    catalog = warmup.preload_catalog(app)
+    click.echo('Loaded %d beans in %.1fms' % (
+        len(catalog), (time.perf_counter() - started) * 1000))
 
 def init_cli(app):
     app.cli.add_command(init)
+    app.cli.add_command(migrate_command, 'migrate')
+    app.cli.add_command(import_beans)
+    app.cli.add_command(grant_beans)
+    app.cli.add_command(export_command, 'export')
+    app.cli.add_command(snapshot)
+    app.cli.add_command(rebalance_shards)
+    app.cli.add_command(shard_stats)
+    app.cli.add_command(rebuild_stats)
+    app.cli.add_command(warmup_command, 'warmup')
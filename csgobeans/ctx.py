@@ -1,8 +1,16 @@
+import hashlib
 import os
 
-from flask import current_app, g, session, render_template
+from flask import abort, current_app, g, request, session, render_template
 
+from .cache import InventoryCache, LRUCache
+from .catalog import current_version, get_catalog
 from .db import Database
+from .groupcommit import REQUEST, GroupCommitWriter
+from .paging import decode_cursor, paginate
+from .pool import pool_from_config
+from .shards import check_layout
+from .steam import client_from_config
 
 
 def render_template_with_context(template, **kwargs):
@@ -13,6 +21,18 @@ def render_template_with_context(template, **kwargs):
         **kwargs)
 
 
+def get_page(fetch, key):
+    try:
+        return paginate(
+            fetch,
+            key,
+            current_app.config['PAGE_SIZE'],
+            after=decode_cursor(request.args.get('after')),
+            before=decode_cursor(request.args.get('before')))
+    except ValueError:
+        abort(400)
+
+
 def logger():
     return current_app.logger
 
@@ -25,12 +45,136 @@ def database_local_path(app):
     return app_local_path(app, app.config['DATABASE_FILE'])
 
 
+def get_inventory_cache():
+    cache = current_app.extensions.get('inventory_cache')
+    if cache is None:
+        config = current_app.config
+        cache = InventoryCache(
+            app_local_path(current_app, config['INVENTORY_CACHE_DIR']),
+            ttl=config['INVENTORY_CACHE_TTL'],
+            stale_ttl=config['INVENTORY_CACHE_STALE_TTL'],
+            max_size=config['INVENTORY_CACHE_SIZE'],
+            default_backoff=config['STEAM_DEFAULT_BACKOFF'])
+        current_app.extensions['inventory_cache'] = cache
+    return cache
+
+
+def get_steam_client():
+    client = current_app.extensions.get('steam_client')
+    if client is None:
+        client = client_from_config(
+            current_app.config,
+            app_local_path(
+                current_app, current_app.config['STEAM_RATE_LIMIT_FILE']))
+        current_app.extensions['steam_client'] = client
+    return client
+
+
+def get_db_pool():
+    pool = current_app.extensions.get('db_pool')
+    if pool is None:
+        pool = pool_from_config(
+            database_local_path(current_app), current_app.config)
+        connection = pool.checkout()
+        try:
+            check_layout(connection, pool.shards)
+        finally:
+            pool.checkin(connection)
+        current_app.extensions['db_pool'] = pool
+    return pool
+
+
 def get_db():
     if 'db' not in g:
-        g.db = Database(database_local_path(current_app))
+        pool = get_db_pool()
+        g.db = Database(
+            pool.database_file_path,
+            connection=pool.checkout(),
+            release=pool.checkin,
+            shards=pool.shards)
     return g.db
 
 
+def get_db_writer():
+    """Returns the group commit writer, or None when every request
+    commits its own writes.
+    """
+    config = current_app.config
+    if config['DATABASE_DURABILITY'] == REQUEST:
+        return None
+    writer = current_app.extensions.get('db_writer')
+    if writer is None:
+        pool = get_db_pool()
+        writer = GroupCommitWriter(
+            lambda: Database(
+                pool.database_file_path,
+                connection=pool.connect(),
+                shards=pool.shards),
+            durability=config['DATABASE_DURABILITY'],
+            max_batch=config['DATABASE_GROUP_COMMIT_SIZE'],
+            max_delay=config['DATABASE_GROUP_COMMIT_DELAY'],
+            queue_size=config['DATABASE_GROUP_COMMIT_QUEUE_SIZE'],
+            timeout=config['DATABASE_POOL_TIMEOUT'])
+        current_app.extensions['db_writer'] = writer
+    return writer
+
+
+def redeem_items(user_id, redemptions):
+    writer = get_db_writer()
+    if writer is None:
+        return get_db().redeem_items(user_id, redemptions)
+    return writer.run(
+        lambda db: db.apply_redemptions(user_id, redemptions))
+
+
+def get_bean_catalog():
+    return get_catalog(
+        get_db(), current_app.config['CATALOG_VERSION_TTL'])
+
+
+def get_catalog_version():
+    return current_version(
+        database_local_path(current_app),
+        lambda: get_db().catalog_version(),
+        current_app.config['CATALOG_VERSION_TTL'])
+
+
+def get_page_cache():
+    cache = current_app.extensions.get('page_cache')
+    if cache is None:
+        cache = LRUCache(current_app.config['PAGE_CACHE_SIZE'])
+        current_app.extensions['page_cache'] = cache
+    return cache
+
+
+def cached_render(key, render):
+    """Returns the rendered HTML stored under key, rendering it on a miss."""
+    cache = get_page_cache()
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.put(key, html)
+    return html
+
+
+def url_digest():
+    return hashlib.sha1(request.full_path.encode('utf-8')).hexdigest()[:16]
+
+
+def user_etag(user_id):
+    """Returns an ETag for views of the user's data at the current URL."""
+    catalog_version, _ = get_catalog_version()
+    return 'user-%d-%d-%d-%s' % (
+        user_id,
+        get_db().user_version(user_id),
+        catalog_version,
+        url_digest())
+
+
+def has_pending_flashes():
+    return '_flashes' in session
+
+
 def teardown_db(error=None):
     db = g.pop('db', None)
     if db is not None:
@@ -1,55 +1,165 @@
+import heapq
 import os
 import sqlite3
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import beans
+from .beans import COLORS, QUALITIES, Quality
+from . import catalog
+from . import importer
+from . import migrate
+from . import paging
+from . import shards as sharding
 
-SCHEMA_FILE_PATH = os.path.join(os.path.dirname(__file__), "schema.sql")
 BEANS_FILE_PATH = os.path.join(os.path.dirname(__file__), "beans")
 
 
 class Database:
-    def initialize_from_schema(
+    def migrate(
         self,
-        schema_file_path=SCHEMA_FILE_PATH
+        target=migrate.LATEST_VERSION,
+        progress=None,
+        **options
     ):
-        with open(schema_file_path, encoding='utf-8') as schema_file:
-            schema = schema_file.read()
-            self.db.executescript(schema)
+        applied = migrate.migrate(
+            self.db, target=target, progress=progress, **options)
+        self.migrate_shards(
+            self.shards, target=target, progress=progress, **options)
+        sharding.claim_layout(self.db, self.shards)
+        # Migration 8 can only backfill the stats of users in the main
+        # file, since shard files have no catalog to join with.
+        if self.shards and any(m.name == 'user_stats' for m in applied):
+            self.rebuild_stats()
+        return applied
+
+    def migrate_shards(self, count, progress=None, **options):
+        """Creates or migrates the files of the first `count` shards."""
+        paths = sharding.shard_paths(self.database_file_path, count)
+        for index, path in enumerate(paths):
+            if progress is not None:
+                progress('Migrating shard %d' % index)
+            shard = Database(path)
+            shard.migrate(progress=progress, **options)
+            with shard.db:
+                sharding.reserve_trade_ids(shard.db, index)
+            shard.close()
+
+    def schema_version(self):
+        return migrate.schema_version(self.db)
 
     def populate_beans_from_file(
         self,
         beans_file_path=BEANS_FILE_PATH
     ):
-        with open(beans_file_path, encoding='utf-8') as beans_file:
-            bean_list = []
-            for line in beans_file.readlines():
-                split_line = line.split(';')
-                assert len(split_line) == 4
-                bean_list.append(beans.Bean(
-                    split_line[0],
-                    split_line[1],
-                    int(split_line[2]),
-                    int(split_line[3])))
-
-        self.populate_beans(bean_list)
-
-    def __init__(self, database_file_path):
-        self.db = sqlite3.connect(
-            database_file_path,
-            detect_types=sqlite3.PARSE_DECLTYPES)
+        def reject(rejected):
+            raise ValueError("Invalid bean on line {}: {}".format(
+                rejected.line_no, rejected.reason))
+
+        importer.import_beans(
+            self,
+            beans_file_path,
+            'semicolon',
+            resume=False,
+            on_reject=reject)
+
+    def __init__(
+        self,
+        database_file_path,
+        connection=None,
+        release=None,
+        shards=0
+    ):
+        """With `shards`, the rows of each user in shards.SHARDED_TABLES
+        live in one of that many shard files, which must be attached to
+        `connection` (see shards.attach).
+        """
+        sharding.check_count(shards)
+        if connection is None:
+            connection = sqlite3.connect(
+                database_file_path,
+                detect_types=sqlite3.PARSE_DECLTYPES)
+            sharding.attach(connection, database_file_path, shards)
+        self.database_file_path = database_file_path
+        self.db = connection
+        self._release = release
+        self.shards = shards
 
     def close(self):
-        self.db.close()
+        if self._release is None:
+            self.db.close()
+        elif self.db is not None:
+            self._release(self.db)
+            self.db = None
 
     def closed(self):
+        if self.db is None:
+            return True
         try:
             self.db.cursor()
         except sqlite3.ProgrammingError:
             return True
         return False
 
+    def begin(self, user_id=None):
+        """Starts a write transaction. Sharded connections defer their write
+        locks to the files that are actually written, except for the shard
+        of `user_id`, which is locked before anything is read from it.
+
+        Without `user_id` every file is locked up front: a transaction that
+        writes to a shard after reading it fails with SQLITE_BUSY_SNAPSHOT,
+        without waiting, if another connection wrote to it in between.
+        """
+        if not self.shards or user_id is None:
+            self.db.execute('BEGIN IMMEDIATE')
+            return
+        self.db.execute('BEGIN')
+        # A write that matches no rows still takes the file's write lock,
+        # and reads of it then see the latest commit.
+        self.db.execute(
+            'UPDATE {}.user_versions SET version = version WHERE 0'
+            .format(self._shard(user_id)))
+
+    def _execute(self, row_factory, query, params=()):
+        cursor = self.db.cursor()
+        cursor.row_factory = row_factory
+        return cursor.execute(query, params)
+
+    def _select_in(self, query, keys, params=(), row_factory=None):
+        """Yields the rows of `query` for every distinct key in `keys`.
+
+        The `{}` in `query` is replaced by placeholders for one chunk of keys
+        at a time, after `params`.
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        for chunk in _chunks(unique_keys, _MAX_PARAMS - len(params)):
+            yield from self._execute(
+                row_factory,
+                query.format(_placeholders(len(chunk))),
+                (*params, *chunk))
+
+    def _multi_get(self, query, keys, params=()):
+        """Maps each key to the value column of its row, or None.
+
+        `query` must select (key, value) rows.
+        """
+        found = dict(self._select_in(query, keys, params))
+        return [found.get(key) for key in keys]
+
+    def _shard(self, user_id):
+        """Returns the schema holding the per-user rows of `user_id`."""
+        if not self.shards:
+            return 'main'
+        return sharding.schema_name(
+            sharding.shard_for(user_id, self.shards))
+
+    def _union_all(self, query, params=()):
+        """Runs `query` against every shard's schema, passed as `{}`."""
+        schemas = sharding.schemas(self.shards)
+        return self.db.execute(
+            ' UNION ALL '.join(query.format(schema) for schema in schemas),
+            params * len(schemas))
+
     # - Auth
 
     # Auth Accessors
@@ -59,6 +169,11 @@ class Database:
             (user_id,)
         ).fetchone())
 
+    def usernames_from_user_ids(self, user_ids):
+        return self._multi_get(
+            'SELECT user_id, username FROM auth WHERE user_id IN ({})',
+            user_ids)
+
     def check_username_and_password(self, username, password):
         user_id_and_password_hash = self.db.execute(
             'SELECT user_id, password_hash FROM auth WHERE username = ?',
@@ -83,45 +198,119 @@ class Database:
         self.db.commit()
 
     # - Steam
+    def login_steam_user(self, steam_id):
+        """Resolves a Steam login to a user id, creating the user if needed.
+
+        Steam users have no password, so no password hash is computed or
+        checked and a new user is created in a single transaction.
+        """
+        user_id = self.user_id_from_steam_id(steam_id)
+        if user_id is not None:
+            return user_id
+
+        with self.db:
+            self.db.execute(
+                'INSERT OR IGNORE INTO auth (username, password_hash)'
+                ' VALUES (?, ?)',
+                (str(steam_id), ''))
+            user_id = self.db.execute(
+                'SELECT user_id FROM auth WHERE username = ?',
+                (str(steam_id),)
+            ).fetchone()[0]
+            self.db.execute(
+                'INSERT OR IGNORE INTO {}.steam (steam_id, user_id)'
+                ' VALUES (?, ?)'.format(self._shard(user_id)),
+                (steam_id, user_id))
+
+        return self.user_id_from_steam_id(steam_id)
+
     def associate_user_id_with_steam_id(self, user_id, steam_id):
         self.db.execute(
-            'INSERT INTO steam (steam_id, user_id) VALUES (?, ?)',
+            'INSERT INTO {}.steam (steam_id, user_id) VALUES (?, ?)'.format(
+                self._shard(user_id)),
             (steam_id, user_id))
         self.db.commit()
 
+    def user_id_from_steam_id(self, steam_id):
+        return _unwrap_single_if_not_none(self._union_all(
+            'SELECT user_id FROM {}.steam WHERE steam_id = ?',
+            (steam_id,)
+        ).fetchone())
+
     def steam_id_from_user_id(self, user_id):
         return _unwrap_single_if_not_none(self.db.execute(
-            'SELECT steam_id FROM steam WHERE user_id = ?',
+            'SELECT steam_id FROM {}.steam WHERE user_id = ?'.format(
+                self._shard(user_id)),
             (user_id,)
         ).fetchone())
 
+    def user_ids_from_steam_ids(self, steam_ids):
+        found = {}
+        for schema in sharding.schemas(self.shards):
+            found.update(self._select_in(
+                'SELECT steam_id, user_id FROM ' + schema + '.steam'
+                ' WHERE steam_id IN ({})',
+                steam_ids))
+        return [found.get(steam_id) for steam_id in steam_ids]
+
+    def steam_ids_from_user_ids(self, user_ids):
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self._shard(user_id), []).append(user_id)
+        found = {}
+        for schema, shard_user_ids in by_shard.items():
+            found.update(self._select_in(
+                'SELECT user_id, steam_id FROM ' + schema + '.steam'
+                ' WHERE user_id IN ({})',
+                shard_user_ids))
+        return [found.get(user_id) for user_id in user_ids]
+
     # - Beans
 
     # Beans Accessors
     def list_beans_from_bean_ids(self, bean_ids):
-        result = []
-
-        for bean_id in bean_ids:
-            row = self.db.execute(
-                'SELECT bean_name, short_desc, color, quality'
-                ' FROM beans WHERE bean_id = ?',
-                (bean_id,)
-            ).fetchone()
-            if row is None:
-                result.append(None)
-            else:
-                result.append(beans.Bean(*row))
-
-        return result
+        found = dict(self._select_in(
+            'SELECT bean_id, bean_name, short_desc, color, quality'
+            ' FROM beans WHERE bean_id IN ({})',
+            bean_ids,
+            row_factory=_bean_row))
+        return [found.get(bean_id) for bean_id in bean_ids]
+
+    def bean_ids_from_names(self, bean_names):
+        return self._multi_get(
+            'SELECT bean_name, bean_id FROM beans WHERE bean_name IN ({})',
+            bean_names)
+
+    def catalog_version(self):
+        """Returns (version, modified), bumped by every write to beans."""
+        row = self.db.execute(
+            'SELECT version, modified FROM catalog_version WHERE id = 1'
+        ).fetchone()
+        return tuple(row)
 
-    def list_beans(self, start=-1, count=-1):
-        return [
-            (row[0], beans.Bean(row[1], row[2], row[3], row[4]))
-            for row in self.db.execute(
-                'SELECT * FROM beans ORDER BY bean_name LIMIT ? OFFSET ?',
-                (count, start)
-            ).fetchall()
-        ]
+    def list_beans(
+        self,
+        start=-1,
+        count=-1,
+        after=None,
+        before=None,
+        raw=False
+    ):
+        """Lists (bean_id, Bean) rows, or plain column tuples if raw."""
+        columns = ('bean_name',)
+        condition, params, descending = paging.keyset_clause(
+            columns, after, before)
+        rows = self._execute(
+            None if raw else _bean_row,
+            'SELECT bean_id, bean_name, short_desc, color, quality'
+            ' FROM beans'
+            ' WHERE {}'
+            ' ORDER BY {}'
+            ' LIMIT ? OFFSET ?'.format(
+                condition, _order_by(columns, descending)),
+            (*params, count, start)
+        ).fetchall()
+        return _ascending(rows, descending)
 
     # Beans Mutators
     def populate_beans(self, beans):
@@ -130,80 +319,539 @@ class Database:
             ' VALUES (?, ?, ?, ?)',
             [_bean_to_tuple(bean) for bean in beans])
         self.db.commit()
+        catalog.invalidate(self.database_file_path)
+
+    def upsert_beans(self, beans):
+        with self.db:
+            self.db.executemany(_UPSERT_BEAN_SQL, map(_bean_to_tuple, beans))
+        catalog.invalidate(self.database_file_path)
+
+    def bean_import_progress(self, source, fingerprint):
+        """Returns (line_no, imported, rejected) of an unfinished import."""
+        row = self.db.execute(
+            'SELECT line_no, imported, rejected FROM bean_imports'
+            ' WHERE source = ? AND fingerprint = ?',
+            (source, fingerprint)
+        ).fetchone()
+        return None if row is None else tuple(row)
+
+    def import_bean_chunk(
+        self,
+        source,
+        fingerprint,
+        line_no,
+        imported,
+        rejected,
+        beans
+    ):
+        with self.db:
+            self.db.executemany(_UPSERT_BEAN_SQL, map(_bean_to_tuple, beans))
+            self.db.execute(
+                'INSERT OR REPLACE INTO bean_imports'
+                ' (source, fingerprint, line_no, imported, rejected)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (source, fingerprint, line_no, imported, rejected))
+        catalog.invalidate(self.database_file_path)
+
+    def finish_bean_import(self, source):
+        with self.db:
+            self.db.execute(
+                'DELETE FROM bean_imports WHERE source = ?', (source,))
 
     # - Inventory
 
     # Inventory Accesors
-    def list_inventory_from_user_id(self, user_id, start=-1, count=-1):
-        return [
-            (row[0], row[1], beans.Bean(row[2], row[3], row[4], row[5]))
-            for row in self.db.execute(
-                'SELECT'
-                ' inventory.bean_id, qty, bean_name,'
-                ' short_desc, color, quality'
-                ' FROM inventory'
-                ' JOIN beans ON inventory.bean_id = beans.bean_id'
-                ' WHERE user_id = ?'
-                ' ORDER BY bean_name'
-                ' LIMIT ? OFFSET ?',
-                (user_id, count, start)
-            ).fetchall()
-        ]
+    def list_inventory_from_user_id(
+        self,
+        user_id,
+        start=-1,
+        count=-1,
+        after=None,
+        before=None,
+        raw=False
+    ):
+        """Lists (bean_id, qty, Bean) rows, or plain column tuples if raw."""
+        columns = ('bean_name',)
+        condition, params, descending = paging.keyset_clause(
+            columns, after, before)
+        rows = self._execute(
+            None if raw else _inventory_row,
+            'SELECT'
+            ' inventory.bean_id, qty, bean_name,'
+            ' short_desc, color, quality'
+            ' FROM {}.inventory AS inventory'
+            ' JOIN main.beans AS beans ON inventory.bean_id = beans.bean_id'
+            ' WHERE user_id = ? AND {}'
+            ' ORDER BY {}'
+            ' LIMIT ? OFFSET ?'.format(
+                self._shard(user_id),
+                condition,
+                _order_by(columns, descending)),
+            (user_id, *params, count, start)
+        ).fetchall()
+        return _ascending(rows, descending)
+
+    def user_version(self, user_id):
+        """Returns a number that changes whenever the user's inventory or
+        trade history does.
+        """
+        row = self.db.execute(
+            'SELECT version FROM {}.user_versions WHERE user_id = ?'.format(
+                self._shard(user_id)),
+            (user_id,)
+        ).fetchone()
+        return 0 if row is None else row[0]
 
     # Inventory Mutators
     def give_user_id_beans(self, user_id, beans):
-        cursor = self.db.cursor()
+        schema = self._shard(user_id)
+        beans = list(beans)
+        with self.db:
+            self.begin(user_id)
+            self._count_beans(schema, user_id, beans)
+            self.db.executemany(
+                _GIVE_BEAN_SQL.format(schema),
+                [(user_id, bean_id, qty) for bean_id, qty in beans])
+            self.db.execute(_BUMP_USER_VERSION_SQL.format(schema), (user_id,))
+
+    def _count_beans(self, schema, user_id, beans):
+        """Adds (bean_id, qty) pairs to the user's stats. Must run before
+        adding them to the inventory, in the same transaction, which must
+        already hold the write lock on the user's shard (see begin).
+        """
+        bean_ids = [bean_id for bean_id, _ in beans]
+        owned = set(row[0] for row in self._select_in(
+            'SELECT bean_id FROM ' + schema + '.inventory'
+            ' WHERE user_id = ? AND bean_id IN ({})',
+            bean_ids,
+            (user_id,)))
+        kinds = dict((row[0], row[1:]) for row in self._select_in(
+            'SELECT bean_id, quality, color FROM main.beans'
+            ' WHERE bean_id IN ({})',
+            bean_ids))
+
+        total = mythic = 0
+        breakdown = {}
         for bean_id, qty in beans:
-            self.__give_user_id_bean(cursor, user_id, bean_id, qty)
-        cursor.close()
-        self.db.commit()
+            total += qty
+            kind = kinds.get(bean_id)
+            if kind is None:
+                continue
+            quality, color = kind
+            if quality == Quality.MYTHIC.value:
+                mythic += qty
+            for key in (('quality', quality), ('color', color)):
+                breakdown[key] = breakdown.get(key, 0) + qty
+        new = len(set(bean_ids) - owned)
 
-    def __give_user_id_bean(self, cursor, user_id, bean_id, qty):
-        prev_qty = _unwrap_single_if_not_none(cursor.execute(
-            'SELECT qty FROM inventory WHERE user_id = ? AND bean_id = ?',
-            (user_id, bean_id)
-        ).fetchone())
-        if prev_qty is None:
-            cursor.execute(
-                'INSERT INTO inventory (user_id, bean_id, qty)'
-                ' VALUES (?, ?, ?)',
-                (user_id, bean_id, qty))
-        else:
-            cursor.execute(
-                'UPDATE inventory SET qty = ?'
-                ' WHERE user_id = ? AND bean_id = ?',
-                (prev_qty + qty, user_id, bean_id))
+        self.db.execute(
+            'INSERT INTO {}.user_stats'
+            ' (user_id, total, mythic, distinct_beans) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (user_id) DO UPDATE SET'
+            ' total = total + excluded.total,'
+            ' mythic = mythic + excluded.mythic,'
+            ' distinct_beans = distinct_beans + excluded.distinct_beans'
+            .format(schema),
+            (user_id, total, mythic, new))
+        self.db.executemany(
+            'INSERT INTO {}.user_breakdowns (user_id, dimension, value, qty)'
+            ' VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (user_id, dimension, value) DO UPDATE SET'
+            ' qty = qty + excluded.qty'.format(schema),
+            [(user_id, dimension, value, qty)
+             for (dimension, value), qty in breakdown.items()])
+
+    # - Stats
+
+    # Stats Accessors
+    def user_stats(self, user_id):
+        """Returns (total, mythic, distinct_beans) of the user."""
+        row = self.db.execute(
+            'SELECT total, mythic, distinct_beans FROM {}.user_stats'
+            ' WHERE user_id = ?'.format(self._shard(user_id)),
+            (user_id,)
+        ).fetchone()
+        return (0, 0, 0) if row is None else tuple(row)
+
+    def user_breakdown(self, user_id):
+        """Returns the user's bean counts as {Quality: qty} and
+        {Color: qty}.
+        """
+        qualities = {}
+        colors = {}
+        for dimension, value, qty in self.db.execute(
+            'SELECT dimension, value, qty FROM {}.user_breakdowns'
+            ' WHERE user_id = ? ORDER BY dimension, value'.format(
+                self._shard(user_id)),
+            (user_id,)
+        ):
+            if dimension == 'quality':
+                qualities[QUALITIES[value]] = qty
+            else:
+                colors[COLORS[value]] = qty
+        return qualities, colors
+
+    def top_collectors(self, stat, count):
+        """Lists the (user_id, total, mythic, distinct_beans) rows of the
+        `count` users with the most `stat`, reading `count` rows per shard.
+        """
+        if stat not in STATS:
+            raise ValueError("Unknown stat '%s'" % stat)
+        index = STATS.index(stat) + 1
+        per_shard = [
+            [tuple(row) for row in self.db.execute(
+                'SELECT user_id, total, mythic, distinct_beans'
+                ' FROM {}.user_stats'
+                ' ORDER BY {} DESC, user_id LIMIT ?'.format(schema, stat),
+                (count,))]
+            for schema in sharding.schemas(self.shards)]
+        return list(heapq.merge(
+            *per_shard, key=lambda row: (-row[index], row[0])))[:count]
+
+    def check_stats(self):
+        """Counts the users whose stats differ from their inventory."""
+        drifted = 0
+        for schema in sharding.schemas(self.shards):
+            differences = []
+            for stored, computed in (
+                (_STORED_STATS_SQL, _COMPUTED_STATS_SQL),
+                (_STORED_BREAKDOWNS_SQL, _COMPUTED_BREAKDOWNS_SQL),
+            ):
+                # Compound selects bind left to right, so each side is
+                # wrapped before taking the differences.
+                stored = 'SELECT * FROM ({})'.format(stored.format(schema))
+                computed = 'SELECT * FROM ({})'.format(
+                    computed.format(schema))
+                differences.append(
+                    'SELECT user_id FROM ({} EXCEPT {})'.format(
+                        stored, computed))
+                differences.append(
+                    'SELECT user_id FROM ({} EXCEPT {})'.format(
+                        computed, stored))
+            drifted += self.db.execute(
+                'SELECT COUNT(*) FROM ({})'.format(' UNION '.join(differences))
+            ).fetchone()[0]
+        return drifted
+
+    # Stats Mutators
+    def rebuild_stats(self, progress=None):
+        """Recomputes every user's stats from their inventory, one shard
+        per transaction.
+        """
+        for schema in sharding.schemas(self.shards):
+            with self.db:
+                self.db.execute('DELETE FROM {}.user_stats'.format(schema))
+                self.db.execute(
+                    'INSERT INTO {0}.user_stats'
+                    ' (user_id, total, mythic, distinct_beans) '.format(
+                        schema)
+                    + _COMPUTED_STATS_SQL.format(schema))
+                self.db.execute(
+                    'DELETE FROM {}.user_breakdowns'.format(schema))
+                self.db.execute(
+                    'INSERT INTO {0}.user_breakdowns'
+                    ' (user_id, dimension, value, qty) '.format(schema)
+                    + _COMPUTED_BREAKDOWNS_SQL.format(schema))
+            if progress is not None:
+                progress('Rebuilt stats in %s' % schema)
+
+    # - Grants
+
+    # Grant Accessors
+    def grant_progress(self, campaign):
+        """Returns the last line of the campaign's file that every shard
+        has committed, or 0.
+        """
+        return min(
+            self._grant_line(schema, campaign)
+            for schema in sharding.schemas(self.shards))
+
+    def _grant_line(self, schema, campaign):
+        row = self.db.execute(
+            'SELECT line_no FROM {}.bean_grants WHERE campaign = ?'.format(
+                schema),
+            (campaign,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    # Grant Mutators
+    def grant_beans_chunk(self, campaign, line_no, grants):
+        """Adds beans to many users' inventories, one transaction per
+        shard, and records `line_no` as the campaign's progress.
+
+        `grants` is a sequence of (line_no, user_id, bean_id, qty). Grants
+        at or before the line a shard has already recorded for the
+        campaign are skipped, so a chunk can safely be applied again.
+        Returns the number of grants applied.
+        """
+        by_schema = {schema: [] for schema in sharding.schemas(self.shards)}
+        for grant in grants:
+            by_schema[self._shard(grant[1])].append(grant)
+
+        self.db.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS grant_chunk ('
+            ' user_id INTEGER NOT NULL,'
+            ' bean_id INTEGER NOT NULL,'
+            ' qty INTEGER NOT NULL,'
+            ' PRIMARY KEY (user_id, bean_id))')
+        applied = 0
+        for schema, schema_grants in by_schema.items():
+            done = self._grant_line(schema, campaign)
+            totals = {}
+            for grant_line, user_id, bean_id, qty in schema_grants:
+                if grant_line > done:
+                    key = (user_id, bean_id)
+                    totals[key] = totals.get(key, 0) + qty
+                    applied += 1
+            with self.db:
+                if totals:
+                    self._apply_grant_chunk(schema, totals)
+                self.db.execute(
+                    'INSERT INTO {}.bean_grants (campaign, line_no, granted)'
+                    ' VALUES (?, ?, ?)'
+                    ' ON CONFLICT (campaign) DO UPDATE SET'
+                    ' line_no = MAX(line_no, excluded.line_no),'
+                    ' granted = granted + excluded.granted'.format(schema),
+                    (campaign, line_no, sum(totals.values())))
+        return applied
+
+    def _apply_grant_chunk(self, schema, totals):
+        # The chunk is staged in a temporary table so that stats, inventory
+        # and versions are each updated with one set-based statement.
+        self.db.execute('DELETE FROM temp.grant_chunk')
+        self.db.executemany(
+            'INSERT INTO temp.grant_chunk (user_id, bean_id, qty)'
+            ' VALUES (?, ?, ?)',
+            [(user_id, bean_id, qty)
+             for (user_id, bean_id), qty in totals.items()])
+        for statement in _GRANT_CHUNK_SQL:
+            self.db.execute(statement.format(schema))
+        self.db.execute('DELETE FROM temp.grant_chunk')
 
     # - Trades
 
     # Trade Accessors
-    def list_trades_from_user_id(self, user_id, start=-1, count=-1):
-        return [
-            tuple(row)
-            for row in self.db.execute(
-                'SELECT'
-                ' trade_id, item, trade_timestamp'
-                ' FROM trades'
-                ' WHERE user_id = ?'
-                ' ORDER BY trade_timestamp'
-                ' LIMIT ? OFFSET ?',
-                (user_id, count, start)
-            ).fetchall()
-        ]
+    def list_trades_from_user_id(
+        self,
+        user_id,
+        start=-1,
+        count=-1,
+        after=None,
+        before=None
+    ):
+        columns = ('trade_timestamp', 'trade_id')
+        condition, params, descending = paging.keyset_clause(
+            columns, after, before)
+        rows = self.db.execute(
+            'SELECT'
+            ' trade_id, item, trade_timestamp'
+            ' FROM {}.trades'
+            ' WHERE user_id = ? AND {}'
+            ' ORDER BY {}'
+            ' LIMIT ? OFFSET ?'.format(
+                self._shard(user_id),
+                condition,
+                _order_by(columns, descending)),
+            (user_id, *params, count, start)
+        ).fetchall()
+        return [tuple(row) for row in _ascending(rows, descending)]
 
     def already_traded(self, user_id, item):
         traded = self.db.execute(
-            'SELECT trade_id FROM trades WHERE user_id = ? AND item = ?',
+            'SELECT trade_id FROM {}.trades WHERE user_id = ? AND item = ?'
+            .format(self._shard(user_id)),
             (user_id, item)
         ).fetchone()
         return traded is not None
 
+    def already_traded_many(self, user_id, items):
+        traded = set(row[0] for row in self._select_in(
+            'SELECT item FROM ' + self._shard(user_id) + '.trades'
+            ' WHERE user_id = ? AND item IN ({})',
+            items,
+            (user_id,)))
+        return [item in traded for item in items]
+
     # Trade Mutators
     def record_trade(self, user_id, item):
-        self.db.execute(
-            'INSERT INTO trades (user_id, item) VALUES (?, ?)',
-            (user_id, item))
-        self.db.commit()
+        schema = self._shard(user_id)
+        with self.db:
+            self.db.execute(
+                _INSERT_TRADE_SQL.format(schema), (user_id, item))
+            self.db.execute(_BUMP_USER_VERSION_SQL.format(schema), (user_id,))
+
+    def redeem_items(self, user_id, redemptions):
+        """Trades many items for beans in a single transaction.
+
+        See apply_redemptions for the arguments and result.
+        """
+        with self.db:
+            # Lock every shard before checking for traded items, so that a
+            # concurrent redemption of the same item by any user waits for
+            # this one to commit.
+            self.begin()
+            return self.apply_redemptions(user_id, redemptions)
+
+    def apply_redemptions(self, user_id, redemptions):
+        """Trades many items for beans without committing, so the caller
+        decides when the transaction ends.
+
+        `redemptions` is a sequence of (item, bean_id, qty). Returns a list
+        with one bool per redemption, False where the item has already been
+        traded (or appears earlier in the same batch).
+
+        Items are only unique across shards if the transaction holds the
+        write lock of every shard, as begin() without a user id does.
+        """
+        items = [item for item, _, _ in redemptions]
+        traded = set(
+            row[0]
+            for schema in sharding.schemas(self.shards)
+            for row in self._select_in(
+                'SELECT item FROM ' + schema + '.trades WHERE item IN ({})',
+                items))
+
+        results = []
+        accepted = []
+        for item, bean_id, qty in redemptions:
+            redeemed = item not in traded
+            traded.add(item)
+            results.append(redeemed)
+            if redeemed:
+                accepted.append((item, bean_id, qty))
+
+        if accepted:
+            schema = self._shard(user_id)
+            gained = [(bean_id, qty) for _, bean_id, qty in accepted]
+            self._count_beans(schema, user_id, gained)
+            self.db.executemany(
+                _INSERT_TRADE_SQL.format(schema),
+                [(user_id, item) for item, _, _ in accepted])
+            self.db.executemany(
+                _GIVE_BEAN_SQL.format(schema),
+                [(user_id, bean_id, qty) for bean_id, qty in gained])
+            self.db.execute(
+                _BUMP_USER_VERSION_SQL.format(schema), (user_id,))
+
+        return results
+
+
+# Columns of user_stats that users can be ranked by.
+STATS = ('total', 'mythic', 'distinct_beans')
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER on every SQLite build.
+_MAX_PARAMS = 500
+
+_UPSERT_BEAN_SQL = (
+    'INSERT INTO beans (bean_name, short_desc, color, quality)'
+    ' VALUES (?, ?, ?, ?)'
+    ' ON CONFLICT (bean_name) DO UPDATE SET'
+    ' short_desc = excluded.short_desc,'
+    ' color = excluded.color,'
+    ' quality = excluded.quality')
+
+# The per-user statements below take the schema of the user's shard.
+# Without a sequence row SQLite picks the id, as it does for the first
+# trade of an unsharded database.
+_INSERT_TRADE_SQL = (
+    'INSERT INTO {0}.trades (trade_id, user_id, item) VALUES ('
+    "(SELECT seq + 1 FROM {0}.sqlite_sequence WHERE name = 'trades'), ?, ?)"
+)
+
+_GIVE_BEAN_SQL = (
+    'INSERT INTO {}.inventory (user_id, bean_id, qty) VALUES (?, ?, ?)'
+    ' ON CONFLICT (user_id, bean_id) DO UPDATE SET qty = qty + excluded.qty')
+
+_BUMP_USER_VERSION_SQL = (
+    'INSERT INTO {}.user_versions (user_id, version) VALUES (?, 1)'
+    ' ON CONFLICT (user_id) DO UPDATE SET version = version + 1')
+
+
+# Applies temp.grant_chunk to one schema. Stats go first, since new
+# distinct beans are those not in the inventory yet. The WHERE clauses
+# keep SQLite from reading ON CONFLICT as a join constraint.
+_GRANT_CHUNK_SQL = (
+    'INSERT INTO {0}.user_stats (user_id, total, mythic, distinct_beans)'
+    ' SELECT grants.user_id, SUM(grants.qty),'
+    ' SUM(CASE WHEN quality = %d THEN grants.qty ELSE 0 END),'
+    ' SUM(inventory.user_id IS NULL)'
+    ' FROM temp.grant_chunk AS grants'
+    ' LEFT JOIN main.beans AS beans ON grants.bean_id = beans.bean_id'
+    ' LEFT JOIN {0}.inventory AS inventory'
+    ' ON grants.user_id = inventory.user_id'
+    ' AND grants.bean_id = inventory.bean_id'
+    ' WHERE true GROUP BY grants.user_id'
+    ' ON CONFLICT (user_id) DO UPDATE SET'
+    ' total = total + excluded.total,'
+    ' mythic = mythic + excluded.mythic,'
+    ' distinct_beans = distinct_beans + excluded.distinct_beans'
+    % Quality.MYTHIC.value,
+) + tuple(
+    'INSERT INTO {{0}}.user_breakdowns (user_id, dimension, value, qty)'
+    ' SELECT grants.user_id, \'{0}\', {0}, SUM(grants.qty)'
+    ' FROM temp.grant_chunk AS grants'
+    ' JOIN main.beans AS beans ON grants.bean_id = beans.bean_id'
+    ' WHERE true GROUP BY grants.user_id, {0}'
+    ' ON CONFLICT (user_id, dimension, value) DO UPDATE SET'
+    ' qty = qty + excluded.qty'.format(column)
+    for column in ('quality', 'color')
+) + (
+    'INSERT INTO {0}.inventory (user_id, bean_id, qty)'
+    ' SELECT user_id, bean_id, qty FROM temp.grant_chunk WHERE true'
+    ' ON CONFLICT (user_id, bean_id) DO UPDATE SET qty = qty + excluded.qty',
+    'INSERT INTO {0}.user_versions (user_id, version)'
+    ' SELECT DISTINCT user_id, 1 FROM temp.grant_chunk WHERE true'
+    ' ON CONFLICT (user_id) DO UPDATE SET version = version + 1',
+)
+
+# The stats stored in, and computed from the inventory of, one schema.
+_STORED_STATS_SQL = (
+    'SELECT user_id, total, mythic, distinct_beans FROM {}.user_stats')
+_COMPUTED_STATS_SQL = (
+    'SELECT inventory.user_id, SUM(qty),'
+    ' SUM(CASE WHEN quality = %d THEN qty ELSE 0 END), COUNT(*)'
+    ' FROM {0}.inventory AS inventory'
+    ' LEFT JOIN main.beans AS beans ON inventory.bean_id = beans.bean_id'
+    ' GROUP BY inventory.user_id' % Quality.MYTHIC.value)
+_STORED_BREAKDOWNS_SQL = (
+    'SELECT user_id, dimension, value, qty FROM {}.user_breakdowns')
+_COMPUTED_BREAKDOWNS_SQL = ' UNION ALL '.join(
+    'SELECT inventory.user_id, \'{0}\', {0}, SUM(qty)'
+    ' FROM {{0}}.inventory AS inventory'
+    ' JOIN main.beans AS beans ON inventory.bean_id = beans.bean_id'
+    ' GROUP BY inventory.user_id, {0}'.format(column)
+    for column in ('quality', 'color'))
+
+
+def _chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _placeholders(count):
+    return ', '.join('?' * count)
+
+
+def _bean_row(cursor, row):
+    return (row[0], beans.bean_from_columns(row[1], row[2], row[3], row[4]))
+
+
+def _inventory_row(cursor, row):
+    return (
+        row[0],
+        row[1],
+        beans.bean_from_columns(row[2], row[3], row[4], row[5]))
+
+
+def _order_by(columns, descending):
+    direction = ' DESC' if descending else ''
+    return ', '.join(column + direction for column in columns)
+
+
+def _ascending(rows, descending):
+    if descending:
+        rows.reverse()
+    return rows
 
 
 def _unwrap_single_if_not_none(single):
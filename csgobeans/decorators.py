@@ -20,7 +20,7 @@ def redirect_on_err(redirect):
 def login_required(f):
     def decorator():
         if ctx.get_user_id() is None:
-            flask_warning("Login required")
+            flash_warning("Login required")
             return flask.redirect(flask.url_for('index'))
         return f()
     decorator.__name__ = f.__name__
@@ -0,0 +1,233 @@
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from . import shards as sharding
+
+FORMATS = ('jsonl', 'csv')
+
+TABLES = {
+    'auth': ('user_id', 'username', 'password_hash'),
+    'steam': ('steam_id', 'user_id'),
+    'inventory': ('user_id', 'bean_id', 'qty'),
+    'trades': ('trade_id', 'user_id', 'item', 'trade_timestamp'),
+}
+ORDER_BY = {
+    'auth': 'user_id',
+    'steam': 'steam_id',
+    'inventory': 'user_id, bean_id',
+    'trades': 'trade_id',
+}
+TIME_COLUMNS = {
+    'trades': 'trade_timestamp',
+}
+
+
+def connect_readonly(database_file_path, shards=0):
+    connection = sqlite3.connect(
+        sharding.readonly_uri(database_file_path),
+        uri=True,
+        check_same_thread=False)
+    sharding.attach(connection, database_file_path, shards, readonly=True)
+    return connection
+
+
+def table_schemas(table, shards=0, user_id=None):
+    """Returns the schemas to read `table` from, in export order."""
+    if not shards or table not in sharding.SHARDED_TABLES:
+        return ['main']
+    if user_id is not None:
+        return [sharding.schema_name(sharding.shard_for(user_id, shards))]
+    return sharding.schemas(shards)
+
+
+def iter_rows(
+    connection,
+    table,
+    user_id=None,
+    since=None,
+    until=None,
+    batch_size=1000,
+    schema='main'
+):
+    """Yields the rows of `table` with constant memory."""
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append('user_id = ?')
+        params.append(user_id)
+    time_column = TIME_COLUMNS.get(table)
+    if time_column is not None and since is not None:
+        conditions.append('{} >= ?'.format(time_column))
+        params.append(since)
+    if time_column is not None and until is not None:
+        conditions.append('{} < ?'.format(time_column))
+        params.append(until)
+
+    cursor = connection.cursor()
+    cursor.arraysize = batch_size
+    cursor.execute(
+        'SELECT {} FROM {}.{} WHERE {} ORDER BY {}'.format(
+            ', '.join(TABLES[table]),
+            schema,
+            table,
+            ' AND '.join(conditions) or '1',
+            ORDER_BY[table]),
+        params)
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield from rows
+    cursor.close()
+
+
+def write_jsonl(out, columns, rows):
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row)), separators=(',', ':')))
+        out.write('\n')
+        count += 1
+    return count
+
+
+def write_csv(out, columns, rows):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+}
+
+
+def output_path(directory, table, file_format, compress):
+    if directory == '-':
+        return '-'
+    name = '{}.{}'.format(table, file_format)
+    if compress:
+        name += '.gz'
+    return os.path.join(directory, name)
+
+
+@contextlib.contextmanager
+def open_output(path, compress):
+    if path != '-':
+        opener = gzip.open if compress else open
+        with opener(path, 'wt', encoding='utf-8', newline='') as out:
+            yield out
+        return
+
+    # Never close stdout itself, only what is layered on top of it.
+    stream = sys.stdout.buffer
+    compressor = None
+    if compress:
+        compressor = gzip.GzipFile(fileobj=stream, mode='wb')
+    out = io.TextIOWrapper(
+        compressor or stream, encoding='utf-8', newline='')
+    try:
+        yield out
+    finally:
+        out.flush()
+        out.detach()
+        if compressor is not None:
+            compressor.close()
+        stream.flush()
+
+
+def export_tables(
+    connection,
+    tables,
+    directory,
+    file_format='jsonl',
+    compress=True,
+    progress=None,
+    shards=0,
+    **filters
+):
+    """Writes each table to its own file from one consistent read snapshot.
+
+    Sharded tables are written one shard after another, each ordered on its
+    own. The snapshot of each shard is taken when it is first read, so it
+    is only consistent per file. Returns a dict of table name to exported
+    row count.
+    """
+    counts = {}
+    connection.execute('BEGIN')
+    try:
+        for table in tables:
+            path = output_path(directory, table, file_format, compress)
+            with open_output(path, compress) as out:
+                schemas = table_schemas(
+                    table, shards, filters.get('user_id'))
+                counts[table] = WRITERS[file_format](
+                    out,
+                    TABLES[table],
+                    (row
+                     for schema in schemas
+                     for row in iter_rows(
+                         connection, table, schema=schema, **filters)))
+            if progress is not None:
+                progress(table, path, counts[table])
+    finally:
+        connection.rollback()
+    return counts
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def snapshot(
+    connection,
+    destination_path,
+    pages=-1,
+    sleep=0.01,
+    progress=None,
+    max_restarts=10
+):
+    """Copies the database with the online backup API.
+
+    By default the whole database is copied in one step, under a single
+    read transaction, which in WAL mode does not block writers. With
+    `pages`, the source is only read-locked while each batch of pages is
+    copied, but SQLite restarts the copy whenever another connection
+    writes to the source between steps, so SnapshotError is raised after
+    `max_restarts` restarts. The partial copy is removed on failure.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def step(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # Every step copies at least one page unless the copy restarted.
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise SnapshotError(
+                    "The copy restarted %d times because the database kept"
+                    " changing, copy it in one step instead" % restarts)
+        last_remaining = remaining
+        if progress is not None:
+            progress(status, remaining, total)
+
+    destination = sqlite3.connect(destination_path)
+    try:
+        connection.backup(
+            destination, pages=pages, progress=step, sleep=sleep)
+    except BaseException:
+        destination.close()
+        os.remove(destination_path)
+        raise
+    destination.close()
@@ -0,0 +1,160 @@
+import collections
+import csv
+import json
+import os
+import time
+
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ('steam_id', 'bean_name', 'qty')
+
+Unknown = collections.namedtuple('Unknown', ['line_no', 'line', 'reason'])
+GrantResult = collections.namedtuple(
+    'GrantResult',
+    ['lines', 'granted', 'skipped', 'unknown', 'resumed_from', 'elapsed'])
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_csv(lines):
+    reader = csv.reader(lines)
+    for fields in reader:
+        if reader.line_num == 1 and tuple(fields) == FIELDS:
+            continue
+        if fields:
+            yield reader.line_num, ','.join(fields), fields
+
+
+def read_jsonl(lines):
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, line, None
+            continue
+        if not isinstance(record, dict):
+            yield line_no, line, None
+            continue
+        yield line_no, line, [record.get(field) for field in FIELDS]
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def parse_grant(fields):
+    if fields is None or len(fields) != 3:
+        raise ValueError("expected 3 fields")
+    steam_id, bean_name, qty = fields
+    try:
+        steam_id = int(steam_id)
+    except (TypeError, ValueError):
+        raise ValueError("invalid steam id %r" % (steam_id,))
+    if not isinstance(bean_name, str) or not bean_name:
+        raise ValueError("missing bean name")
+    try:
+        qty = int(qty)
+    except (TypeError, ValueError):
+        raise ValueError("invalid quantity %r" % (qty,))
+    if qty <= 0:
+        raise ValueError("invalid quantity %r" % (qty,))
+    return steam_id, bean_name, qty
+
+
+def grant_beans(
+    db,
+    campaign,
+    path,
+    file_format=None,
+    chunk_size=5000,
+    pause=0.0,
+    on_progress=None,
+    on_unknown=None
+):
+    """Streams a file of (steam_id, bean_name, qty) rows into inventories.
+
+    Steam ids and bean names are resolved in bulk once per chunk, and each
+    chunk is written in one short transaction per shard with a `pause`
+    between chunks, so live trades only ever wait for one chunk. The
+    campaign name is the idempotency key: every run of the same campaign
+    resumes after the last committed line, and rows already granted are
+    never granted twice. The file must not change between runs.
+    """
+    if file_format is None:
+        file_format = detect_format(path)
+
+    resumed_from = db.grant_progress(campaign)
+    granted = skipped = unknown = 0
+    bean_ids = {}
+    last_line = flushed = resumed_from
+    started = time.perf_counter()
+    chunk = []
+
+    def reject(line_no, line, reason):
+        nonlocal unknown
+        unknown += 1
+        if on_unknown is not None:
+            on_unknown(Unknown(line_no, line, reason))
+
+    def flush():
+        nonlocal granted, skipped, flushed
+        if last_line == flushed:
+            return
+        missing = list(set(
+            bean_name for _, _, _, bean_name, _ in chunk
+            if bean_name not in bean_ids))
+        bean_ids.update(zip(missing, db.bean_ids_from_names(missing)))
+        user_ids = db.user_ids_from_steam_ids(
+            [steam_id for _, _, steam_id, _, _ in chunk])
+
+        grants = []
+        for (line_no, line, steam_id, bean_name, qty), user_id in zip(
+            chunk, user_ids
+        ):
+            bean_id = bean_ids[bean_name]
+            if user_id is None:
+                reject(line_no, line, "unknown steam id %d" % steam_id)
+            elif bean_id is None:
+                reject(line_no, line, "unknown bean %r" % bean_name)
+            else:
+                grants.append((line_no, user_id, bean_id, qty))
+
+        applied = db.grant_beans_chunk(campaign, last_line, grants)
+        granted += applied
+        skipped += len(grants) - applied
+        chunk.clear()
+        flushed = last_line
+        if on_progress is not None:
+            on_progress(last_line, granted, unknown,
+                        time.perf_counter() - started)
+
+    with open(path, encoding='utf-8', newline='') as lines:
+        for line_no, line, fields in READERS[file_format](lines):
+            if line_no <= resumed_from:
+                continue
+            last_line = line_no
+            try:
+                steam_id, bean_name, qty = parse_grant(fields)
+            except ValueError as error:
+                reject(line_no, line, str(error))
+                continue
+            chunk.append((line_no, line, steam_id, bean_name, qty))
+            if len(chunk) >= chunk_size:
+                flush()
+                if pause:
+                    time.sleep(pause)
+        flush()
+
+    return GrantResult(
+        last_line, granted, skipped, unknown, resumed_from,
+        time.perf_counter() - started)
@@ -0,0 +1,210 @@
+import atexit
+import collections
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+
+from . import metrics
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Every request commits its own transaction.
+REQUEST = 'request'
+# Requests wait until the shared transaction holding their write commits.
+GROUP = 'group'
+# Requests wait until their write is applied but not until it is committed,
+# so a crash can lose the writes of the last batch after they were
+# acknowledged.
+ASYNC = 'async'
+DURABILITY_MODES = (REQUEST, GROUP, ASYNC)
+
+
+class WriteQueueFull(RuntimeError):
+    pass
+
+
+class GroupCommitWriter:
+    """Applies writes from many threads in shared transactions on one
+    dedicated connection, so that concurrent requests share one commit.
+
+    Each write is a function of a Database that runs inside its own
+    savepoint, so a write that fails is rolled back without affecting the
+    rest of its batch. A batch is committed once `max_batch` writes are
+    applied or `max_delay` seconds after its first write, whichever comes
+    first. A batch locks every shard before its first write, since writes
+    read other users' shards.
+
+    Writes still queued when the process exits are committed first, so
+    that a graceful shutdown does not lose acknowledged async writes.
+    """
+
+    def __init__(
+        self,
+        connect,
+        durability=GROUP,
+        max_batch=64,
+        max_delay=0.002,
+        queue_size=1024,
+        timeout=5.0
+    ):
+        if durability not in (GROUP, ASYNC):
+            raise ValueError("Invalid durability mode '%s'" % durability)
+        self.connect = connect
+        self.durability = durability
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        # The writer thread does not survive a fork, so a child starts its
+        # own with a connection of its own.
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._work,
+                args=(self._queue,),
+                name='group-commit',
+                daemon=True)
+            self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        for name in ('submitted', 'batches', 'committed', 'failed'):
+            stats.setdefault(name, 0)
+        stats['queued'] = self._queue.qsize()
+        stats['queue_size'] = self.queue_size
+        return stats
+
+    def submit(self, write):
+        """Queues write(db) and returns a Future of its result."""
+        self._start()
+        future = concurrent.futures.Future()
+        try:
+            self._queue.put((write, future), timeout=self.timeout)
+        except queue.Full:
+            raise WriteQueueFull(
+                "Write queue still full after %s seconds" % self.timeout)
+        self._count('submitted')
+        return future
+
+    def run(self, write):
+        """Queues write(db) and waits for its result."""
+        return self.submit(write).result()
+
+    def _work(self, pending):
+        db = None
+        try:
+            while True:
+                batch, stop = self._collect(pending)
+                if batch:
+                    try:
+                        if db is None:
+                            db = self.connect()
+                    except Exception as e:
+                        LOGGER.exception("Failed to open the writer database")
+                        self._fail(batch, e)
+                    else:
+                        self._apply(db, batch)
+                if stop:
+                    return
+        finally:
+            if db is not None:
+                db.close()
+
+    def _collect(self, pending):
+        write = pending.get()
+        if write is None:
+            return [], True
+        batch = [write]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                write = pending.get(
+                    timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if write is None:
+                return batch, True
+            batch.append(write)
+        return batch, False
+
+    def _apply(self, db, batch):
+        connection = db.db
+        applied = []
+        succeeded = 0
+        try:
+            db.begin()
+            for write, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                connection.execute('SAVEPOINT write')
+                try:
+                    result = write(db)
+                except Exception as e:
+                    connection.execute('ROLLBACK TO write')
+                    connection.execute('RELEASE write')
+                    self._count('failed')
+                    future.set_exception(e)
+                    continue
+                connection.execute('RELEASE write')
+                succeeded += 1
+                if self.durability == ASYNC:
+                    future.set_result(result)
+                else:
+                    applied.append((future, result))
+            connection.commit()
+        except BaseException as e:
+            connection.rollback()
+            LOGGER.exception("Failed to commit a batch of %d writes",
+                             len(batch))
+            self._fail(batch, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        self._count('batches')
+        self._count('committed', succeeded)
+        metrics.WRITE_BATCH_SIZE.observe(len(batch))
+        for future, result in applied:
+            future.set_result(result)
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            if future.done():
+                continue
+            if future.running() or future.set_running_or_notify_cancel():
+                self._count('failed')
+                future.set_exception(error)
+
+    def close(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # The thread and its queue belong to the parent.
+                self._reset()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
@@ -0,0 +1,171 @@
+import collections
+import csv
+import json
+import os
+import time
+
+from . import beans
+
+
+FORMATS = ('semicolon', 'csv', 'jsonl')
+FIELDS = ('bean_name', 'short_desc', 'color', 'quality')
+
+Rejected = collections.namedtuple('Rejected', ['line_no', 'line', 'reason'])
+ImportResult = collections.namedtuple(
+    'ImportResult', ['lines', 'imported', 'rejected', 'resumed_from'])
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return 'semicolon'
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return '%d:%d' % (stat.st_size, stat.st_mtime_ns)
+
+
+def read_semicolon(lines):
+    for line_no, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line:
+            yield line_no, line, line.split(';')
+
+
+def read_csv(lines):
+    reader = csv.reader(lines)
+    for fields in reader:
+        if reader.line_num == 1 and tuple(fields) == FIELDS:
+            continue
+        if fields:
+            yield reader.line_num, ','.join(fields), fields
+
+
+def read_jsonl(lines):
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, line, None
+            continue
+        if not isinstance(record, dict):
+            yield line_no, line, None
+            continue
+        yield line_no, line, [
+            record.get('bean_name', record.get('name')),
+            record.get('short_desc'),
+            record.get('color'),
+            record.get('quality'),
+        ]
+
+
+READERS = {
+    'semicolon': read_semicolon,
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def _enum_value(enum_type, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            value = int(value)
+        else:
+            return enum_type[value.upper()]
+    return enum_type(value)
+
+
+def parse_bean(fields):
+    if fields is None or len(fields) != 4:
+        raise ValueError("expected 4 fields")
+    name, short_desc, color, quality = fields
+    if not isinstance(name, str) or not name:
+        raise ValueError("missing bean name")
+    if not isinstance(short_desc, str):
+        raise ValueError("missing description")
+    try:
+        color = _enum_value(beans.Color, color)
+    except (KeyError, ValueError):
+        raise ValueError("invalid color %r" % (color,))
+    try:
+        quality = _enum_value(beans.Quality, quality)
+    except (KeyError, ValueError):
+        raise ValueError("invalid quality %r" % (quality,))
+    return beans.Bean(name, short_desc, color, quality)
+
+
+def iter_beans(lines, file_format, skip_lines=0):
+    """Yields (line_no, Bean or Rejected) for every record after skip_lines."""
+    for line_no, line, fields in READERS[file_format](lines):
+        if line_no <= skip_lines:
+            continue
+        try:
+            yield line_no, parse_bean(fields)
+        except ValueError as error:
+            yield line_no, Rejected(line_no, line, str(error))
+
+
+def import_beans(
+    db,
+    path,
+    file_format=None,
+    chunk_size=5000,
+    resume=True,
+    on_progress=None,
+    on_reject=None
+):
+    """Streams a catalog file into the beans table with upsert semantics.
+
+    Beans are written in transactions of `chunk_size` rows, and each one
+    also records how far into the file it got. An interrupted import
+    therefore continues after the last committed chunk when run again with
+    `resume`, as long as the file has not changed.
+    """
+    if file_format is None:
+        file_format = detect_format(path)
+    source = os.path.realpath(path)
+    file_fingerprint = fingerprint(path)
+
+    progress = None
+    if resume:
+        progress = db.bean_import_progress(source, file_fingerprint)
+    if progress is None:
+        progress = (0, 0, 0)
+    resumed_from, imported, rejected = progress
+    last_line = resumed_from
+
+    started = time.perf_counter()
+    chunk = []
+
+    def flush():
+        db.import_bean_chunk(
+            source, file_fingerprint, last_line, imported, rejected, chunk)
+        chunk.clear()
+        if on_progress is not None:
+            on_progress(last_line, imported, rejected,
+                        time.perf_counter() - started)
+
+    with open(path, encoding='utf-8', newline='') as lines:
+        for line_no, bean in iter_beans(lines, file_format, resumed_from):
+            last_line = line_no
+            if isinstance(bean, Rejected):
+                rejected += 1
+                if on_reject is not None:
+                    on_reject(bean)
+            else:
+                imported += 1
+                chunk.append(bean)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+
+    db.finish_bean_import(source)
+    return ImportResult(last_line, imported, rejected, resumed_from)
@@ -1,65 +1,253 @@
+import codecs
+import functools
+import math
 import random
-import requests
+import time
 
 import flask
 
 from . import ctx
 from . import db
+from . import jsonstream
+from . import prefetch
+from . import steam
 from .decorators import redirect_on_err
 from .decorators import login_required
 from .flash import *
 
 
-CSGO_INVENTORY_URL =\
-    "https://steamcommunity.com/profiles/%s/inventory/json/730/2"
+def _description_key(item):
+    classid = item.get("classid", None)
+    assert classid is not None
+    instanceid = item.get("instanceid", None)
+    assert instanceid is not None
+    return classid + "_" + instanceid
 
 
-def load_csgo_inventory(steam_id):
-    response = requests.get(CSGO_INVENTORY_URL % steam_id)
+def parse_csgo_inventory(chunks):
+    """Extracts the items of one inventory response from its text chunks.
 
-    if response.status_code == 429:
-        return ([], True, response.headers.get("Retry-After", -1))
+    Handles both the legacy format (rgInventory and rgDescriptions) and the
+    paginated one (assets and descriptions). Only each item's id and
+    description key, and the market name of each description, are kept.
+    Returns (items, more_items, last_assetid).
+    """
+    stream = jsonstream.JSONStream(chunks)
+    assets = []
+    names = {}
+    success = None
+    more_items = False
+    last_assetid = None
+
+    for key in stream.iter_object():
+        if key == "rgInventory":
+            for _ in stream.iter_object():
+                item = stream.value()
+                id = item.get("id", None)
+                assert id is not None
+                assets.append((id, _description_key(item)))
+        elif key == "assets":
+            for _ in stream.iter_array():
+                item = stream.value()
+                id = item.get("assetid", None)
+                assert id is not None
+                assets.append((id, _description_key(item)))
+        elif key == "rgDescriptions":
+            for desc_key in stream.iter_object():
+                names[desc_key] = stream.value().get("market_name", None)
+        elif key == "descriptions":
+            for _ in stream.iter_array():
+                description = stream.value()
+                names[_description_key(description)] = \
+                    description.get("market_name", None)
+        elif key == "success":
+            success = stream.value()
+        elif key == "more_items":
+            more_items = bool(stream.value())
+        elif key == "last_assetid":
+            last_assetid = stream.value()
+        else:
+            stream.skip()
 
-    response_json = response.json()
-    success = response_json.get("success", None)
     assert success is not None and success
-    inventory = response_json.get("rgInventory", None)
-    assert inventory is not None
-    descriptions = response_json.get("rgDescriptions", None)
-    assert descriptions is not None
-    assert len(inventory) == len(descriptions)
-
-    def extract(item):
-        id = item.get("id", None)
-        assert id is not None
-        classid = item.get("classid", None)
-        assert classid is not None
-        instanceid = item.get("instanceid", None)
-        assert instanceid is not None
-        desc_key = classid + "_" + instanceid
-        name = descriptions[desc_key].get("market_name", None)
+
+    def extract(asset):
+        id, desc_key = asset
+        name = names.get(desc_key, None)
         assert name is not None
         return (id, name)
 
-    return (list(map(extract, inventory.values())), False, 0)
+    return (list(map(extract, assets)), more_items, last_assetid)
+
+
+def _iter_text(response, chunk_size=64 * 1024):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in response.iter_content(chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def _request_inventory(client, steam_id, page_size, start_assetid=None):
+    if not page_size:
+        return client.get(steam.CSGO_INVENTORY_PATH % steam_id, stream=True)
+    params = {"l": "english", "count": page_size}
+    if start_assetid is not None:
+        params["start_assetid"] = start_assetid
+    return client.get(
+        steam.CSGO_INVENTORY_PAGED_PATH % steam_id,
+        params=params,
+        stream=True)
+
+
+def load_csgo_inventory(steam_id, client, page_size=0, max_pages=100):
+    """Returns (items, too_many, retry_after) for a Steam inventory.
+
+    `items` is a list of (id, market_name). With a `page_size`, the
+    paginated endpoint is used and every page is fetched before returning,
+    so a 429 on any page is returned as too_many. Paging stops after
+    `max_pages` pages, or when Steam says there are more items without
+    moving its cursor forward.
+
+    Only a 429 from Steam is returned as too_many. SteamRateLimited from our
+    own rate limiter propagates, so the inventory cache does not back off
+    from this steam id for it.
+    """
+    items = []
+    last_assetid = None
+    for _ in range(max_pages if page_size else 1):
+        response = _request_inventory(
+            client, steam_id, page_size, last_assetid)
+        if response.status_code == 429:
+            response.close()
+            return ([], True, response.headers.get("Retry-After", -1))
+
+        try:
+            page, more_items, cursor = \
+                parse_csgo_inventory(_iter_text(response))
+        finally:
+            response.close()
+        if last_assetid is not None and cursor == last_assetid:
+            # Steam served the previous page again.
+            break
+        items.extend(page)
+        if not more_items or cursor is None:
+            break
+        last_assetid = cursor
+    return (items, False, 0)
+
 
+def cached_load_csgo_inventory(steam_id):
+    loader = functools.partial(
+        load_csgo_inventory,
+        client=ctx.get_steam_client(),
+        page_size=flask.current_app.config['STEAM_INVENTORY_PAGE_SIZE'],
+        max_pages=flask.current_app.config['STEAM_INVENTORY_MAX_PAGES'])
+    try:
+        return ctx.get_inventory_cache().get(steam_id, loader)
+    except steam.SteamRateLimited as error:
+        # Raised when our rate limiter refuses a request.
+        return ([], True, max(1, math.ceil(error.retry_after)))
 
-def pick_random_bean_and_qty(beans):
-    bean_id, bean = random.choice(beans)
+
+def get_inventory_prefetcher():
+    prefetcher = flask.current_app.extensions.get('inventory_prefetcher')
+    if prefetcher is None:
+        app = flask.current_app._get_current_object()
+        config = app.config
+
+        def fetch(steam_id):
+            with app.app_context():
+                return cached_load_csgo_inventory(steam_id)
+
+        prefetcher = prefetch.InventoryPrefetcher(
+            fetch,
+            workers=config['INVENTORY_PREFETCH_WORKERS'],
+            queue_size=config['INVENTORY_PREFETCH_QUEUE_SIZE'],
+            deadline=config['INVENTORY_PREFETCH_DEADLINE'],
+            max_slots=config['INVENTORY_CACHE_SIZE'])
+        app.extensions['inventory_prefetcher'] = prefetcher
+    return prefetcher
+
+
+def prefetched_inventory_slot(steam_id):
+    """Returns the user's prefetch slot, queueing a fetch when there is
+    none or it is out of date. Returns None if the inventory has to be
+    loaded in the request instead.
+    """
+    prefetcher = get_inventory_prefetcher()
+    slot = prefetcher.status(steam_id)
+    ttl = flask.current_app.config['INVENTORY_CACHE_TTL']
+    if (
+        slot is None
+        or slot.state in (prefetch.FAILED, prefetch.EXPIRED)
+        or (slot.state == prefetch.READY
+            and time.monotonic() - slot.updated_at > ttl)
+    ):
+        if prefetcher.submit(steam_id):
+            slot = prefetcher.status(steam_id)
+    if slot is None or slot.state == prefetch.EXPIRED:
+        return None
+    if slot.state == prefetch.FAILED and slot.items is None:
+        return None
+    return slot
+
+
+def pick_random_bean_and_qty(catalog):
+    bean_id, bean = catalog.sample()
     qty = random.randint(1, 9)
     return (bean_id, bean, qty)
 
 
+def pick_random_beans_and_qtys(catalog, count):
+    return [
+        (bean_id, bean, random.randint(1, 9))
+        for bean_id, bean in catalog.sample_many(count)
+    ]
+
+
+def wants_json():
+    best = flask.request.accept_mimetypes.best_match(
+        ['text/html', 'application/json'])
+    return best == 'application/json'
+
+
+def render_user_page(render):
+    """Serves a page that only changes with the user's version.
+
+    The ETag is checked after one primary key lookup, so revalidating
+    costs neither the listing queries nor the template. Rendered pages are
+    cached per (user, version, URL) for repeat views.
+    """
+    if ctx.has_pending_flashes():
+        return render()
+
+    etag = ctx.user_etag(ctx.get_user_id())
+    if flask.request.if_none_match.contains(etag):
+        response = flask.Response(status=304)
+    else:
+        response = flask.make_response(
+            ctx.cached_render(('user', etag), render))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 def create_blueprint():
     bp = flask.Blueprint('inventory', __name__)
 
     @bp.route("/beans")
     @login_required
     def beans():
-        db = ctx.get_db()
-        user_id = ctx.get_user_id()
-        beans = db.list_inventory_from_user_id(user_id)
-        return ctx.render_template_with_context("beans.html", beans=beans)
+        def render():
+            db = ctx.get_db()
+            user_id = ctx.get_user_id()
+            page = ctx.get_page(
+                functools.partial(db.list_inventory_from_user_id, user_id),
+                lambda row: (row[2].name,))
+            return ctx.render_template_with_context(
+                "beans.html", beans=page.items, page=page)
+        return render_user_page(render)
 
     @bp.route("/trade", methods=['GET', 'POST'])
     @login_required
@@ -67,7 +255,17 @@ def create_blueprint():
     def trade():
         if flask.request.method == 'GET':
             steam_id = ctx.get_username()
-            inventory, too_many, retry_after = load_csgo_inventory(steam_id)
+            slot = prefetched_inventory_slot(steam_id)
+            if slot is None:
+                inventory, too_many, retry_after = \
+                    cached_load_csgo_inventory(steam_id)
+            elif slot.items is None:
+                return ctx.render_template_with_context(
+                    "trade.html", pending=True)
+            else:
+                inventory = slot.items
+                too_many = slot.too_many
+                retry_after = slot.retry_after
             return ctx.render_template_with_context(
                 "trade.html",
                 csgo_inventory=inventory,
@@ -89,27 +287,102 @@ def create_blueprint():
             except:
                 raise FlashError("Invalid Item Name")
 
-            user_id = ctx.get_user_id()
-            db = ctx.get_db()
-            if db.already_traded(user_id, item_id):
+            catalog = ctx.get_bean_catalog()
+            bean_id, bean, qty = pick_random_bean_and_qty(catalog)
+            redeemed, = ctx.redeem_items(
+                ctx.get_user_id(), [(item_id, bean_id, qty)])
+            if not redeemed:
                 raise FlashError("Already traded")
 
-            beans = db.list_beans()
-            bean_id, bean, qty = pick_random_bean_and_qty(beans)
-            db.give_user_id_beans(user_id, [(bean_id, qty)])
-            db.record_trade(user_id, item_id)
-
             flash_success(
                 "Congratulations! You traded {} for {} {}".format(
                 item_name, qty, bean))
 
             return flask.redirect(flask.url_for("inventory.trade"))
 
+    @bp.route("/trade/status")
+    @login_required
+    def trade_status():
+        slot = prefetched_inventory_slot(ctx.get_username())
+        if slot is None:
+            return flask.jsonify(state="unavailable")
+        return flask.jsonify(
+            state=slot.state,
+            items=0 if slot.items is None else len(slot.items),
+            too_many=slot.too_many,
+            retry_after=slot.retry_after)
+
+    @bp.route("/trade/batch", methods=['POST'])
+    @login_required
+    @redirect_on_err("inventory.trade")
+    def trade_batch():
+        form = flask.request.form
+        item_ids = form.getlist("item_id")
+        item_names = form.getlist("item_name")
+
+        if not item_ids:
+            raise FlashError("No items selected")
+        if len(item_ids) != len(item_names):
+            raise FlashError("Invalid Item Name")
+
+        drops = pick_random_beans_and_qtys(
+            ctx.get_bean_catalog(), len(item_ids))
+        redemptions = [
+            (item_id, bean_id, qty)
+            for item_id, (bean_id, _, qty) in zip(item_ids, drops)
+        ]
+        # Large inventories are redeemed TRADE_BATCH_LIMIT items per
+        # transaction, so no single transaction holds the write lock long.
+        limit = flask.current_app.config['TRADE_BATCH_LIMIT']
+        redeemed = []
+        for i in range(0, len(redemptions), limit):
+            redeemed.extend(ctx.redeem_items(
+                ctx.get_user_id(), redemptions[i:i + limit]))
+
+        results = []
+        for item_id, item_name, (bean_id, bean, qty), success in zip(
+            item_ids, item_names, drops, redeemed
+        ):
+            result = {
+                "item_id": item_id,
+                "item_name": item_name,
+                "status": "traded" if success else "duplicate",
+            }
+            if success:
+                result.update({
+                    "bean_id": bean_id,
+                    "bean": bean.name,
+                    "qty": qty,
+                })
+            results.append(result)
+
+        if wants_json():
+            return flask.jsonify(results=results)
+
+        traded = [result for result in results if result["status"] == "traded"]
+        if traded:
+            flash_success("Congratulations! You traded {} items for {}".format(
+                len(traded),
+                ", ".join(
+                    "{} {}".format(result["qty"], result["bean"])
+                    for result in traded)))
+        if len(traded) < len(results):
+            flash_warning("{} items were already traded".format(
+                len(results) - len(traded)))
+
+        return flask.redirect(flask.url_for("inventory.trade"))
+
     @bp.route("/history")
     @login_required
     def history():
-        db = ctx.get_db()
-        trades = db.list_trades_from_user_id(ctx.get_user_id())
-        return ctx.render_template_with_context("history.html", trades=trades)
+        def render():
+            db = ctx.get_db()
+            page = ctx.get_page(
+                functools.partial(
+                    db.list_trades_from_user_id, ctx.get_user_id()),
+                lambda row: (str(row[2]), row[0]))
+            return ctx.render_template_with_context(
+                "history.html", trades=page.items, page=page)
+        return render_user_page(render)
 
     return bp
@@ -0,0 +1,125 @@
+import json
+
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+class JSONStream:
+    """Reads a JSON document from an iterable of text chunks.
+
+    Containers can be walked member by member with `iter_object` and
+    `iter_array`, so only the values the caller asks for with `value` are
+    ever decoded and held in memory at once.
+    """
+
+    def __init__(self, chunks, compact_at=64 * 1024):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._compact_at = compact_at
+
+    def _fill(self):
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                break
+        else:
+            self._eof = True
+            return False
+        if self._pos >= self._compact_at:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += chunk
+        return True
+
+    def _peek(self):
+        while True:
+            buffer = self._buffer
+            pos = self._pos
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(
+                "Expected one of %r at offset %d, got %r"
+                % (chars, self._pos, char))
+        self._pos += 1
+        return char
+
+    def _fill_past_number(self):
+        # A number is only complete once something that cannot be part of
+        # it follows, since "-1" may continue as "-1.5e3" in the next chunk.
+        offset = 0
+        while True:
+            buffer = self._buffer
+            pos = self._pos + offset
+            while pos < len(buffer) and buffer[pos] in NUMBER_CHARS:
+                pos += 1
+            offset = pos - self._pos
+            if pos < len(buffer) or not self._fill():
+                return
+
+    def value(self):
+        """Decodes and returns the next complete value."""
+        if self._peek() in NUMBER_CHARS:
+            self._fill_past_number()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self._pos = end
+            return value
+
+    def iter_object(self):
+        """Yields the keys of the next object. The caller must consume each
+        member's value before asking for the next key.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def iter_array(self):
+        """Yields once per element of the next array. The caller must consume
+        each element before continuing.
+        """
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            if self._expect(',]') == ']':
+                return
+
+    def skip(self):
+        """Skips the next value, walking containers to keep memory flat."""
+        char = self._peek()
+        if char == '{':
+            for _ in self.iter_object():
+                self.skip()
+        elif char == '[':
+            for _ in self.iter_array():
+                self.skip()
+        else:
+            self.value()
@@ -0,0 +1,51 @@
+import flask
+
+from . import ctx
+from . import db
+from .decorators import login_required
+from .inventory import render_user_page
+
+
+STAT_LABELS = {
+    'total': 'Beans',
+    'mythic': 'Mythic beans',
+    'distinct_beans': 'Distinct beans',
+}
+
+
+def create_blueprint():
+    bp = flask.Blueprint('leaderboard', __name__)
+
+    @bp.route("/leaderboard")
+    def leaderboard():
+        stat = flask.request.args.get('by', 'total')
+        if stat not in db.STATS:
+            flask.abort(400)
+        database = ctx.get_db()
+        rows = database.top_collectors(
+            stat, flask.current_app.config['LEADERBOARD_SIZE'])
+        usernames = database.usernames_from_user_ids(
+            [row[0] for row in rows])
+        return ctx.render_template_with_context(
+            "leaderboard.html",
+            stat=stat,
+            stats=db.STATS,
+            labels=STAT_LABELS,
+            collectors=zip(usernames, rows))
+
+    @bp.route("/stats")
+    @login_required
+    def stats():
+        def render():
+            database = ctx.get_db()
+            user_id = ctx.get_user_id()
+            qualities, colors = database.user_breakdown(user_id)
+            return ctx.render_template_with_context(
+                "stats.html",
+                stats=dict(zip(db.STATS, database.user_stats(user_id))),
+                labels=STAT_LABELS,
+                qualities=qualities,
+                colors=colors)
+        return render_user_page(render)
+
+    return bp
@@ -0,0 +1,361 @@
+import bisect
+import contextvars
+import math
+import re
+import sqlite3
+import threading
+import time
+
+import flask
+
+
+# Request latencies in seconds.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value)
+                     .replace('\\', '\\\\')
+                     .replace('"', '\\"')
+                     .replace('\n', '\\n'))
+        for name, value in pairs)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '%s%s %s' % (
+                self.name,
+                _format_labels(self.labelnames, labels),
+                _format_value(value))
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count in +Inf, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def series(self):
+        with self._lock:
+            return list(self._values)
+
+    def count(self, *labels):
+        counts = self._values.get(labels)
+        return 0 if counts is None else sum(counts[:-1])
+
+    def sum(self, *labels):
+        counts = self._values.get(labels)
+        return 0 if counts is None else counts[-1]
+
+    def lines(self):
+        with self._lock:
+            values = sorted(
+                (labels, list(counts))
+                for labels, counts in self._values.items())
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield '%s_bucket%s %d' % (
+                    self.name,
+                    _format_labels(
+                        self.labelnames, labels,
+                        [('le', _format_value(bound))]),
+                    cumulative)
+            label_text = _format_labels(self.labelnames, labels)
+            yield '%s_sum%s %s' % (
+                self.name, label_text, _format_value(counts[-1]))
+            yield '%s_count%s %d' % (self.name, label_text, cumulative)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'csgobeans_request_seconds',
+    'Time spent handling requests.',
+    ('endpoint', 'method', 'status')))
+REQUEST_SQL_STATEMENTS = REGISTRY.register(Histogram(
+    'csgobeans_request_sql_statements',
+    'SQL statements executed per request.',
+    ('endpoint',),
+    COUNT_BUCKETS))
+REQUEST_SQL_SECONDS = REGISTRY.register(Histogram(
+    'csgobeans_request_sql_seconds',
+    'Time spent executing SQL and in fetch calls per request.',
+    ('endpoint',)))
+SQL_STATEMENTS = REGISTRY.register(Counter(
+    'csgobeans_sql_statements_total',
+    'SQL statements executed on pooled connections.'))
+SQL_SECONDS = REGISTRY.register(Counter(
+    'csgobeans_sql_seconds_total',
+    'Time spent executing SQL and in fetch calls on pooled connections.'))
+SQL_COMMITS = REGISTRY.register(Counter(
+    'csgobeans_sql_commits_total',
+    'Transactions committed on pooled connections.'))
+DB_CHECKOUTS = REGISTRY.register(Counter(
+    'csgobeans_db_checkouts_total',
+    'Connections checked out of the pool.'))
+DB_CHECKOUT_SECONDS = REGISTRY.register(Histogram(
+    'csgobeans_db_checkout_seconds',
+    'Time spent waiting for a pooled connection.'))
+STEAM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'csgobeans_steam_request_seconds',
+    'Latency of HTTP requests to Steam, per attempt.',
+    ('method', 'path', 'status')))
+STEAM_RATE_LIMITED = REGISTRY.register(Counter(
+    'csgobeans_steam_rate_limited_total',
+    'Steam calls refused because the shared rate budget was spent.'))
+CACHE_STATS = REGISTRY.register(Gauge(
+    'csgobeans_inventory_cache',
+    'Inventory cache counters and size, per process.',
+    ('stat',)))
+PREFETCH_STATS = REGISTRY.register(Gauge(
+    'csgobeans_inventory_prefetch',
+    'Inventory prefetch counters and queue depth, per process.',
+    ('stat',)))
+WRITE_BATCH_SIZE = REGISTRY.register(Histogram(
+    'csgobeans_write_batch_size',
+    'Writes committed together by the group commit writer.',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+WRITER_STATS = REGISTRY.register(Gauge(
+    'csgobeans_group_commit',
+    'Group commit writer counters and queue depth, per process.',
+    ('stat',)))
+DB_POOL_STATS = REGISTRY.register(Gauge(
+    'csgobeans_db_pool_connections',
+    'Open pooled connections.',
+    ('state',)))
+
+
+# - SQL
+
+# SQL statements and time of the request handled in the current context,
+# or None outside of requests.
+_request_sql = contextvars.ContextVar('request_sql', default=None)
+
+
+def _record_sql_seconds(started):
+    elapsed = time.perf_counter() - started
+    SQL_SECONDS.inc(elapsed)
+    stats = _request_sql.get()
+    if stats is not None:
+        stats[1] += elapsed
+
+
+def _record_sql(started):
+    _record_sql_seconds(started)
+    SQL_STATEMENTS.inc()
+    stats = _request_sql.get()
+    if stats is not None:
+        stats[0] += 1
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times its statements and their fetch calls.
+
+    Iterating over the cursor is not timed, since doing so for every row
+    would cost more than the rows themselves.
+    """
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _record_sql(started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _record_sql(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_sql_seconds(started)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            _record_sql_seconds(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_sql_seconds(started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection factory that counts statements, their time and commits."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        if self.in_transaction:
+            SQL_COMMITS.inc()
+        super().commit()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.in_transaction:
+            SQL_COMMITS.inc()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+# - Steam
+
+_ID_PATTERN = re.compile(r'\d+')
+
+
+def observe_steam_request(method, path, status, seconds):
+    # Ids are folded so that each profile does not get its own series.
+    STEAM_REQUEST_SECONDS.observe(
+        seconds, method, _ID_PATTERN.sub(':id', path), str(status))
+
+
+# - Requests
+
+def _begin_request():
+    flask.g.metrics_started = time.perf_counter()
+    flask.g.metrics_sql = [0, 0.0]
+    _request_sql.set(flask.g.metrics_sql)
+
+
+def _end_request(response):
+    started = flask.g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = flask.request.endpoint or 'none'
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint,
+        flask.request.method,
+        str(response.status_code))
+    statements, seconds = flask.g.pop('metrics_sql')
+    REQUEST_SQL_STATEMENTS.observe(statements, endpoint)
+    REQUEST_SQL_SECONDS.observe(seconds, endpoint)
+    _request_sql.set(None)
+    return response
+
+
+def _collect_app_stats(app):
+    extensions = app.extensions
+    if 'inventory_cache' in extensions:
+        for name, value in extensions['inventory_cache'].stats().items():
+            CACHE_STATS.set(value, name)
+    if 'inventory_prefetcher' in extensions:
+        for name, value in extensions['inventory_prefetcher'].stats().items():
+            PREFETCH_STATS.set(value, name)
+    if 'db_writer' in extensions:
+        for name, value in extensions['db_writer'].stats().items():
+            WRITER_STATS.set(value, name)
+    if 'db_pool' in extensions:
+        pool = extensions['db_pool']
+        DB_POOL_STATS.set(pool.size - pool.idle, 'busy')
+        DB_POOL_STATS.set(pool.idle, 'idle')
+
+
+def create_blueprint():
+    bp = flask.Blueprint('metrics', __name__)
+    bp.before_app_request(_begin_request)
+    bp.after_app_request(_end_request)
+
+    @bp.route("/metrics")
+    def metrics():
+        _collect_app_stats(flask.current_app)
+        return flask.Response(
+            REGISTRY.render(),
+            mimetype='text/plain; version=0.0.4')
+
+    return bp
@@ -0,0 +1,278 @@
+import collections
+import os
+import re
+import time
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+Migration = collections.namedtuple('Migration', ['version', 'name', 'apply'])
+
+
+def sql_script(file_name):
+    """A migration that runs a script from MIGRATIONS_DIR in a transaction."""
+    def apply(connection, version, options):
+        path = os.path.join(MIGRATIONS_DIR, file_name)
+        with open(path, encoding='utf-8') as script_file:
+            script = script_file.read()
+        try:
+            connection.executescript(
+                'BEGIN IMMEDIATE;\n{}\nPRAGMA user_version = {};\nCOMMIT;'
+                .format(script, int(version)))
+        except BaseException:
+            _rollback(connection)
+            raise
+    return apply
+
+
+def online_index(table, index_name, columns):
+    """A migration that builds an index without locking `table` for long."""
+    def apply(connection, version, options):
+        build_index_online(
+            connection,
+            table,
+            index_name,
+            columns,
+            version=version,
+            **options)
+    return apply
+
+
+MIGRATIONS = [
+    Migration(1, 'initial', sql_script('0001_initial.sql')),
+    Migration(2, 'steam_user_id', online_index(
+        'steam', 'steam_user_id', ('user_id',))),
+    Migration(3, 'trades_user_id_trade_timestamp', online_index(
+        'trades',
+        'trades_user_id_trade_timestamp',
+        ('user_id', 'trade_timestamp', 'trade_id'))),
+    Migration(4, 'bean_imports', sql_script('0004_bean_imports.sql')),
+    Migration(5, 'catalog_version', sql_script('0005_catalog_version.sql')),
+    Migration(6, 'user_versions', sql_script('0006_user_versions.sql')),
+    Migration(7, 'shard_layout', sql_script('0007_shard_layout.sql')),
+    Migration(8, 'user_stats', sql_script('0008_user_stats.sql')),
+    Migration(9, 'bean_grants', sql_script('0009_bean_grants.sql')),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connection, target=LATEST_VERSION, progress=None, **options):
+    """Applies every migration newer than the database, up to `target`.
+
+    Each migration sets `PRAGMA user_version` in its final transaction, so
+    an interrupted run resumes at the first migration that did not finish.
+    """
+    current = schema_version(connection)
+    if current > LATEST_VERSION:
+        raise MigrationError(
+            "Database schema version %d is newer than this code (%d)"
+            % (current, LATEST_VERSION))
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= current or migration.version > target:
+            continue
+        if progress is not None:
+            progress("Applying migration %04d_%s" % (
+                migration.version, migration.name))
+        migration.apply(connection, migration.version, dict(
+            options, progress=progress))
+        applied.append(migration)
+    return applied
+
+
+def build_index_online(
+    connection,
+    table,
+    index_name,
+    columns,
+    version=None,
+    batch_size=10000,
+    pause=0.01,
+    progress=None
+):
+    """Creates `index_name` on `table` in bounded write transactions.
+
+    SQLite's CREATE INDEX holds the write lock until the whole index is
+    built. For tables larger than one batch we instead build the index on
+    an empty shadow copy of the table, mirror concurrent writes into it with
+    triggers, copy existing rows over in rowid batches with a pause between
+    them, then swap the shadow in under one short transaction.
+    """
+    try:
+        _build_index_online(
+            connection, table, index_name, columns, version, batch_size,
+            pause, progress)
+    except BaseException:
+        _rollback(connection)
+        raise
+
+
+def _build_index_online(
+    connection,
+    table,
+    index_name,
+    columns,
+    version,
+    batch_size,
+    pause,
+    progress
+):
+    create_index = 'CREATE INDEX {} ON {{}} ({})'.format(
+        index_name, ', '.join(columns))
+    set_version = (
+        'PRAGMA user_version = {}'.format(int(version))
+        if version is not None else None)
+
+    def finish(cursor):
+        if set_version is not None:
+            cursor.execute(set_version)
+        connection.commit()
+
+    cursor = connection.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    if _index_exists(cursor, index_name):
+        return finish(cursor)
+
+    row_count = cursor.execute(
+        'SELECT count(*) FROM {}'.format(table)).fetchone()[0]
+    if row_count <= batch_size:
+        cursor.execute(create_index.format(table))
+        return finish(cursor)
+
+    other_indexes = cursor.execute(
+        'SELECT name FROM sqlite_master'
+        " WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    if other_indexes:
+        raise MigrationError(
+            "Cannot build %s online: %s already has indexes %s" % (
+                index_name, table, [name for name, in other_indexes]))
+
+    shadow = table + '_migrating'
+    table_columns = ', '.join(
+        row[1] for row in cursor.execute(
+            'PRAGMA table_info({})'.format(table)))
+    new_columns = ', '.join(
+        'NEW.' + column for column in table_columns.split(', '))
+    copy_rows = (
+        'INSERT OR REPLACE INTO {shadow} (rowid, {columns})'
+        ' SELECT rowid, {columns} FROM {table} WHERE rowid > ?'
+    ).format(shadow=shadow, table=table, columns=table_columns)
+
+    # Start over if an earlier attempt was interrupted.
+    _drop_shadow(cursor, table, shadow)
+    table_sql = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table,)
+    ).fetchone()[0]
+    cursor.execute(re.sub(
+        r'^CREATE TABLE\s+("?){}\1'.format(re.escape(table)),
+        'CREATE TABLE ' + shadow,
+        table_sql))
+    cursor.execute(create_index.format(shadow))
+    mirror_row = (
+        'INSERT OR REPLACE INTO {shadow} (rowid, {columns})'
+        ' VALUES (NEW.rowid, {new_columns});'
+    ).format(shadow=shadow, columns=table_columns, new_columns=new_columns)
+    delete_row = 'DELETE FROM {} WHERE rowid = OLD.rowid;'.format(shadow)
+    for action, body in (
+        ('insert', mirror_row),
+        ('update', delete_row + mirror_row),
+        ('delete', delete_row),
+    ):
+        cursor.execute(
+            'CREATE TRIGGER {table}_migrating_{action}'
+            ' AFTER {event} ON {table} BEGIN {body} END'.format(
+                table=table, action=action, event=action.upper(), body=body))
+    connection.commit()
+
+    last_rowid = -2**63
+    copied = 0
+    while True:
+        cursor.execute('BEGIN IMMEDIATE')
+        end = cursor.execute(
+            'SELECT rowid FROM {} WHERE rowid > ?'
+            ' ORDER BY rowid LIMIT 1 OFFSET ?'.format(table),
+            (last_rowid, batch_size - 1)
+        ).fetchone()
+        if end is None:
+            break
+
+        cursor.execute(copy_rows + ' AND rowid <= ?', (last_rowid, end[0]))
+        connection.commit()
+
+        last_rowid = end[0]
+        copied += batch_size
+        if progress is not None:
+            progress("  %s: copied %d of ~%d rows" % (
+                table, copied, row_count))
+        time.sleep(pause)
+
+    # Still inside the final write transaction: copy the tail and swap.
+    cursor.execute(copy_rows, (last_rowid,))
+    _drop_triggers(cursor, table)
+    sequence = _sequence(cursor, table)
+    cursor.execute('DROP TABLE {}'.format(table))
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(shadow, table))
+    if sequence is not None:
+        _restore_sequence(cursor, table, sequence)
+    finish(cursor)
+
+
+def _rollback(connection):
+    if connection.in_transaction:
+        connection.rollback()
+
+
+def _index_exists(cursor, index_name):
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+        (index_name,)
+    ).fetchone() is not None
+
+
+def _sequence(cursor, table):
+    """Returns the AUTOINCREMENT high-water mark of table, if it has one."""
+    if cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'"
+    ).fetchone() is None:
+        return None
+    row = cursor.execute(
+        'SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    return None if row is None else row[0]
+
+
+def _restore_sequence(cursor, table, sequence):
+    # Dropping the table dropped its high-water mark, and the shadow only
+    # knows the largest rowid it holds, so ids of deleted rows at the end
+    # of the table would be handed out again.
+    cursor.execute(
+        'UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?',
+        (sequence, table))
+    cursor.execute(
+        'INSERT INTO sqlite_sequence (name, seq) SELECT ?, ?'
+        ' WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)',
+        (table, sequence, table))
+
+
+def _drop_triggers(cursor, table):
+    for action in ('insert', 'update', 'delete'):
+        cursor.execute('DROP TRIGGER IF EXISTS {}_migrating_{}'.format(
+            table, action))
+
+
+def _drop_shadow(cursor, table, shadow):
+    _drop_triggers(cursor, table)
+    cursor.execute('DROP TABLE IF EXISTS {}'.format(shadow))
@@ -1,16 +1,10 @@
-DROP TABLE IF EXISTS auth;
-DROP TABLE IF EXISTS beans;
-DROP TABLE IF EXISTS inventory;
-DROP TABLE IF EXISTS steam;
-DROP TABLE IF EXISTS trades;
-
-CREATE TABLE auth (
+CREATE TABLE IF NOT EXISTS auth (
   user_id INTEGER PRIMARY KEY AUTOINCREMENT,
   username TEXT UNIQUE NOT NULL,
   password_hash TEXT NOT NULL
 );
 
-CREATE TABLE beans (
+CREATE TABLE IF NOT EXISTS beans (
   bean_id INTEGER PRIMARY KEY AUTOINCREMENT,
   bean_name TEXT UNIQUE NOT NULL,
   short_desc TEXT NOT NULL,
@@ -18,7 +12,7 @@ CREATE TABLE beans (
   quality INTEGER NOT NULL
 );
 
-CREATE TABLE inventory (
+CREATE TABLE IF NOT EXISTS inventory (
   user_id INTEGER NOT NULL,
   bean_id INTEGER NOT NULL,
   qty INTEGER NOT NULL,
@@ -27,13 +21,13 @@ CREATE TABLE inventory (
   PRIMARY KEY (user_id, bean_id)
 );
 
-CREATE TABLE steam (
+CREATE TABLE IF NOT EXISTS steam (
   steam_id INTEGER PRIMARY KEY,
   user_id INTEGER NOT NULL,
   FOREIGN KEY (user_id) REFERENCES auth (user_id)
 );
 
-CREATE TABLE trades (
+CREATE TABLE IF NOT EXISTS trades (
   trade_id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
   item TEXT UNIQUE NOT NULL,
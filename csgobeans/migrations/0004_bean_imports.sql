@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS bean_imports (
+  source TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  line_no INTEGER NOT NULL,
+  imported INTEGER NOT NULL,
+  rejected INTEGER NOT NULL
+);
@@ -0,0 +1,28 @@
+CREATE TABLE IF NOT EXISTS catalog_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL,
+  modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1);
+
+CREATE TRIGGER IF NOT EXISTS beans_insert_catalog_version
+AFTER INSERT ON beans BEGIN
+  UPDATE catalog_version
+  SET version = version + 1, modified = CURRENT_TIMESTAMP
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS beans_update_catalog_version
+AFTER UPDATE ON beans BEGIN
+  UPDATE catalog_version
+  SET version = version + 1, modified = CURRENT_TIMESTAMP
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS beans_delete_catalog_version
+AFTER DELETE ON beans BEGIN
+  UPDATE catalog_version
+  SET version = version + 1, modified = CURRENT_TIMESTAMP
+  WHERE id = 1;
+END;
@@ -0,0 +1,4 @@
+CREATE TABLE IF NOT EXISTS user_versions (
+  user_id INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL
+);
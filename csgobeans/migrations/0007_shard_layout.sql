@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS shard_layout (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  shards INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO shard_layout (id, shards) VALUES (1, 0);
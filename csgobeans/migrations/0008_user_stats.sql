@@ -0,0 +1,43 @@
+CREATE TABLE IF NOT EXISTS user_stats (
+  user_id INTEGER PRIMARY KEY,
+  total INTEGER NOT NULL,
+  mythic INTEGER NOT NULL,
+  distinct_beans INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS user_stats_total
+ON user_stats (total DESC, user_id);
+CREATE INDEX IF NOT EXISTS user_stats_mythic
+ON user_stats (mythic DESC, user_id);
+CREATE INDEX IF NOT EXISTS user_stats_distinct_beans
+ON user_stats (distinct_beans DESC, user_id);
+
+CREATE TABLE IF NOT EXISTS user_breakdowns (
+  user_id INTEGER NOT NULL,
+  dimension TEXT NOT NULL,
+  value INTEGER NOT NULL,
+  qty INTEGER NOT NULL,
+  PRIMARY KEY (user_id, dimension, value)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO user_stats (user_id, total, mythic, distinct_beans)
+SELECT
+  inventory.user_id,
+  SUM(qty),
+  SUM(CASE WHEN quality = 4 THEN qty ELSE 0 END),
+  COUNT(*)
+FROM inventory
+LEFT JOIN beans ON inventory.bean_id = beans.bean_id
+GROUP BY inventory.user_id;
+
+INSERT OR IGNORE INTO user_breakdowns (user_id, dimension, value, qty)
+SELECT inventory.user_id, 'quality', quality, SUM(qty)
+FROM inventory
+JOIN beans ON inventory.bean_id = beans.bean_id
+GROUP BY inventory.user_id, quality;
+
+INSERT OR IGNORE INTO user_breakdowns (user_id, dimension, value, qty)
+SELECT inventory.user_id, 'color', color, SUM(qty)
+FROM inventory
+JOIN beans ON inventory.bean_id = beans.bean_id
+GROUP BY inventory.user_id, color;
@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS bean_grants (
+  campaign TEXT PRIMARY KEY,
+  line_no INTEGER NOT NULL,
+  granted INTEGER NOT NULL
+);
@@ -0,0 +1,81 @@
+import base64
+import binascii
+import collections
+import json
+
+
+Page = collections.namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    data = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or not all(
+        isinstance(value, (str, int, float)) and not isinstance(value, bool)
+        for value in values
+    ):
+        raise InvalidCursor(cursor)
+    return tuple(values)
+
+
+def paginate(fetch, key, page_size, after=None, before=None):
+    """Fetches one page of a keyset-ordered listing.
+
+    `fetch(count=..., after=..., before=...)` must return rows in ascending
+    order and `key(row)` the sort key of a row. One extra row is fetched to
+    find out whether there is another page in the direction of travel.
+    """
+    rows = fetch(count=page_size + 1, after=after, before=before)
+    more = len(rows) > page_size
+
+    if before is not None:
+        rows = rows[-page_size:]
+        has_prev, has_next = more, True
+    else:
+        rows = rows[:page_size]
+        has_prev, has_next = after is not None, more
+
+    if not rows:
+        return Page(rows, None, None)
+
+    return Page(
+        rows,
+        encode_cursor(key(rows[-1])) if has_next else None,
+        encode_cursor(key(rows[0])) if has_prev else None)
+
+
+def keyset_clause(columns, after=None, before=None):
+    """Returns (condition, params, descending) for a keyset over `columns`."""
+    if after is not None and before is not None:
+        raise ValueError("Only one of after and before may be given")
+
+    if len(columns) == 1:
+        lhs = columns[0]
+        rhs = '?'
+    else:
+        lhs = '({})'.format(', '.join(columns))
+        rhs = '({})'.format(', '.join('?' * len(columns)))
+
+    for cursor in (after, before):
+        if cursor is not None and len(cursor) != len(columns):
+            raise InvalidCursor(cursor)
+
+    if after is not None:
+        return ('{} > {}'.format(lhs, rhs), tuple(after), False)
+    if before is not None:
+        return ('{} < {}'.format(lhs, rhs), tuple(before), True)
+    return ('1', (), False)
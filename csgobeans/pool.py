@@ -0,0 +1,187 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from . import metrics
+from . import shards as sharding
+
+
+JOURNAL_MODES = frozenset(
+    ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'))
+SYNCHRONOUS_MODES = frozenset(('OFF', 'NORMAL', 'FULL', 'EXTRA'))
+# Pragmas that are set separately for every attached database.
+SCHEMA_PRAGMAS = frozenset(
+    ('journal_mode', 'synchronous', 'mmap_size', 'cache_size'))
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections for one database file.
+
+    Connections are created on demand up to `max_size` and handed out most
+    recently used first, so hot connections keep a warm page cache. Every
+    connection is configured with the given pragmas when it is opened and
+    rolled back when it is returned.
+
+    With `shards`, every connection also attaches the shard files.
+    """
+
+    def __init__(
+        self,
+        database_file_path,
+        max_size=8,
+        timeout=5.0,
+        journal_mode='WAL',
+        synchronous='NORMAL',
+        busy_timeout=5000,
+        mmap_size=64 * 1024 * 1024,
+        cache_size=-8000,
+        shards=0
+    ):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError("Invalid journal mode '%s'" % journal_mode)
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError("Invalid synchronous mode '%s'" % synchronous)
+        sharding.check_count(shards)
+
+        self.database_file_path = database_file_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.shards = shards
+        self.pragmas = (
+            ('journal_mode', journal_mode),
+            ('synchronous', synchronous),
+            ('busy_timeout', int(busy_timeout)),
+            ('mmap_size', int(mmap_size)),
+            ('cache_size', int(cache_size)),
+        )
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections inherited across a fork belong to the parent and must
+        # not be used or closed by the child, so they are simply dropped.
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._size = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def connect(self):
+        # BEGIN IMMEDIATE would lock every attached shard for each write,
+        # so sharded connections take the write lock of only the files a
+        # transaction writes to.
+        connection = sqlite3.connect(
+            self.database_file_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=dict(self.pragmas)['busy_timeout'] / 1000,
+            isolation_level='DEFERRED' if self.shards else 'IMMEDIATE',
+            check_same_thread=False,
+            factory=metrics.InstrumentedConnection)
+        sharding.attach(connection, self.database_file_path, self.shards)
+        schemas = ['main'] + (
+            sharding.schemas(self.shards) if self.shards else [])
+        for name, value in self.pragmas:
+            if name not in SCHEMA_PRAGMAS:
+                connection.execute('PRAGMA {} = {}'.format(name, value))
+                continue
+            for schema in schemas:
+                connection.execute(
+                    'PRAGMA {}.{} = {}'.format(schema, name, value))
+        return connection
+
+    def checkout(self):
+        started = time.perf_counter()
+        connection = self._checkout()
+        metrics.DB_CHECKOUTS.inc()
+        metrics.DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+        return connection
+
+    def _checkout(self):
+        self._check_pid()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._size < self.max_size
+            if create:
+                self._size += 1
+
+        if create:
+            try:
+                return self.connect()
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(
+                "No database connection available after %s seconds"
+                % self.timeout)
+
+    def checkin(self, connection):
+        self._check_pid()
+
+        try:
+            connection.rollback()
+            connection.row_factory = None
+        except sqlite3.Error:
+            self.discard(connection)
+            return
+
+        self._idle.put(connection)
+
+    def discard(self, connection):
+        with self._lock:
+            self._size -= 1
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(connection)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+
+def pool_from_config(database_file_path, config):
+    return ConnectionPool(
+        database_file_path,
+        max_size=config['DATABASE_POOL_SIZE'],
+        timeout=config['DATABASE_POOL_TIMEOUT'],
+        journal_mode=config['DATABASE_JOURNAL_MODE'],
+        synchronous=config['DATABASE_SYNCHRONOUS'],
+        busy_timeout=config['DATABASE_BUSY_TIMEOUT'],
+        mmap_size=config['DATABASE_MMAP_SIZE'],
+        cache_size=config['DATABASE_CACHE_SIZE'],
+        shards=config['DATABASE_SHARDS'])
@@ -0,0 +1,163 @@
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+
+from .cache import LRUCache
+
+
+LOGGER = logging.getLogger(__name__)
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+# The latest known state of one user's inventory fetch. `items`,
+# `too_many` and `retry_after` are what the loader returned, and stay
+# set while a refresh of a ready slot is pending.
+Slot = collections.namedtuple(
+    'Slot', ['state', 'items', 'too_many', 'retry_after', 'updated_at'])
+
+
+class InventoryPrefetcher:
+    """Fetches inventories on a bounded pool of background threads.
+
+    `submit` never blocks: when the queue is full the fetch is dropped and
+    the caller falls back to loading the inventory itself. Jobs that waited
+    longer than `deadline` seconds are skipped, and pending slots older
+    than that are reported as expired so they can be submitted again.
+    """
+
+    def __init__(
+        self,
+        fetch,
+        workers=4,
+        queue_size=256,
+        deadline=15,
+        max_slots=1024
+    ):
+        self.fetch = fetch
+        self.workers = workers
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.slots = LRUCache(max_slots)
+
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._reset()
+
+    def _reset(self):
+        # Threads do not survive a fork, so a child starts its own.
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._threads = []
+
+    def _start_workers(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    name='inventory-prefetch-%d' % i,
+                    daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        for name in (
+            'submitted', 'rejected', 'done', 'failed', 'expired', 'late'
+        ):
+            stats.setdefault(name, 0)
+        stats['queued'] = self._queue.qsize()
+        stats['queue_size'] = self.queue_size
+        stats['workers'] = self.workers
+        return stats
+
+    def status(self, steam_id):
+        slot = self.slots.get(steam_id)
+        if (
+            slot is not None
+            and slot.state == PENDING
+            and time.monotonic() - slot.updated_at > self.deadline
+        ):
+            return slot._replace(state=EXPIRED)
+        return slot
+
+    def submit(self, steam_id):
+        """Queues a fetch unless one is already pending. Returns False if
+        the fetch could not be queued.
+        """
+        if self.workers <= 0:
+            return False
+        self._start_workers()
+
+        now = time.monotonic()
+        slot = self.status(steam_id)
+        if slot is not None and slot.state == PENDING:
+            return True
+
+        try:
+            self._queue.put_nowait((steam_id, now))
+        except queue.Full:
+            self._count('rejected')
+            LOGGER.warning(
+                "Inventory prefetch queue is full, dropped '%s'", steam_id)
+            return False
+
+        self._count('submitted')
+        if slot is None or slot.state != READY:
+            slot = Slot(PENDING, None, False, 0, now)
+        else:
+            slot = slot._replace(state=PENDING, updated_at=now)
+        self.slots.put(steam_id, slot)
+        return True
+
+    def _work(self):
+        while True:
+            steam_id, queued_at = self._queue.get()
+            if steam_id is None:
+                return
+            if time.monotonic() - queued_at > self.deadline:
+                self._count('expired')
+                continue
+            self._run(steam_id, queued_at)
+
+    def _run(self, steam_id, queued_at):
+        try:
+            items, too_many, retry_after = self.fetch(steam_id)
+        except Exception:
+            self._count('failed')
+            LOGGER.exception("Failed to prefetch inventory '%s'", steam_id)
+            previous = self.slots.get(steam_id)
+            self.slots.put(steam_id, Slot(
+                FAILED,
+                None if previous is None else previous.items,
+                False,
+                0,
+                time.monotonic()))
+            return
+
+        now = time.monotonic()
+        self._count('late' if now - queued_at > self.deadline else 'done')
+        self.slots.put(
+            steam_id, Slot(READY, list(items), too_many, retry_after, now))
+
+    def close(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put((None, 0))
+        for thread in threads:
+            thread.join()
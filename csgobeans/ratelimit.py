@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket kept in a SQLite file so that every worker process on
+    the host draws from the same budget.
+
+    The bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second. Each acquire is one short IMMEDIATE transaction.
+    """
+
+    def __init__(self, database_file_path, rate, burst, name='steam'):
+        self.database_file_path = database_file_path
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.name = name
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.pid = os.getpid()
+            local.connection = sqlite3.connect(
+                self.database_file_path,
+                timeout=1.0,
+                isolation_level=None)
+            local.connection.execute('PRAGMA journal_mode = WAL')
+            local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                ' name TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' updated REAL NOT NULL)')
+        return local.connection
+
+    def try_acquire(self):
+        """Takes one token. Returns 0 on success, or else the number of
+        seconds until a token will be available.
+        """
+        connection = self._connection()
+        now = time.time()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            # Another worker held the bucket past the busy timeout, so the
+            # token is refused rather than failing the request.
+            return 1 / self.rate
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM buckets WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            if row is None:
+                tokens = self.burst
+            else:
+                tokens, updated = row
+                elapsed = max(0.0, now - updated)
+                tokens = min(self.burst, tokens + elapsed * self.rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            connection.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated)'
+                ' VALUES (?, ?, ?)',
+                (self.name, tokens, now))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, max_wait=0.0):
+        """Takes one token, waiting at most max_wait seconds for it.
+        Returns 0 on success, or else the seconds until one is available.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0 or time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
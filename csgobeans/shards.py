@@ -0,0 +1,290 @@
+import concurrent.futures
+import os
+import sqlite3
+import urllib.parse
+import zlib
+
+
+# SQLite attaches at most 10 databases unless built with a larger limit.
+MAX_SHARDS = 10
+
+# Tables whose rows all belong to one user and live in that user's shard.
+SHARDED_TABLES = (
+    'steam',
+    'inventory',
+    'trades',
+    'user_versions',
+    'user_stats',
+    'user_breakdowns',
+)
+
+# Every shard allocates trade ids from its own range, so ids stay unique
+# when users move between shards. Ids below the first range are those
+# written before the database was sharded. Trades are inserted with the id
+# following the shard's sequence rather than the largest id in the table,
+# since moved trades keep the ids of the shard they came from.
+TRADE_ID_RANGE = 1 << 40
+
+
+class ShardLayoutError(RuntimeError):
+    pass
+
+
+def check_count(shards):
+    if not 0 <= shards <= MAX_SHARDS:
+        raise ValueError(
+            "The number of shards must be between 0 and %d" % MAX_SHARDS)
+
+
+def shard_for(user_id, shards):
+    return zlib.crc32(b'%d' % user_id) % shards
+
+
+def schema_name(index):
+    return 'shard%d' % index
+
+
+def schemas(shards):
+    """Returns the schemas holding per-user tables, in shard order."""
+    if not shards:
+        return ['main']
+    return [schema_name(index) for index in range(shards)]
+
+
+def shard_path(database_file_path, index):
+    root, extension = os.path.splitext(database_file_path)
+    return '%s-shard%d%s' % (root, index, extension)
+
+
+def shard_paths(database_file_path, shards):
+    return [shard_path(database_file_path, i) for i in range(shards)]
+
+
+def readonly_uri(path):
+    """Returns a URI that opens `path` read-only, for connections made
+    with uri=True."""
+    return 'file:{}?mode=ro'.format(urllib.parse.quote(path))
+
+
+def attach(connection, database_file_path, shards, readonly=False):
+    for index, path in enumerate(shard_paths(database_file_path, shards)):
+        if readonly:
+            path = readonly_uri(path)
+        connection.execute(
+            'ATTACH DATABASE ? AS {}'.format(schema_name(index)), (path,))
+
+
+def stored_shards(connection):
+    """Returns the recorded number of shards, or None before migration 7."""
+    try:
+        row = connection.execute(
+            'SELECT shards FROM shard_layout WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return None if row is None else row[0]
+
+
+def store_shards(connection, shards):
+    with connection:
+        connection.execute(
+            'UPDATE shard_layout SET shards = ? WHERE id = 1', (shards,))
+
+
+def check_layout(connection, shards):
+    stored = stored_shards(connection)
+    if stored is not None and stored != shards:
+        raise ShardLayoutError(
+            "The database is laid out for %d shards but %d are configured,"
+            " run 'flask rebalance-shards --to %d' first"
+            % (stored, shards, shards))
+
+
+def claim_layout(connection, shards):
+    """Records the layout of a database that holds no per-user rows yet,
+    or else checks that it matches.
+    """
+    stored = stored_shards(connection)
+    if stored is None or stored == shards:
+        return
+    empty = not any(
+        connection.execute(
+            'SELECT 1 FROM main.{} LIMIT 1'.format(table)).fetchone()
+        for table in SHARDED_TABLES)
+    if stored == 0 and empty:
+        store_shards(connection, shards)
+    else:
+        check_layout(connection, shards)
+
+
+def trade_id_range(index):
+    """Returns the [first, last) trade ids allocated by shard `index`."""
+    first = (index + 1) * TRADE_ID_RANGE
+    return first, first + TRADE_ID_RANGE
+
+
+def trade_sequence(connection, schema='main'):
+    row = connection.execute(
+        "SELECT seq FROM {}.sqlite_sequence WHERE name = 'trades'".format(
+            schema)).fetchone()
+    return 0 if row is None else row[0]
+
+
+def reserve_trade_ids(connection, index, schema='main', used=0):
+    """Points the trade id sequence of shard `index`, attached as `schema`,
+    into its own range, past `used` and past the ids of its range that
+    the shard holds.
+
+    Copying trades with ids from another range raises the sequence past
+    that id, and the shard would go on to allocate ids from the other
+    shard's range, so the sequence is only kept while it stays in range.
+    Must run in a transaction.
+    """
+    first, last = trade_id_range(index)
+    seq = trade_sequence(connection, schema)
+    if not first <= seq < last:
+        seq = first
+    seq = max(seq, used, _max_trade_id(connection, index, [schema]))
+    connection.execute(
+        "DELETE FROM {}.sqlite_sequence WHERE name = 'trades'".format(schema))
+    connection.execute(
+        "INSERT INTO {}.sqlite_sequence (name, seq) VALUES ('trades', ?)"
+        .format(schema), (seq,))
+
+
+def _max_trade_id(connection, index, attached):
+    first, last = trade_id_range(index)
+    return max(
+        connection.execute(
+            'SELECT IFNULL(MAX(trade_id), 0) FROM {}.trades'
+            ' WHERE trade_id >= ? AND trade_id < ?'.format(schema),
+            (first, last)).fetchone()[0]
+        for schema in attached)
+
+
+def _trade_sequences(connection, shards):
+    return [
+        trade_sequence(connection, schema) for schema in schemas(shards)]
+
+
+def _restore_trade_ids(connection, attached, sequences):
+    # Every id of a shard's range that is in use anywhere, or was ever
+    # allocated by the shard, stays behind its sequence.
+    for index, seq in enumerate(sequences):
+        first, last = trade_id_range(index)
+        used = _max_trade_id(connection, index, attached)
+        if first <= seq < last:
+            used = max(used, seq)
+        reserve_trade_ids(connection, index, schema_name(index), used)
+
+
+def _grant_lines(connection, schema):
+    # Shards created before migration 9 have no bean_grants table.
+    if connection.execute(
+        "SELECT 1 FROM {}.sqlite_master WHERE name = 'bean_grants'".format(
+            schema)
+    ).fetchone() is None:
+        return {}
+    return dict(connection.execute(
+        'SELECT campaign, line_no FROM {}.bean_grants'.format(schema)))
+
+
+def _carry_grant_progress(connection, old_shards, new_shards):
+    # Every shard records how far it got through each grant campaign, and
+    # moved users take their grants with them. Progress only carries over
+    # when every old shard stopped at the same line.
+    old_lines = [
+        _grant_lines(connection, schema) for schema in schemas(old_shards)]
+    lines = {}
+    for campaign in set().union(*old_lines):
+        line_nos = set(shard.get(campaign, 0) for shard in old_lines)
+        if len(line_nos) > 1:
+            raise ShardLayoutError(
+                "Grant campaign %r stopped part way through a chunk, run"
+                " 'flask grant-beans' for it again first" % campaign)
+        lines[campaign] = line_nos.pop()
+    for schema in schemas(new_shards):
+        for campaign, line_no in lines.items():
+            connection.execute(
+                'INSERT INTO {}.bean_grants (campaign, line_no, granted)'
+                ' VALUES (?, ?, 0)'
+                ' ON CONFLICT (campaign) DO UPDATE SET'
+                ' line_no = excluded.line_no'.format(schema),
+                (campaign, line_no))
+
+
+def fan_out(paths, query, params=(), workers=None):
+    """Runs a read-only query against every file in parallel.
+
+    Returns one list of rows per path, in the order of `paths`.
+    """
+    def run(path):
+        connection = sqlite3.connect(readonly_uri(path), uri=True)
+        try:
+            return connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers or len(paths) or 1
+    ) as executor:
+        return list(executor.map(run, paths))
+
+
+def rebalance(
+    connection,
+    old_shards,
+    new_shards,
+    batch_size=500,
+    progress=None
+):
+    """Moves every user's rows to the shard they hash to with new_shards.
+
+    `connection` must have the shards of both layouts attached. Users are
+    moved batch_size at a time, each batch in one transaction, so the
+    move can be interrupted and run again. Raises ShardLayoutError when
+    a grant campaign was interrupted part way through a chunk. Returns
+    the number of users moved.
+    """
+    new_schemas = schemas(new_shards)
+    attached = ['main'] + [
+        schema_name(index) for index in range(max(old_shards, new_shards))]
+    with connection:
+        _carry_grant_progress(connection, old_shards, new_shards)
+        if new_shards:
+            _restore_trade_ids(
+                connection, attached, _trade_sequences(connection, new_shards))
+    moved = 0
+    for source in schemas(old_shards):
+        user_ids = [row[0] for row in connection.execute(
+            ' UNION '.join(
+                'SELECT user_id FROM {}.{}'.format(source, table)
+                for table in SHARDED_TABLES))]
+
+        moves = []
+        for user_id in user_ids:
+            target = new_schemas[
+                shard_for(user_id, new_shards) if new_shards else 0]
+            if target != source:
+                moves.append((user_id, target))
+
+        for i in range(0, len(moves), batch_size):
+            with connection:
+                if new_shards:
+                    sequences = _trade_sequences(connection, new_shards)
+                for user_id, target in moves[i:i + batch_size]:
+                    for table in SHARDED_TABLES:
+                        connection.execute(
+                            'INSERT INTO {}.{} SELECT * FROM {}.{}'
+                            ' WHERE user_id = ?'.format(
+                                target, table, source, table),
+                            (user_id,))
+                        connection.execute(
+                            'DELETE FROM {}.{} WHERE user_id = ?'.format(
+                                source, table),
+                            (user_id,))
+                if new_shards:
+                    _restore_trade_ids(connection, attached, sequences)
+            moved += len(moves[i:i + batch_size])
+            if progress is not None:
+                progress("Moved %d users out of %s" % (moved, source))
+    return moved
@@ -12,4 +12,19 @@ $(document).ready(function() {
   $(".notification .delete").click(function() {
     $(this).parent().remove();
   })
+
+  // Reload the trade page once the background inventory fetch is done
+  var pending = $("#inventory-pending");
+  if (pending.length) {
+    var poll = function() {
+      $.getJSON(pending.data("status-url"), function(status) {
+        if (status.state === "pending") {
+          setTimeout(poll, 1000);
+        } else {
+          window.location.reload();
+        }
+      });
+    };
+    setTimeout(poll, 500);
+  }
 });
@@ -0,0 +1,164 @@
+import os
+import random
+import threading
+import time
+
+from . import metrics
+from .ratelimit import TokenBucket
+
+
+STEAM_BASE_URL = 'https://steamcommunity.com'
+OPENID_LOGIN_PATH = '/openid/login'
+CSGO_INVENTORY_PATH = '/profiles/%s/inventory/json/730/2'
+CSGO_INVENTORY_PAGED_PATH = '/inventory/%s/730/2'
+
+RETRY_STATUS_CODES = frozenset((500, 502, 503, 504))
+
+
+class SteamRateLimited(Exception):
+    """Raised instead of calling Steam when our own budget is spent."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            "Steam rate budget exhausted, retry after %.2fs" % retry_after)
+        self.retry_after = retry_after
+
+
+class SteamClient:
+    """HTTP client for Steam that keeps connections alive between calls.
+
+    Each process gets its own connection pool; the session is recreated
+    lazily if the client is used after a fork.
+    """
+
+    def __init__(
+        self,
+        base_url=STEAM_BASE_URL,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+        retry_backoff=0.25,
+        max_retry_backoff=2,
+        pool_size=10,
+        rate_limiter=None,
+        rate_limit_wait=0.5
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.pool_size = pool_size
+        self.rate_limiter = rate_limiter
+        self.rate_limit_wait = rate_limit_wait
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = self._create_session()
+                self._pid = os.getpid()
+            return self._session
+
+    def _create_session(self):
+        # requests is imported on first use so that workers which never
+        # call Steam do not pay for it at startup.
+        import requests
+        import requests.adapters
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def url(self, path):
+        return self.base_url + path
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        import requests
+
+        kwargs.setdefault('timeout', self.timeout)
+        # Only idempotent requests are retried once Steam may have seen them.
+        idempotent = method in ('GET', 'HEAD')
+
+        attempt = 0
+        while True:
+            self._take_token()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, self.url(path), **kwargs)
+            except requests.ConnectionError:
+                metrics.observe_steam_request(
+                    method, path, 'error', time.perf_counter() - started)
+                if attempt >= self.retries:
+                    raise
+            except requests.Timeout:
+                metrics.observe_steam_request(
+                    method, path, 'timeout', time.perf_counter() - started)
+                if not idempotent or attempt >= self.retries:
+                    raise
+            else:
+                metrics.observe_steam_request(
+                    method, path, response.status_code,
+                    time.perf_counter() - started)
+                if (
+                    not idempotent
+                    or response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= self.retries
+                ):
+                    return response
+                response.close()
+
+            time.sleep(self._retry_delay(attempt))
+            attempt += 1
+
+    def _take_token(self):
+        if self.rate_limiter is None:
+            return
+        wait = self.rate_limiter.acquire(self.rate_limit_wait)
+        if wait > 0:
+            metrics.STEAM_RATE_LIMITED.inc()
+            raise SteamRateLimited(wait)
+
+    def _retry_delay(self, attempt):
+        ceiling = min(self.max_retry_backoff, self.retry_backoff * 2**attempt)
+        return random.uniform(0, ceiling)
+
+
+def client_from_config(config, rate_limit_path=None):
+    rate_limiter = None
+    if config['STEAM_RATE_LIMIT'] > 0 and rate_limit_path is not None:
+        rate_limiter = TokenBucket(
+            rate_limit_path,
+            rate=config['STEAM_RATE_LIMIT'],
+            burst=config['STEAM_RATE_BURST'])
+    return SteamClient(
+        base_url=config['STEAM_BASE_URL'],
+        connect_timeout=config['STEAM_CONNECT_TIMEOUT'],
+        read_timeout=config['STEAM_READ_TIMEOUT'],
+        retries=config['STEAM_RETRIES'],
+        retry_backoff=config['STEAM_RETRY_BACKOFF'],
+        pool_size=config['STEAM_POOL_SIZE'],
+        rate_limiter=rate_limiter,
+        rate_limit_wait=config['STEAM_RATE_LIMIT_WAIT'])
@@ -0,0 +1,26 @@
+from . import ctx
+
+
+def compile_templates(app):
+    """Loads every template, compiling and caching the ones that are not
+    in the bytecode cache yet, and returns their names.
+    """
+    env = app.jinja_env
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def preload_catalog(app):
+    with app.app_context():
+        return ctx.get_bean_catalog()
+
+
+def warm(app):
+    """Readies a new app for its first request.
+
+    Run in the master of a preforking server before it forks, the compiled
+    templates and the catalog are shared by every worker.
+    """
+    return compile_templates(app), preload_catalog(app)
@@ -1,17 +1,37 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch
+from urllib.parse import urlparse
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from csgobeans import create_app
 from csgobeans import ctx
+from csgobeans import paging
+from csgobeans import warmup
+from csgobeans.beans import Bean
+from csgobeans.db import Database
+from csgobeans.steam import SteamRateLimited
 
 
 class AppTest(unittest.TestCase):
     def setUp(self):
+        self.instance_dir = tempfile.mkdtemp()
         self.app = create_app({
             'TESTING': True,
-            'DATABASE_FILE': 'test.sqlite'
+            'DATABASE_FILE': os.path.join(self.instance_dir, 'test.sqlite'),
+            'INVENTORY_CACHE_DIR':
+                os.path.join(self.instance_dir, 'inventory_cache'),
+            'INVENTORY_PREFETCH_WORKERS': 0,
+            'TEMPLATE_CACHE_DIR':
+                os.path.join(self.instance_dir, 'template_cache'),
         })
         self.client = self.app.test_client()
 
@@ -20,9 +40,12 @@ class AppTest(unittest.TestCase):
 
         with self.app.app_context():
             db = ctx.get_db()
-            db.initialize_from_schema()
+            db.migrate()
             db.populate_beans_from_file()
 
+    def tearDown(self):
+        shutil.rmtree(self.instance_dir, ignore_errors=True)
+
     def login(self):
         with patch('csgobeans.auth.validate_login') as mock:
             mock.return_value = True
@@ -81,6 +104,81 @@ class TestRoot(AppTest):
             for bean_id, bean in beans:
                 self.assertIn(bean.name, data)
 
+    def test_index_pages(self):
+        self.app.config['PAGE_SIZE'] = 2
+
+        response = self.client.get("/")
+        data = response.get_data(True)
+        self.assertIn("Jelly", data)
+        self.assertIn("Kidney", data)
+        self.assertNotIn("Navy", data)
+        self.assertNotIn("Previous", data)
+
+        next_url = re.search(r'href="([^"]*after=[^"]*)"', data).group(1)
+        data = self.client.get(next_url).get_data(True)
+        self.assertIn("Navy", data)
+        self.assertNotIn("Jelly", data)
+        self.assertNotIn("Next", data)
+
+        prev_url = re.search(r'href="([^"]*before=[^"]*)"', data).group(1)
+        data = self.client.get(prev_url).get_data(True)
+        self.assertIn("Jelly", data)
+        self.assertIn("Kidney", data)
+        self.assertNotIn("Previous", data)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(400, self.client.get("/?after=abc").status_code)
+        for values in ([{"a": 1}], [["Jelly"]], [None], [True]):
+            cursor = paging.encode_cursor(values)
+            self.assertEqual(
+                400, self.client.get("/?after=" + cursor).status_code)
+
+    def test_login_rate_limited(self):
+        with patch('csgobeans.auth.validate_login') as mock:
+            mock.side_effect = SteamRateLimited(2.5)
+            response = self.client.get(
+                "/login?openid.identity=https://steam/%s" % self.username,
+                follow_redirects=True)
+        self.assertIn(
+            "Steam is busy, please try again in 3 seconds",
+            response.get_data(True))
+        with self.client:
+            self.client.get("/")
+            self.assertIsNone(ctx.get_user_id())
+
+    def test_index_conditional_get(self):
+        self.app.config['CATALOG_VERSION_TTL'] = 0
+        response = self.client.get("/")
+        etag, _ = response.get_etag()
+        self.assertIsNotNone(etag)
+        self.assertIsNotNone(response.last_modified)
+
+        response = self.client.get("/", headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.get_data())
+
+        with self.app.app_context():
+            ctx.get_db().populate_beans([Bean("Mung", "Green", 3, 1)])
+        response = self.client.get("/", headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.get_etag()[0])
+        self.assertIn("Mung", response.get_data(True))
+
+    def test_index_cached(self):
+        first = self.client.get("/").get_data()
+        with patch.object(Database, 'list_beans') as mock:
+            self.assertEqual(first, self.client.get("/").get_data())
+            self.login()
+            data = self.client.get("/").get_data(True)
+            mock.assert_not_called()
+        self.assertIn("Logged in as: %s" % self.username, data)
+        self.assertIn("Jelly", data)
+
+    def test_index_logged_in_not_conditional(self):
+        self.login()
+        response = self.client.get("/")
+        self.assertIsNone(response.get_etag()[0])
+
 
 class TestInventory(AppTest):
     def login_and_trade(self):
@@ -95,6 +193,14 @@ class TestInventory(AppTest):
                 },
                 follow_redirects=True)
 
+    def test_login_required(self):
+        for path in ("/beans", "/trade"):
+            response = self.client.get(path)
+            self.assertEqual(302, response.status_code)
+            self.assertEqual("/", urlparse(response.location).path)
+        response = self.client.get("/")
+        self.assertIn(b"Login required", response.data)
+
     def test_trade_and_beans(self):
         with self.app.app_context():
             with self.client:
@@ -147,3 +253,296 @@ class TestInventory(AppTest):
                     self.assertIn(
                         item,
                         response.get_data().decode('utf-8'))
+
+    def test_beans_and_history_conditional_get(self):
+        self.login_and_trade()
+        for url in ("/beans", "/history"):
+            response = self.client.get(url)
+            etag, _ = response.get_etag()
+            self.assertIsNotNone(etag)
+
+            with patch.object(Database, 'list_inventory_from_user_id') as a, \
+                    patch.object(Database, 'list_trades_from_user_id') as b:
+                response = self.client.get(
+                    url, headers={'If-None-Match': etag})
+                self.assertEqual(304, response.status_code)
+                response = self.client.get(url)
+                self.assertEqual(200, response.status_code)
+                a.assert_not_called()
+                b.assert_not_called()
+
+            with patch("csgobeans.inventory.load_csgo_inventory") as mock:
+                mock.return_value = ([], False, 0)
+                self.client.post(
+                    "/trade",
+                    data={"item_id": url, "item_name": url},
+                    follow_redirects=True)
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(200, response.status_code)
+            self.assertNotIn(response.get_etag()[0], (None, etag))
+
+    def test_trade_prefetched_after_login(self):
+        self.app.config['INVENTORY_PREFETCH_WORKERS'] = 1
+        with patch("csgobeans.inventory.load_csgo_inventory") as mock:
+            mock.return_value = ([("1", "AK-47 | Redline")], False, 0)
+            self.login()
+            prefetcher = self.app.extensions['inventory_prefetcher']
+            deadline = time.monotonic() + 5
+            while prefetcher.status(self.username).state == 'pending':
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+            self.assertEqual(
+                {"state": "ready", "items": 1, "too_many": False,
+                 "retry_after": 0},
+                self.client.get("/trade/status").get_json())
+            response = self.client.get("/trade")
+            self.assertIn("AK-47 | Redline", response.get_data(True))
+            mock.assert_called_once()
+        prefetcher.close()
+
+    def test_trade_pending(self):
+        self.app.config['INVENTORY_PREFETCH_WORKERS'] = 1
+        release = threading.Event()
+
+        def load(steam_id, client, **kwargs):
+            release.wait(5)
+            return ([], False, 0)
+
+        with patch("csgobeans.inventory.load_csgo_inventory", load):
+            self.login()
+            response = self.client.get("/trade")
+            self.assertIn("inventory-pending", response.get_data(True))
+            status = self.client.get("/trade/status").get_json()
+            self.assertEqual("pending", status["state"])
+            release.set()
+            self.app.extensions['inventory_prefetcher'].close()
+
+    def test_trade_batch(self):
+        self.login()
+        with self.app.app_context():
+            with self.client:
+                response = self.client.post(
+                    "/trade/batch",
+                    data={"item_id": ["a", "b"], "item_name": ["A", "B"]},
+                    headers={"Accept": "application/json"})
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(
+                    ["traded", "traded"],
+                    [r["status"] for r in response.get_json()["results"]])
+
+                response = self.client.post(
+                    "/trade/batch",
+                    data={"item_id": ["b", "c"], "item_name": ["B", "C"]},
+                    headers={"Accept": "application/json"})
+                self.assertEqual(
+                    ["duplicate", "traded"],
+                    [r["status"] for r in response.get_json()["results"]])
+
+                db = ctx.get_db()
+                user_id = ctx.get_user_id()
+                self.assertEqual(
+                    3, len(db.list_trades_from_user_id(user_id)))
+
+                with patch("csgobeans.inventory.load_csgo_inventory") as mock:
+                    mock.return_value = ([], False, 0)
+                    response = self.client.post(
+                        "/trade/batch",
+                        data={"item_id": ["d"], "item_name": ["D"]},
+                        follow_redirects=True)
+                self.assertEqual(200, response.status_code)
+                self.assertIn("You traded 1 items", response.get_data(True))
+
+    def test_trade_batch_over_limit(self):
+        limit = self.app.config['TRADE_BATCH_LIMIT']
+        items = ["item-%d" % i for i in range(limit + 1)]
+        self.login()
+        with self.app.app_context():
+            with self.client:
+                with patch.object(
+                    Database, "redeem_items", autospec=True,
+                    side_effect=Database.redeem_items
+                ) as redeem_items:
+                    response = self.client.post(
+                        "/trade/batch",
+                        data={"item_id": items, "item_name": items},
+                        headers={"Accept": "application/json"})
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(
+                    ["traded"] * len(items),
+                    [r["status"] for r in response.get_json()["results"]])
+                self.assertEqual(
+                    [limit, 1],
+                    [len(call.args[2]) for call in redeem_items.mock_calls])
+                self.assertEqual(
+                    len(items), len(ctx.get_db().list_trades_from_user_id(
+                        ctx.get_user_id())))
+
+    def test_trade_batch_group_commit(self):
+        self.app.config['DATABASE_DURABILITY'] = 'group'
+        self.login()
+        with self.app.app_context():
+            with self.client:
+                for items, expected in (
+                    (["a", "b"], ["traded", "traded"]),
+                    (["b", "c"], ["duplicate", "traded"]),
+                ):
+                    response = self.client.post(
+                        "/trade/batch",
+                        data={"item_id": items, "item_name": items},
+                        headers={"Accept": "application/json"})
+                    self.assertEqual(
+                        expected,
+                        [r["status"] for r in response.get_json()["results"]])
+
+                writer = ctx.get_db_writer()
+                self.assertEqual(2, writer.stats()['committed'])
+                writer.close()
+                self.assertEqual(
+                    3, len(ctx.get_db().list_trades_from_user_id(
+                        ctx.get_user_id())))
+
+
+class TestLeaderboard(AppTest):
+    def test_leaderboard(self):
+        response = self.client.get("/leaderboard")
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn(self.username, response.get_data(True))
+
+        self.login()
+        with self.app.app_context():
+            db = ctx.get_db()
+            user_id = db.user_id_from_steam_id(self.username)
+            db.give_user_id_beans(user_id, [(1, 3)])
+
+        for stat in ("total", "mythic", "distinct_beans"):
+            response = self.client.get("/leaderboard?by=" + stat)
+            self.assertEqual(200, response.status_code)
+            self.assertIn(
+                "<td>%s</td>" % self.username, response.get_data(True))
+        self.assertEqual(
+            400, self.client.get("/leaderboard?by=qty").status_code)
+
+    def test_stats(self):
+        self.assertEqual(302, self.client.get("/stats").status_code)
+
+        self.login()
+        with self.app.app_context():
+            db = ctx.get_db()
+            user_id = db.user_id_from_steam_id(self.username)
+            db.give_user_id_beans(user_id, [(1, 3)])
+            bean = db.list_beans_from_bean_ids([1])[0]
+
+        response = self.client.get("/stats")
+        self.assertEqual(200, response.status_code)
+        data = response.get_data(True)
+        self.assertIn("<li>Beans: 3</li>", data)
+        self.assertIn("<li>Distinct beans: 1</li>", data)
+        self.assertIn("<td>%s</td>" % bean.color.name.title(), data)
+        self.assertIn("<td>%s</td>" % bean.quality.name.title(), data)
+
+
+class TestMetrics(AppTest):
+    def test_metrics(self):
+        self.client.get("/")
+        self.client.get("/")
+        data = self.client.get("/metrics").get_data(True)
+        self.assertRegex(
+            data,
+            r'csgobeans_request_seconds_count'
+            r'\{endpoint="index",method="GET",status="200"\} [1-9]')
+        self.assertIn(
+            'csgobeans_request_sql_statements_bucket'
+            '{endpoint="index",le="0"}', data)
+        self.assertIn('csgobeans_db_checkouts_total ', data)
+        self.assertIn('csgobeans_db_pool_connections{state="idle"}', data)
+
+
+class TestWarmup(AppTest):
+    def test_warm(self):
+        names, catalog = warmup.warm(self.app)
+        self.assertIn('index.html', names)
+        self.assertGreater(len(catalog), 0)
+        cache_dir = self.app.config['TEMPLATE_CACHE_DIR']
+        self.assertEqual(len(names), len(os.listdir(cache_dir)))
+
+        # A new worker loads the compiled templates instead of compiling.
+        app = create_app(self.app.config)
+        with patch.object(app.jinja_env, 'compile') as compile:
+            app.jinja_env.get_template('index.html')
+        compile.assert_not_called()
+        with app.app_context():
+            self.assertIs(catalog, ctx.get_bean_catalog())
+
+    def test_warmup_command(self):
+        result = self.app.test_cli_runner().invoke(args=['warmup'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('Compiled', result.output)
+
+
+class TestApi(AppTest):
+    def test_beans(self):
+        self.app.config['PAGE_SIZE'] = 2
+        body = self.client.get("/api/v1/beans").get_json()
+        self.assertEqual(
+            ["bean_id", "bean_name", "short_desc", "color", "quality"],
+            body["fields"])
+        self.assertEqual(
+            ["Jelly", "Kidney"], [row[1] for row in body["items"]])
+        self.assertIsNone(body["prev"])
+
+        body = self.client.get(
+            "/api/v1/beans?after=%s" % body["next"]).get_json()
+        self.assertEqual(["Navy"], [row[1] for row in body["items"]])
+        self.assertIsNone(body["next"])
+
+        with self.app.app_context():
+            beans = ctx.get_db().list_beans(raw=True)
+        body = self.client.get(
+            "/api/v1/beans?before=%s" % body["prev"]).get_json()
+        self.assertEqual([list(row) for row in beans[:2]], body["items"])
+
+        self.assertEqual(
+            400, self.client.get("/api/v1/beans?after=abc").status_code)
+
+    def test_conditional_and_gzip(self):
+        self.app.config['API_GZIP_MIN_SIZE'] = 0
+        response = self.client.get("/api/v1/beans")
+        self.assertNotIn("Content-Encoding", response.headers)
+        etag, weak = response.get_etag()
+        self.assertTrue(weak)
+
+        response = self.client.get(
+            "/api/v1/beans", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual(
+            self.client.get("/api/v1/beans").get_json(),
+            json.loads(gzip.decompress(response.get_data())))
+
+        response = self.client.get(
+            "/api/v1/beans", headers={"If-None-Match": 'W/"%s"' % etag})
+        self.assertEqual(304, response.status_code)
+
+    def test_inventory_and_trades(self):
+        self.assertEqual(401, self.client.get("/api/v1/inventory").status_code)
+        self.assertEqual(401, self.client.get("/api/v1/trades").status_code)
+
+        self.login()
+        with patch("csgobeans.inventory.load_csgo_inventory") as mock:
+            mock.return_value = ([], False, 0)
+            self.client.post(
+                "/trade/batch",
+                data={"item_id": ["a", "b"], "item_name": ["A", "B"]})
+
+        body = self.client.get("/api/v1/trades").get_json()
+        self.assertEqual(["a", "b"], [row[1] for row in body["items"]])
+
+        response = self.client.get("/api/v1/inventory")
+        body = response.get_json()
+        self.assertEqual("qty", body["fields"][1])
+        self.assertTrue(2 <= sum(row[1] for row in body["items"]) <= 18)
+
+        etag, _ = response.get_etag()
+        response = self.client.get(
+            "/api/v1/inventory", headers={"If-None-Match": 'W/"%s"' % etag})
+        self.assertEqual(304, response.status_code)
@@ -0,0 +1,31 @@
+import pickle
+import unittest
+
+from csgobeans.beans import Bean, Color, Quality, bean_from_columns
+
+
+class TestBean(unittest.TestCase):
+    def test_fields(self):
+        bean = Bean("Navy", "A sailing bean", 9, 1)
+        self.assertEqual("Navy", bean.name)
+        self.assertEqual("A sailing bean", bean.short_desc)
+        self.assertIs(Color.WHITE, bean.color)
+        self.assertIs(Quality.COMMON, bean.quality)
+        self.assertEqual(bean, Bean("Navy", "A sailing bean", Color.WHITE, 1))
+        self.assertEqual(
+            bean, bean_from_columns("Navy", "A sailing bean", 9, 1))
+
+    def test_immutable_and_hashable(self):
+        bean = Bean("Navy", "A sailing bean", 9, 1)
+        with self.assertRaises(AttributeError):
+            bean.name = "Kidney"
+        with self.assertRaises(AttributeError):
+            bean.extra = 1
+        self.assertEqual(1, len({bean, Bean("Navy", "A sailing bean", 9, 1)}))
+        self.assertEqual(bean, pickle.loads(pickle.dumps(bean)))
+
+    def test_invalid_enum(self):
+        with self.assertRaises(ValueError):
+            Bean("Navy", "A sailing bean", 42, 1)
+        with self.assertRaises(ValueError):
+            Bean("Navy", "A sailing bean", 1, None)
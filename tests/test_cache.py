@@ -0,0 +1,122 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from csgobeans.cache import InventoryCache, LRUCache
+
+
+class FakeLoader:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, steam_id):
+        self.calls += 1
+        return self.result
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+
+        self.assertEqual(None, cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual(2, len(cache))
+
+
+class TestInventoryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def create_cache(self, **kwargs):
+        return InventoryCache(self.cache_dir, **kwargs)
+
+    def test_hit_and_miss(self):
+        cache = self.create_cache()
+        loader = FakeLoader(([("1", "AK-47")], False, 0))
+
+        self.assertEqual(([("1", "AK-47")], False, 0), cache.get("7", loader))
+        self.assertEqual(([("1", "AK-47")], False, 0), cache.get("7", loader))
+        self.assertEqual(1, loader.calls)
+
+        stats = cache.stats()
+        self.assertEqual(1, stats["miss"])
+        self.assertEqual(1, stats["hit"])
+
+    def test_shared_between_workers(self):
+        loader = FakeLoader(([("1", "AK-47")], False, 0))
+        self.create_cache().get("7", loader)
+
+        other_worker = self.create_cache()
+        self.assertEqual(
+            ([("1", "AK-47")], False, 0),
+            other_worker.get("7", loader))
+        self.assertEqual(1, loader.calls)
+        self.assertEqual(1, other_worker.stats()["hit"])
+
+    def test_stale_while_revalidate(self):
+        cache = self.create_cache(ttl=0, stale_ttl=60)
+        cache.get("7", FakeLoader(([("1", "old")], False, 0)))
+
+        loader = FakeLoader(([("1", "new")], False, 0))
+        self.assertEqual(([("1", "old")], False, 0), cache.get("7", loader))
+        self.assertEqual(1, cache.stats()["stale"])
+
+        deadline = time.time() + 5
+        while cache.memory.get("7").items != [("1", "new")]:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(1, loader.calls)
+
+    def test_retry_after_backoff(self):
+        cache = self.create_cache()
+        loader = FakeLoader(([], True, "30"))
+
+        self.assertEqual(([], True, "30"), cache.get("7", loader))
+        inventory, too_many, retry_after = cache.get("7", loader)
+        self.assertTrue(too_many)
+        self.assertTrue(0 < retry_after <= 31)
+        self.assertEqual(1, loader.calls)
+
+        other_worker = self.create_cache()
+        self.assertTrue(other_worker.get("7", loader)[1])
+        self.assertEqual(1, loader.calls)
+        self.assertEqual(1, other_worker.stats()["backoff"])
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = self.create_cache()
+        release = threading.Event()
+        loader = FakeLoader(([("1", "AK-47")], False, 0))
+
+        def slow_loader(steam_id):
+            release.wait(5)
+            return loader(steam_id)
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get("7", slow_loader)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while cache.stats()["coalesced"] < 4:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, loader.calls)
+        self.assertEqual([([("1", "AK-47")], False, 0)] * 5, results)
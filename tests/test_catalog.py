@@ -0,0 +1,79 @@
+import collections
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from csgobeans import catalog
+from csgobeans.beans import Bean, Quality
+from csgobeans.catalog import BeanCatalog
+from csgobeans.db import Database
+
+
+class TestBeanCatalog(unittest.TestCase):
+    def test_sample_follows_quality_weights(self):
+        beans = [
+            (1, Bean("common", "", 1, Quality.COMMON)),
+            (2, Bean("rare", "", 1, Quality.RARE)),
+            (3, Bean("mythic", "", 1, Quality.MYTHIC)),
+        ]
+        weights = {
+            Quality.COMMON: 6,
+            Quality.UNCOMMON: 0,
+            Quality.RARE: 3,
+            Quality.MYTHIC: 1,
+        }
+        bean_catalog = BeanCatalog(beans, weights)
+
+        draws = 100000
+        counts = collections.Counter(
+            bean_id
+            for bean_id, _ in bean_catalog.sample_many(
+                draws, random.Random(1)))
+
+        self.assertAlmostEqual(0.6, counts[1] / draws, delta=0.01)
+        self.assertAlmostEqual(0.3, counts[2] / draws, delta=0.01)
+        self.assertAlmostEqual(0.1, counts[3] / draws, delta=0.01)
+
+    def test_empty(self):
+        with self.assertRaises(IndexError):
+            BeanCatalog([]).sample()
+
+
+class TestCatalogCache(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.db_dir, 'testdb.sql'))
+        self.db.migrate()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.db_dir)
+
+    def test_invalidated_by_populate_beans(self):
+        self.db.populate_beans([Bean("a", "a", 1, 1)])
+        first = catalog.get_catalog(self.db)
+        self.assertIs(first, catalog.get_catalog(self.db))
+        self.assertEqual(1, len(first))
+
+        self.db.populate_beans([Bean("b", "b", 2, 2)])
+        second = catalog.get_catalog(self.db)
+        self.assertIsNot(first, second)
+        self.assertEqual(2, len(second))
+
+    def test_reloaded_after_write_from_other_connection(self):
+        self.db.populate_beans([Bean("a", "a", 1, 1)])
+        first = catalog.get_catalog(self.db, max_age=0)
+
+        other = Database(self.db.database_file_path)
+        other.db.execute(
+            'INSERT INTO beans (bean_name, short_desc, color, quality)'
+            " VALUES ('b', 'b', 2, 2)")
+        other.db.commit()
+        other.close()
+
+        second = catalog.get_catalog(self.db, max_age=0)
+        self.assertIsNot(first, second)
+        self.assertEqual(2, len(second))
+        self.assertGreater(second.version, first.version)
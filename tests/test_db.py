@@ -1,6 +1,9 @@
 import os
+import shutil
 import tempfile
+import threading
 import unittest
+from unittest.mock import patch
 
 import sqlite3
 
@@ -13,7 +16,7 @@ class TestDatabase(unittest.TestCase):
         self.db_dir = tempfile.mkdtemp()
         self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
         self.db = Database(self.db_file_path)
-        self.db.initialize_from_schema()
+        self.db.migrate()
 
     def tearDown(self):
         self.db.close()
@@ -39,6 +42,55 @@ class TestDatabase(unittest.TestCase):
             None,
             self.db.check_username_and_password("jkl", "mno"))
 
+    def test_multi_get(self):
+        user_ids = []
+        for i in range(3):
+            user_ids.append(self.db.login_steam_user(str(100 + i)))
+        self.db.record_trade(user_ids[0], "item")
+
+        keys = [user_ids[2], 999, user_ids[0], user_ids[2]]
+        self.assertEqual(
+            ["102", None, "100", "102"],
+            self.db.usernames_from_user_ids(keys))
+        self.assertEqual(
+            [102, None, 100, 102],
+            self.db.steam_ids_from_user_ids(keys))
+        self.assertEqual(
+            [False, True, False],
+            self.db.already_traded_many(user_ids[0], ["x", "item", "y"]))
+        self.assertEqual(
+            [False],
+            self.db.already_traded_many(user_ids[1], ["item"]))
+        self.assertEqual([], self.db.usernames_from_user_ids([]))
+
+        many = list(range(1, 2000))
+        usernames = self.db.usernames_from_user_ids(many)
+        self.assertEqual(len(many), len(usernames))
+        self.assertEqual("101", usernames[user_ids[1] - 1])
+
+    def test_login_steam_user(self):
+        user_id = self.db.login_steam_user("76561197960265728")
+        self.assertIsNot(None, user_id)
+        self.assertEqual(
+            "76561197960265728",
+            self.db.username_from_user_id(user_id))
+        self.assertEqual(
+            76561197960265728,
+            self.db.steam_id_from_user_id(user_id))
+
+        self.assertEqual(
+            user_id,
+            self.db.login_steam_user("76561197960265728"))
+        self.assertNotEqual(
+            user_id,
+            self.db.login_steam_user("76561197960265729"))
+
+    def test_login_steam_user_with_legacy_account(self):
+        self.db.register_user("123", "")
+        user_id = self.db.check_username_and_password("123", "")
+        self.assertEqual(user_id, self.db.login_steam_user("123"))
+        self.assertEqual(user_id, self.db.user_id_from_steam_id("123"))
+
     def test_beans(self):
         beans = [
             Bean(*args)
@@ -71,6 +123,18 @@ class TestDatabase(unittest.TestCase):
         bean_ids[1] = 999
         self.assertEqual(None, self.db.list_beans_from_bean_ids(bean_ids)[1])
 
+    def test_beans_keyset_pagination(self):
+        self.db.populate_beans([
+            Bean(name, name, 1, 1) for name in ("a", "b", "c", "d", "e")
+        ])
+
+        names = [b.name for _, b in self.db.list_beans(after=("b",))]
+        self.assertEqual(["c", "d", "e"], names)
+        names = [b.name for _, b in self.db.list_beans(after=("b",), count=2)]
+        self.assertEqual(["c", "d"], names)
+        names = [b.name for _, b in self.db.list_beans(before=("d",), count=2)]
+        self.assertEqual(["b", "c"], names)
+
     def test_inventory(self):
         self.db.register_user("test", "test")
         user_id = self.db.check_username_and_password("test", "test")
@@ -113,3 +177,218 @@ class TestDatabase(unittest.TestCase):
 
         self.assertTrue(self.db.already_traded(user_id, "item"))
         self.assertFalse(self.db.already_traded(user_id, "notitem"))
+
+    def test_trades_keyset_pagination(self):
+        user_id = self.db.login_steam_user("123")
+        for i in range(5):
+            self.db.record_trade(user_id, "item%d" % i)
+
+        trades = self.db.list_trades_from_user_id(user_id)
+        self.assertEqual(
+            ["item%d" % i for i in range(5)],
+            [item for _, item, _ in trades])
+
+        trade_id, _, timestamp = trades[1]
+        after = self.db.list_trades_from_user_id(
+            user_id, after=(str(timestamp), trade_id), count=2)
+        self.assertEqual(trades[2:4], after)
+
+        trade_id, _, timestamp = trades[4]
+        before = self.db.list_trades_from_user_id(
+            user_id, before=(str(timestamp), trade_id), count=3)
+        self.assertEqual(trades[1:4], before)
+
+    def test_user_version(self):
+        user_id = self.db.login_steam_user("123")
+        self.db.populate_beans([Bean("a", "a", 1, 1)])
+        (bean_id, _), = self.db.list_beans()
+        self.assertEqual(0, self.db.user_version(user_id))
+
+        self.db.record_trade(user_id, "item")
+        self.assertEqual(1, self.db.user_version(user_id))
+        self.db.give_user_id_beans(user_id, [(bean_id, 1)])
+        self.assertEqual(2, self.db.user_version(user_id))
+        self.db.redeem_items(user_id, [("item", bean_id, 1)])
+        self.assertEqual(2, self.db.user_version(user_id))
+        self.db.redeem_items(user_id, [("other", bean_id, 1)])
+        self.assertEqual(3, self.db.user_version(user_id))
+
+    def test_redeem_items(self):
+        self.db.register_user("test", "test")
+        user_id = self.db.check_username_and_password("test", "test")
+        self.db.populate_beans([Bean("a", "a", 1, 1), Bean("b", "b", 2, 2)])
+        (a_id, _), (b_id, _) = self.db.list_beans()
+
+        self.assertEqual(
+            [True, True, False],
+            self.db.redeem_items(
+                user_id,
+                [("x", a_id, 1), ("y", a_id, 2), ("x", b_id, 3)]))
+        self.assertEqual(
+            [False, True],
+            self.db.redeem_items(user_id, [("y", b_id, 4), ("z", b_id, 5)]))
+
+        inventory = self.db.list_inventory_from_user_id(user_id)
+        self.assertEqual(
+            [(a_id, 3), (b_id, 5)],
+            [(bean_id, qty) for bean_id, qty, _ in inventory])
+        self.assertEqual(3, len(self.db.list_trades_from_user_id(user_id)))
+
+    def test_concurrent_redemptions(self):
+        self.db.populate_beans([Bean("a", "a", 1, 1)])
+        (a_id, _), = self.db.list_beans()
+        user_ids = [self.db.login_steam_user(str(i)) for i in range(4)]
+        items = ["item%d" % i for i in range(50)]
+        start = threading.Barrier(len(user_ids))
+        results = {}
+        errors = []
+
+        def redeem(user_id):
+            db = Database(self.db_file_path, shards=self.db.shards)
+            try:
+                start.wait()
+                results[user_id] = [
+                    db.redeem_items(user_id, [(item, a_id, 1)])[0]
+                    for item in items]
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+
+        threads = [
+            threading.Thread(target=redeem, args=(user_id,))
+            for user_id in user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        for i in range(len(items)):
+            self.assertEqual(
+                1, sum(results[user_id][i] for user_id in user_ids))
+
+    def test_redemption_locks_other_shards(self):
+        self.db.populate_beans([Bean("a", "a", Color.RED, Quality.COMMON)])
+        (a_id, _), = self.db.list_beans()
+        user_ids = [self.db.login_steam_user(str(i)) for i in range(12)]
+        first = user_ids[0]
+        second = next(
+            (user_id for user_id in user_ids
+             if self.db._shard(user_id) != self.db._shard(first)),
+            user_ids[1])
+        other = Database(self.db_file_path, shards=self.db.shards)
+        other.db.execute("PRAGMA busy_timeout = 0")
+        select_in = self.db._select_in
+        raced = []
+
+        def racing_select_in(*args):
+            rows = list(select_in(*args))
+            if not raced:
+                # A user on another shard redeems the same item right after
+                # this one checked that it was not traded yet.
+                try:
+                    raced.append(
+                        other.redeem_items(second, [("knife", a_id, 1)]))
+                except sqlite3.OperationalError as e:
+                    raced.append(e)
+            return iter(rows)
+
+        with patch.object(self.db, "_select_in", racing_select_in):
+            self.assertEqual(
+                [True], self.db.redeem_items(first, [("knife", a_id, 1)]))
+        self.assertIsInstance(raced[0], sqlite3.OperationalError)
+        self.assertEqual([False], other.redeem_items(
+            second, [("knife", a_id, 1)]))
+        other.close()
+
+    def test_gift_counts_under_write_lock(self):
+        self.db.populate_beans([Bean("a", "a", Color.RED, Quality.COMMON)])
+        (a_id, _), = self.db.list_beans()
+        user_id = self.db.login_steam_user("1")
+        other = Database(self.db_file_path, shards=self.db.shards)
+        other.db.execute("PRAGMA busy_timeout = 0")
+        select_in = self.db._select_in
+        raced = []
+
+        def racing_select_in(*args):
+            rows = list(select_in(*args))
+            if not raced:
+                # Another worker gives the same bean right after this one
+                # read which beans the user owns.
+                try:
+                    other.give_user_id_beans(user_id, [(a_id, 1)])
+                    raced.append(None)
+                except sqlite3.OperationalError as e:
+                    raced.append(e)
+            return iter(rows)
+
+        with patch.object(self.db, "_select_in", racing_select_in):
+            self.db.give_user_id_beans(user_id, [(a_id, 1)])
+        other.close()
+
+        self.assertIsInstance(raced[0], sqlite3.OperationalError)
+        self.assertEqual((1, 0, 1), self.db.user_stats(user_id))
+        self.assertEqual(0, self.db.check_stats())
+
+    def test_user_stats(self):
+        self.db.populate_beans([
+            Bean("a", "a", Color.RED, Quality.MYTHIC),
+            Bean("b", "b", Color.RED, Quality.COMMON),
+            Bean("c", "c", Color.BLUE, Quality.COMMON),
+        ])
+        (a_id, _), (b_id, _), (c_id, _) = self.db.list_beans()
+        user_ids = [self.db.login_steam_user(str(i)) for i in range(3)]
+        self.assertEqual((0, 0, 0), self.db.user_stats(user_ids[0]))
+
+        self.db.give_user_id_beans(user_ids[0], [(a_id, 2), (b_id, 1)])
+        self.db.give_user_id_beans(user_ids[0], [(a_id, 1)])
+        self.db.redeem_items(
+            user_ids[1], [("x", b_id, 3), ("y", c_id, 4), ("z", b_id, 1)])
+        self.db.give_user_id_beans(user_ids[2], [(c_id, 1)])
+
+        self.assertEqual((4, 3, 2), self.db.user_stats(user_ids[0]))
+        self.assertEqual((8, 0, 2), self.db.user_stats(user_ids[1]))
+        self.assertEqual(
+            ({Quality.MYTHIC: 3, Quality.COMMON: 1}, {Color.RED: 4}),
+            self.db.user_breakdown(user_ids[0]))
+        self.assertEqual(
+            ({Quality.COMMON: 8}, {Color.RED: 4, Color.BLUE: 4}),
+            self.db.user_breakdown(user_ids[1]))
+
+        self.assertEqual(
+            [user_ids[1], user_ids[0]],
+            [row[0] for row in self.db.top_collectors("total", 2)])
+        self.assertEqual(
+            [user_ids[0], user_ids[1], user_ids[2]],
+            [row[0] for row in self.db.top_collectors("mythic", 3)])
+        self.assertEqual(
+            [(user_ids[0], 4, 3, 2), (user_ids[1], 8, 0, 2)],
+            self.db.top_collectors("distinct_beans", 2))
+        with self.assertRaises(ValueError):
+            self.db.top_collectors("qty", 1)
+
+        self.assertEqual(0, self.db.check_stats())
+        with self.db.db:
+            self.db.db.execute(
+                "UPDATE {}.user_stats SET total = 0 WHERE user_id = ?"
+                .format(self.db._shard(user_ids[0])),
+                (user_ids[0],))
+        self.assertEqual(1, self.db.check_stats())
+        self.db.rebuild_stats()
+        self.assertEqual(0, self.db.check_stats())
+        self.assertEqual((4, 3, 2), self.db.user_stats(user_ids[0]))
+
+
+class TestShardedDatabase(TestDatabase):
+    """Runs every database test with per-user rows spread over shards."""
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.db = Database(self.db_file_path, shards=3)
+        self.db.migrate()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.db_dir)
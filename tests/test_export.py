@@ -0,0 +1,116 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from csgobeans import export
+from csgobeans.db import Database
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.db = Database(self.db_file_path)
+        self.db.migrate()
+        self.db.populate_beans_from_file()
+
+        self.user_ids = [self.db.login_steam_user(str(i)) for i in (1, 2)]
+        for user_id in self.user_ids:
+            for i in range(3):
+                self.db.record_trade(user_id, "%d-%d" % (user_id, i))
+            self.db.give_user_id_beans(user_id, [(1, 2)])
+
+        self.connection = export.connect_readonly(self.db_file_path)
+
+    def tearDown(self):
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.db_dir)
+
+    def test_export_jsonl_gzip(self):
+        out_dir = os.path.join(self.db_dir, 'out')
+        os.mkdir(out_dir)
+        counts = export.export_tables(
+            self.connection, sorted(export.TABLES), out_dir)
+        self.assertEqual(
+            {'auth': 2, 'inventory': 2, 'steam': 2, 'trades': 6}, counts)
+
+        with gzip.open(os.path.join(out_dir, 'trades.jsonl.gz'), 'rt') as f:
+            trades = [json.loads(line) for line in f]
+        self.assertEqual(
+            ["%d-%d" % (u, i) for u in self.user_ids for i in range(3)],
+            [trade['item'] for trade in trades])
+
+    def test_export_csv_filtered(self):
+        out_dir = os.path.join(self.db_dir, 'out')
+        os.mkdir(out_dir)
+        counts = export.export_tables(
+            self.connection,
+            ['trades'],
+            out_dir,
+            'csv',
+            compress=False,
+            user_id=self.user_ids[1],
+            since='2000-01-01',
+            until='9999-01-01')
+        self.assertEqual({'trades': 3}, counts)
+
+        with open(os.path.join(out_dir, 'trades.csv'), newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(list(export.TABLES['trades']), rows[0])
+        self.assertEqual(
+            [str(self.user_ids[1])] * 3, [row[1] for row in rows[1:]])
+
+        counts = export.export_tables(
+            self.connection, ['trades'], out_dir, 'csv', compress=False,
+            until='2000-01-01')
+        self.assertEqual({'trades': 0}, counts)
+
+    def test_snapshot(self):
+        destination = os.path.join(self.db_dir, 'snapshot.sqlite')
+        steps = []
+        export.snapshot(
+            self.connection, destination, pages=2, sleep=0,
+            progress=lambda status, remaining, total: steps.append(remaining))
+        self.assertGreater(len(steps), 1)
+
+        copy = sqlite3.connect(destination)
+        self.assertEqual(
+            6, copy.execute('SELECT count(*) FROM trades').fetchone()[0])
+        copy.close()
+
+    def test_snapshot_in_one_step(self):
+        destination = os.path.join(self.db_dir, 'snapshot.sqlite')
+        steps = []
+        export.snapshot(
+            self.connection, destination,
+            progress=lambda status, remaining, total: steps.append(remaining))
+        self.assertEqual([0], steps)
+
+    def test_snapshot_gives_up_on_restarts(self):
+        destination = os.path.join(self.db_dir, 'snapshot.sqlite')
+        writes = []
+
+        def write(status, remaining, total):
+            writes.append(remaining)
+            self.db.record_trade(self.user_ids[0], 'w%d' % len(writes))
+
+        with self.assertRaises(export.SnapshotError):
+            export.snapshot(
+                self.connection, destination, pages=1, sleep=0,
+                progress=write, max_restarts=3)
+        self.assertFalse(os.path.exists(destination))
+
+    def test_readonly_path_is_quoted(self):
+        path = os.path.join(self.db_dir, 'a?b#c%20d', 'testdb.sql')
+        os.mkdir(os.path.dirname(path))
+        shutil.copy(self.db_file_path, path)
+        connection = export.connect_readonly(path)
+        self.assertEqual(
+            6, connection.execute('SELECT count(*) FROM trades').fetchone()[0])
+        connection.close()
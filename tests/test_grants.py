@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from csgobeans import grants
+from csgobeans import shards
+from csgobeans.beans import Bean, Color, Quality
+from csgobeans.db import Database
+
+
+class TestGrants(unittest.TestCase):
+    shards = 0
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.db = Database(self.db_file_path, shards=self.shards)
+        self.db.migrate()
+        self.db.populate_beans([
+            Bean('a', 'A bean', Color.RED, Quality.MYTHIC),
+            Bean('b', 'B bean', Color.BLUE, Quality.COMMON),
+        ])
+        self.bean_ids = dict(
+            (bean.name, bean_id) for bean_id, bean in self.db.list_beans())
+        self.user_ids = [self.db.login_steam_user(i) for i in range(1, 7)]
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.db_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.db_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def rebalance(self, count):
+        self.db.close()
+        db = Database(self.db_file_path, shards=max(self.shards, count))
+        db.migrate_shards(count)
+        shards.rebalance(db.db, self.shards, count)
+        shards.store_shards(db.db, count)
+        db.close()
+        self.db = Database(self.db_file_path, shards=count)
+
+    def interrupt_second_chunk(self, path):
+        chunk = self.db.grant_beans_chunk
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return chunk(*args)
+
+        with patch.object(self.db, 'grant_beans_chunk', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                grants.grant_beans(self.db, 'launch', path, chunk_size=3)
+
+    def inventory(self, user_id):
+        return dict(
+            (bean.name, qty) for _, qty, bean
+            in self.db.list_inventory_from_user_id(user_id))
+
+    def test_grant(self):
+        path = self.write(
+            'drop.csv',
+            'steam_id,bean_name,qty\n'
+            + ''.join('%d,a,1\n%d,b,2\n' % (i, i) for i in range(1, 7))
+            + '1,a,3\n99,a,1\n2,zzz,1\n3,b,-1\nbad\n')
+        unknown = []
+        result = grants.grant_beans(
+            self.db, 'launch', path, chunk_size=4,
+            on_unknown=unknown.append)
+
+        self.assertEqual(13, result.granted)
+        self.assertEqual(4, result.unknown)
+        self.assertEqual(
+            [15, 16, 17, 18], sorted(row.line_no for row in unknown))
+        self.assertEqual({'a': 4, 'b': 2}, self.inventory(self.user_ids[0]))
+        self.assertEqual({'a': 1, 'b': 2}, self.inventory(self.user_ids[5]))
+        self.assertEqual((6, 4, 2), self.db.user_stats(self.user_ids[0]))
+        self.assertEqual(0, self.db.check_stats())
+        self.assertEqual(18, self.db.grant_progress('launch'))
+
+    def test_rerun_is_idempotent(self):
+        path = self.write('drop.jsonl', ''.join(
+            json.dumps({'steam_id': i, 'bean_name': 'a', 'qty': 1}) + '\n'
+            for i in range(1, 7)))
+        grants.grant_beans(self.db, 'launch', path, chunk_size=2)
+        result = grants.grant_beans(self.db, 'launch', path, chunk_size=2)
+        self.assertEqual(0, result.granted)
+        self.assertEqual(6, result.resumed_from)
+        for user_id in self.user_ids:
+            self.assertEqual({'a': 1}, self.inventory(user_id))
+
+        grants.grant_beans(self.db, 'encore', path)
+        for user_id in self.user_ids:
+            self.assertEqual({'a': 2}, self.inventory(user_id))
+
+    def test_resume_after_interruption(self):
+        path = self.write('drop.csv', ''.join(
+            '%d,b,1\n' % i for i in range(1, 7)))
+        self.interrupt_second_chunk(path)
+
+        result = grants.grant_beans(self.db, 'launch', path, chunk_size=3)
+        self.assertEqual(3, result.resumed_from)
+        self.assertEqual(3, result.granted)
+        for user_id in self.user_ids:
+            self.assertEqual({'b': 1}, self.inventory(user_id))
+
+    def test_resume_after_rebalance(self):
+        path = self.write('drop.csv', ''.join(
+            '%d,b,1\n' % i for i in range(1, 7)))
+        self.interrupt_second_chunk(path)
+        self.rebalance(2 if self.shards else 3)
+
+        result = grants.grant_beans(self.db, 'launch', path, chunk_size=3)
+        self.assertEqual(3, result.resumed_from)
+        for user_id in self.user_ids:
+            self.assertEqual({'b': 1}, self.inventory(user_id))
+
+    def test_chunk_applied_twice(self):
+        grant = [(1, self.user_ids[0], self.bean_ids['a'], 2)]
+        self.assertEqual(1, self.db.grant_beans_chunk('launch', 1, grant))
+        self.assertEqual(0, self.db.grant_beans_chunk('launch', 1, grant))
+        self.assertEqual({'a': 2}, self.inventory(self.user_ids[0]))
+        self.assertEqual(1, self.db.user_version(self.user_ids[0]))
+
+
+class TestShardedGrants(TestGrants):
+    shards = 3
+
+    def test_rebalance_refuses_partial_chunk(self):
+        grant = [
+            (1, user_id, self.bean_ids['a'], 1) for user_id in self.user_ids]
+        apply = self.db._apply_grant_chunk
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return apply(*args)
+
+        with patch.object(self.db, '_apply_grant_chunk', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.db.grant_beans_chunk('launch', 1, grant)
+        with self.assertRaises(shards.ShardLayoutError):
+            shards.rebalance(self.db.db, self.shards, 2)
+
+        self.db.grant_beans_chunk('launch', 1, grant)
+        self.rebalance(2)
+        self.assertEqual(1, self.db.grant_progress('launch'))
+        for user_id in self.user_ids:
+            self.assertEqual({'a': 1}, self.inventory(user_id))
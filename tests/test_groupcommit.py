@@ -0,0 +1,175 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from csgobeans import groupcommit
+from csgobeans.db import Database
+from csgobeans.groupcommit import GroupCommitWriter
+from csgobeans.pool import ConnectionPool
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.pool = ConnectionPool(self.db_file_path)
+        db = self.checkout()
+        db.migrate()
+        db.populate_beans_from_file()
+        self.user_ids = [db.login_steam_user(str(i)) for i in range(8)]
+        db.close()
+        self.writer = None
+
+    def tearDown(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.pool.close()
+        shutil.rmtree(self.db_dir)
+
+    def checkout(self):
+        return Database(
+            self.db_file_path,
+            connection=self.pool.checkout(),
+            release=self.pool.checkin)
+
+    def start(self, **options):
+        def connect():
+            return Database(self.db_file_path, connection=self.pool.connect())
+        self.writer = GroupCommitWriter(connect, **options)
+        return self.writer
+
+    def redeem(self, user_id, item):
+        return lambda db: db.apply_redemptions(user_id, [(item, 1, 1)])
+
+    def test_concurrent_writes_share_commits(self):
+        writer = self.start(max_batch=16, max_delay=0.05)
+        results = {}
+
+        def trade(user_id):
+            results[user_id] = [
+                writer.run(self.redeem(user_id, '%d-%d' % (user_id, i)))
+                for i in range(5)]
+
+        threads = [
+            threading.Thread(target=trade, args=(user_id,))
+            for user_id in self.user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for user_id in self.user_ids:
+            self.assertEqual([[True]] * 5, results[user_id])
+        stats = writer.stats()
+        self.assertEqual(40, stats['committed'])
+        self.assertLess(stats['batches'], 40)
+
+        db = self.checkout()
+        for user_id in self.user_ids:
+            self.assertEqual(5, len(db.list_trades_from_user_id(user_id)))
+            self.assertEqual(5, db.user_version(user_id))
+        db.close()
+
+    def test_duplicates_in_one_batch(self):
+        writer = self.start(max_batch=8, max_delay=0.05)
+        futures = [
+            writer.submit(self.redeem(user_id, 'knife'))
+            for user_id in self.user_ids[:3]]
+        self.assertEqual(
+            [[True], [False], [False]],
+            [future.result() for future in futures])
+
+    def test_failed_write_is_rolled_back_alone(self):
+        writer = self.start(max_batch=8, max_delay=0.05)
+
+        def fail(db):
+            db.apply_redemptions(self.user_ids[1], [('lost', 1, 1)])
+            raise ValueError('rejected')
+
+        kept = writer.submit(self.redeem(self.user_ids[0], 'kept'))
+        failed = writer.submit(fail)
+        self.assertEqual([True], kept.result())
+        with self.assertRaises(ValueError):
+            failed.result()
+        self.assertEqual(1, writer.stats()['failed'])
+
+        db = self.checkout()
+        self.assertTrue(db.already_traded(self.user_ids[0], 'kept'))
+        self.assertFalse(db.already_traded(self.user_ids[1], 'lost'))
+        self.assertEqual(0, db.user_version(self.user_ids[1]))
+        db.close()
+
+    def test_async(self):
+        writer = self.start(durability=groupcommit.ASYNC)
+        self.assertEqual(
+            [True], writer.run(self.redeem(self.user_ids[0], 'a')))
+        writer.close()
+
+        db = self.checkout()
+        self.assertTrue(db.already_traded(self.user_ids[0], 'a'))
+        db.close()
+
+    def test_connect_failure(self):
+        def connect():
+            raise OSError('no database')
+        self.writer = GroupCommitWriter(connect)
+        with self.assertRaises(OSError):
+            self.writer.run(self.redeem(self.user_ids[0], 'a'))
+
+    def test_sharded_batch_holds_its_write_locks(self):
+        path = os.path.join(self.db_dir, 'sharded.sql')
+        db = Database(path, shards=2)
+        db.migrate()
+        db.populate_beans_from_file()
+        user_id = db.login_steam_user('1')
+        db.close()
+        pool = ConnectionPool(path, shards=2)
+        blocked = []
+
+        def write(db):
+            db.already_traded_many(user_id, ['x'])
+            # Another process writes to the user's shard after this batch
+            # read it.
+            other = Database(path, shards=2)
+            other.db.execute('PRAGMA busy_timeout = 0')
+            try:
+                other.record_trade(user_id, 'other')
+            except sqlite3.OperationalError:
+                blocked.append(True)
+            finally:
+                other.close()
+            return db.apply_redemptions(user_id, [('item', 1, 1)])
+
+        self.writer = GroupCommitWriter(
+            lambda: Database(path, connection=pool.connect(), shards=2))
+        try:
+            self.assertEqual([True], self.writer.run(write))
+        finally:
+            self.writer.close()
+            pool.close()
+        self.assertEqual([True], blocked)
+
+    def test_closed_at_exit(self):
+        with patch('atexit.register') as register:
+            writer = self.start()
+        register.assert_called_once_with(writer.close)
+
+    def test_close_after_fork(self):
+        writer = self.start()
+        writer.run(self.redeem(self.user_ids[0], 'parent'))
+        pid = os.fork()
+        if pid == 0:
+            # The child inherits the parent's thread object but not the
+            # thread, and must not wait for it.
+            writer.close()
+            os._exit(0)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+
+    def test_invalid_durability(self):
+        with self.assertRaises(ValueError):
+            GroupCommitWriter(None, durability=groupcommit.REQUEST)
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from csgobeans import importer
+from csgobeans.beans import Bean, Color, Quality
+from csgobeans.db import Database
+
+
+class TestImporter(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.db_dir, 'testdb.sql'))
+        self.db.migrate()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.db_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.db_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def bean_names(self):
+        return [bean.name for _, bean in self.db.list_beans()]
+
+    def test_formats(self):
+        semicolon = self.write('beans', 'a;A bean;1;1\nb;B bean;2;2\n')
+        csv_path = self.write(
+            'beans.csv',
+            'bean_name,short_desc,color,quality\n"c, d",C bean,RED,MYTHIC\n')
+        jsonl = self.write('beans.jsonl', json.dumps({
+            'name': 'e', 'short_desc': 'E bean', 'color': 'blue',
+            'quality': 3}) + '\n')
+
+        for path in (semicolon, csv_path, jsonl):
+            importer.import_beans(self.db, path)
+
+        beans = dict((b.name, b) for _, b in self.db.list_beans())
+        self.assertEqual(['a', 'b', 'c, d', 'e'], sorted(beans))
+        self.assertEqual(Bean('c, d', 'C bean', 1, 4), beans['c, d'])
+        self.assertEqual(Color.BLUE, beans['e'].color)
+        self.assertEqual(Quality.RARE, beans['e'].quality)
+
+    def test_upsert_and_rejects(self):
+        path = self.write('beans', 'a;A bean;1;1\nbad line\nb;B;42;1\n')
+        rejected = []
+        result = importer.import_beans(
+            self.db, path, on_reject=rejected.append)
+        self.assertEqual((3, 1, 2, 0), tuple(result))
+        self.assertEqual([2, 3], [r.line_no for r in rejected])
+
+        path = self.write('beans', 'a;Updated;2;2\n')
+        importer.import_beans(self.db, path)
+        (_, bean), = self.db.list_beans()
+        self.assertEqual(Bean('a', 'Updated', 2, 2), bean)
+
+    def test_resume_after_crash(self):
+        path = self.write('beans', ''.join(
+            'bean%02d;desc;1;1\n' % i for i in range(10)))
+
+        def crash(line_no, imported, rejected, elapsed):
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            importer.import_beans(
+                self.db, path, chunk_size=4, on_progress=crash)
+        self.assertEqual(4, len(self.bean_names()))
+
+        result = importer.import_beans(self.db, path, chunk_size=4)
+        self.assertEqual(4, result.resumed_from)
+        self.assertEqual(10, result.imported)
+        self.assertEqual(10, len(self.bean_names()))
+
+        result = importer.import_beans(self.db, path, chunk_size=4)
+        self.assertEqual(0, result.resumed_from)
@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from csgobeans.jsonstream import JSONStream
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestJSONStream(unittest.TestCase):
+    DOCUMENT = {
+        "a": {"x": 1, "y": [1, 2, {"z": None}]},
+        "b": [12345, -1.5e3, "str\"ing", True, False, None, {}, []],
+        "c": {},
+        "d": "é",
+    }
+
+    def walk(self, stream):
+        result = {}
+        for key in stream.iter_object():
+            if key == "a":
+                result[key] = {}
+                for inner in stream.iter_object():
+                    result[key][inner] = stream.value()
+            elif key == "b":
+                result[key] = []
+                for _ in stream.iter_array():
+                    result[key].append(stream.value())
+            elif key == "c":
+                stream.skip()
+            else:
+                result[key] = stream.value()
+        return result
+
+    def test_walk_in_any_chunk_size(self):
+        text = json.dumps(self.DOCUMENT, indent=1)
+        expected = dict(self.DOCUMENT)
+        del expected["c"]
+        for size in (1, 2, 3, 7, len(text)):
+            stream = JSONStream(chunked(text, size), compact_at=4)
+            self.assertEqual(expected, self.walk(stream), size)
+
+    def test_truncated(self):
+        text = json.dumps(self.DOCUMENT)
+        with self.assertRaises(ValueError):
+            self.walk(JSONStream(chunked(text[:-10], 4)))
@@ -0,0 +1,86 @@
+import sqlite3
+import time
+import unittest
+
+from csgobeans import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_and_gauge(self):
+        registry = metrics.Registry()
+        counter = registry.register(
+            metrics.Counter('test_total', 'Test.', ('kind',)))
+        gauge = registry.register(metrics.Gauge('test_size', 'Size.'))
+        counter.inc(1, 'a')
+        counter.inc(2, 'a')
+        counter.inc(1, 'b"')
+        gauge.set(7)
+
+        self.assertEqual(
+            '# HELP test_total Test.\n'
+            '# TYPE test_total counter\n'
+            'test_total{kind="a"} 3\n'
+            'test_total{kind="b\\""} 1\n'
+            '# HELP test_size Size.\n'
+            '# TYPE test_size gauge\n'
+            'test_size 7\n',
+            registry.render())
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual([
+            'test_seconds_bucket{le="1"} 2',
+            'test_seconds_bucket{le="2"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 6.0',
+            'test_seconds_count 4',
+        ], list(histogram.lines()))
+        self.assertEqual(4, histogram.count())
+
+    def test_instrumented_connection(self):
+        connection = sqlite3.connect(
+            ':memory:',
+            isolation_level='IMMEDIATE',
+            factory=metrics.InstrumentedConnection)
+        statements = metrics.SQL_STATEMENTS.value()
+        commits = metrics.SQL_COMMITS.value()
+
+        connection.execute('CREATE TABLE t (x INTEGER)')
+        with connection:
+            connection.executemany(
+                'INSERT INTO t VALUES (?)', [(1,), (2,)])
+        connection.cursor().execute('SELECT x FROM t').fetchall()
+        connection.execute('INSERT INTO t VALUES (3)')
+        connection.commit()
+        connection.close()
+
+        self.assertEqual(4, metrics.SQL_STATEMENTS.value() - statements)
+        self.assertEqual(2, metrics.SQL_COMMITS.value() - commits)
+
+    def test_instrumented_cursor_times_fetches(self):
+        connection = sqlite3.connect(
+            ':memory:', factory=metrics.InstrumentedConnection)
+        connection.create_function(
+            'slow', 1, lambda x: time.sleep(0.01) or x)
+        connection.execute('CREATE TABLE t (x INTEGER)')
+        connection.executemany('INSERT INTO t VALUES (?)', [(1,), (2,), (3,)])
+
+        # execute() only steps to the first row, the rest are stepped as
+        # they are fetched.
+        for fetch in (
+            lambda cursor: cursor.fetchall(),
+            lambda cursor: [cursor.fetchone() for _ in range(3)],
+            lambda cursor: cursor.fetchmany(3),
+        ):
+            statements = metrics.SQL_STATEMENTS.value()
+            seconds = metrics.SQL_SECONDS.value()
+            self.assertEqual(
+                [(1,), (2,), (3,)],
+                fetch(connection.execute('SELECT slow(x) FROM t')))
+            self.assertEqual(1, metrics.SQL_STATEMENTS.value() - statements)
+            self.assertGreaterEqual(
+                metrics.SQL_SECONDS.value() - seconds, 0.03)
+        connection.close()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from csgobeans import migrate
+from csgobeans.db import Database
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE auth (
+  user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL
+);
+CREATE TABLE steam (
+  steam_id INTEGER PRIMARY KEY,
+  user_id INTEGER NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES auth (user_id)
+);
+CREATE TABLE trades (
+  trade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  item TEXT UNIQUE NOT NULL,
+  trade_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (user_id) REFERENCES auth (user_id)
+);
+"""
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.connection = sqlite3.connect(self.db_file_path)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.db_dir)
+
+    def index_names(self):
+        return set(name for name, in self.connection.execute(
+            "SELECT name FROM sqlite_master"
+            " WHERE type = 'index' AND sql IS NOT NULL"))
+
+    def test_migrate_fresh_database(self):
+        applied = migrate.migrate(self.connection)
+        self.assertEqual(migrate.MIGRATIONS, applied)
+        self.assertEqual(
+            migrate.LATEST_VERSION,
+            migrate.schema_version(self.connection))
+        self.assertIn('trades_user_id_trade_timestamp', self.index_names())
+
+        self.assertEqual([], migrate.migrate(self.connection))
+
+    def test_migrate_legacy_database_keeps_data(self):
+        self.connection.executescript(LEGACY_SCHEMA)
+        self.connection.executemany(
+            'INSERT INTO trades (user_id, item) VALUES (?, ?)',
+            [(i % 3, 'item%d' % i) for i in range(50)])
+        self.connection.commit()
+
+        migrate.migrate(self.connection, batch_size=7, pause=0)
+
+        self.assertEqual(
+            migrate.LATEST_VERSION,
+            migrate.schema_version(self.connection))
+        self.assertIn('trades_user_id_trade_timestamp', self.index_names())
+        self.assertEqual(
+            [(i + 1, 'item%d' % i) for i in range(50)],
+            self.connection.execute(
+                'SELECT trade_id, item FROM trades ORDER BY trade_id'
+            ).fetchall())
+
+        self.connection.execute(
+            'INSERT INTO trades (user_id, item) VALUES (?, ?)', (1, 'new'))
+        self.assertEqual(
+            51,
+            self.connection.execute(
+                "SELECT trade_id FROM trades WHERE item = 'new'"
+            ).fetchone()[0])
+
+    def test_online_index_keeps_autoincrement_sequence(self):
+        self.connection.executescript(LEGACY_SCHEMA)
+        self.connection.executemany(
+            'INSERT INTO trades (user_id, item) VALUES (?, ?)',
+            [(1, 'item%d' % i) for i in range(20)])
+        self.connection.execute('DELETE FROM trades WHERE trade_id = 20')
+        self.connection.commit()
+
+        migrate.migrate(self.connection, batch_size=7, pause=0)
+
+        self.connection.execute(
+            'INSERT INTO trades (user_id, item) VALUES (?, ?)', (1, 'new'))
+        self.assertEqual(
+            21,
+            self.connection.execute(
+                "SELECT trade_id FROM trades WHERE item = 'new'"
+            ).fetchone()[0])
+
+    def test_online_index_mirrors_concurrent_writes(self):
+        migrate.migrate(self.connection, target=2)
+        self.connection.executemany(
+            'INSERT INTO trades (user_id, item) VALUES (?, ?)',
+            [(1, 'item%d' % i) for i in range(20)])
+        self.connection.commit()
+
+        writer = sqlite3.connect(self.db_file_path)
+        messages = []
+
+        def progress(message):
+            messages.append(message)
+            writer.execute(
+                "DELETE FROM trades WHERE item = 'item0'")
+            writer.execute(
+                "UPDATE trades SET user_id = 2 WHERE item = 'item19'")
+            writer.execute(
+                "INSERT INTO trades (user_id, item) VALUES (3, ?)",
+                (message,))
+            writer.commit()
+
+        migrate.migrate(
+            self.connection, batch_size=5, pause=0, progress=progress)
+        writer.close()
+
+        rows = self.connection.execute(
+            'SELECT user_id, item FROM trades ORDER BY trade_id').fetchall()
+        self.assertNotIn((1, 'item0'), rows)
+        self.assertIn((2, 'item19'), rows)
+        self.assertEqual(19 + len(messages), len(rows))
+
+    def test_database_migrate(self):
+        db = Database(self.db_file_path)
+        db.migrate()
+        self.assertEqual(migrate.LATEST_VERSION, db.schema_version())
+        db.close()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from csgobeans.db import Database
+from csgobeans.pool import ConnectionPool, PoolTimeout
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sql')
+        self.pool = ConnectionPool(self.db_file_path, max_size=4)
+
+        db = Database(
+            self.db_file_path,
+            connection=self.pool.checkout(),
+            release=self.pool.checkin)
+        db.migrate()
+        db.close()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.db_dir)
+
+    def test_reuses_connections(self):
+        connection = self.pool.checkout()
+        self.pool.checkin(connection)
+        self.assertIs(connection, self.pool.checkout())
+        self.assertEqual(1, self.pool.size)
+
+    def test_pragmas(self):
+        connection = self.pool.checkout()
+        self.assertEqual(
+            'wal',
+            connection.execute('PRAGMA journal_mode').fetchone()[0])
+        self.assertEqual(
+            1,
+            connection.execute('PRAGMA synchronous').fetchone()[0])
+        self.assertEqual(
+            5000,
+            connection.execute('PRAGMA busy_timeout').fetchone()[0])
+
+    def test_bounded(self):
+        self.pool.timeout = 0.05
+        connections = [self.pool.checkout() for _ in range(4)]
+        with self.assertRaises(PoolTimeout):
+            self.pool.checkout()
+        self.pool.checkin(connections.pop())
+        self.pool.checkout()
+
+    def test_reset_on_checkin(self):
+        connection = self.pool.checkout()
+        connection.execute(
+            'INSERT INTO auth (username, password_hash) VALUES (?, ?)',
+            ("abc", ""))
+        self.pool.checkin(connection)
+
+        db = Database(
+            self.db_file_path,
+            connection=self.pool.checkout(),
+            release=self.pool.checkin)
+        self.assertIs(None, db.check_username_and_password("abc", ""))
+        db.close()
+        self.assertTrue(db.closed())
+
+    def test_concurrent_readers_and_writers(self):
+        errors = []
+
+        def work(worker):
+            try:
+                for i in range(25):
+                    db = Database(
+                        self.db_file_path,
+                        connection=self.pool.checkout(),
+                        release=self.pool.checkin)
+                    user_id = db.login_steam_user(str(worker * 1000 + i))
+                    db.record_trade(user_id, "%d-%d" % (worker, i))
+                    db.list_trades_from_user_id(user_id)
+                    db.close()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=work, args=(worker,))
+            for worker in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
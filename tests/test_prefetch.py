@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+
+from csgobeans import prefetch
+from csgobeans.prefetch import InventoryPrefetcher
+
+
+def wait_for(prefetcher, steam_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while prefetcher.status(steam_id).state == prefetch.PENDING:
+        if time.monotonic() > deadline:
+            raise AssertionError("Prefetch did not finish")
+        time.sleep(0.01)
+    return prefetcher.status(steam_id)
+
+
+class TestInventoryPrefetcher(unittest.TestCase):
+    def test_fetches_into_slot(self):
+        calls = []
+
+        def fetch(steam_id):
+            calls.append(steam_id)
+            return ([("1", "item")], False, 0)
+
+        prefetcher = InventoryPrefetcher(fetch, workers=2)
+        self.assertIsNone(prefetcher.status("a"))
+        self.assertTrue(prefetcher.submit("a"))
+
+        slot = wait_for(prefetcher, "a")
+        self.assertEqual(prefetch.READY, slot.state)
+        self.assertEqual([("1", "item")], slot.items)
+        self.assertEqual(["a"], calls)
+        self.assertEqual(1, prefetcher.stats()['done'])
+        prefetcher.close()
+
+    def test_pending_submit_is_not_repeated(self):
+        release = threading.Event()
+        calls = []
+
+        def fetch(steam_id):
+            calls.append(steam_id)
+            release.wait(5)
+            return ([], False, 0)
+
+        prefetcher = InventoryPrefetcher(fetch, workers=1)
+        self.assertTrue(prefetcher.submit("a"))
+        self.assertTrue(prefetcher.submit("a"))
+        release.set()
+        wait_for(prefetcher, "a")
+        self.assertEqual(["a"], calls)
+        self.assertEqual(1, prefetcher.stats()['submitted'])
+        prefetcher.close()
+
+    def test_full_queue_rejects(self):
+        release = threading.Event()
+
+        def fetch(steam_id):
+            release.wait(5)
+            return ([], False, 0)
+
+        prefetcher = InventoryPrefetcher(fetch, workers=1, queue_size=1)
+        self.assertTrue(prefetcher.submit("a"))
+        # Wait for the worker to take "a" so that "b" fills the queue.
+        while prefetcher.stats()['queued']:
+            time.sleep(0.01)
+        self.assertTrue(prefetcher.submit("b"))
+        self.assertFalse(prefetcher.submit("c"))
+        self.assertIsNone(prefetcher.status("c"))
+        self.assertEqual(1, prefetcher.stats()['rejected'])
+        release.set()
+        prefetcher.close()
+
+    def test_failure_and_deadline(self):
+        def fetch(steam_id):
+            raise ValueError("boom")
+
+        prefetcher = InventoryPrefetcher(fetch, workers=1)
+        prefetcher.submit("a")
+        self.assertEqual(prefetch.FAILED, wait_for(prefetcher, "a").state)
+        prefetcher.close()
+
+        prefetcher = InventoryPrefetcher(fetch, workers=1, deadline=0)
+        prefetcher.slots.put(
+            "b", prefetch.Slot(prefetch.PENDING, None, False, 0, 0))
+        self.assertEqual(prefetch.EXPIRED, prefetcher.status("b").state)
+
+    def test_disabled(self):
+        prefetcher = InventoryPrefetcher(lambda steam_id: None, workers=0)
+        self.assertFalse(prefetcher.submit("a"))
+        self.assertIsNone(prefetcher.status("a"))
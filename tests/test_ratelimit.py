@@ -0,0 +1,51 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from csgobeans.ratelimit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.db_dir, 'rate.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir)
+
+    def test_burst_then_reject(self):
+        bucket = TokenBucket(self.path, rate=1, burst=2)
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertEqual(0, bucket.try_acquire())
+        wait = bucket.try_acquire()
+        self.assertTrue(0 < wait <= 1)
+
+    def test_shared_between_workers(self):
+        TokenBucket(self.path, rate=1, burst=1).try_acquire()
+        other_worker = TokenBucket(self.path, rate=1, burst=1)
+        self.assertGreater(other_worker.try_acquire(), 0)
+
+    def test_locked_bucket_refuses(self):
+        bucket = TokenBucket(self.path, rate=1, burst=1)
+        bucket._connection().execute('PRAGMA busy_timeout = 0')
+        other_worker = sqlite3.connect(
+            self.path, timeout=0, isolation_level=None)
+        other_worker.execute('BEGIN IMMEDIATE')
+        try:
+            self.assertGreater(bucket.try_acquire(), 0)
+        finally:
+            other_worker.execute('ROLLBACK')
+            other_worker.close()
+        self.assertEqual(0, bucket.try_acquire())
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(self.path, rate=50, burst=1)
+        self.assertEqual(0, bucket.acquire())
+        self.assertGreater(bucket.acquire(max_wait=0), 0)
+
+        started = time.monotonic()
+        self.assertEqual(0, bucket.acquire(max_wait=1))
+        self.assertLess(time.monotonic() - started, 1)
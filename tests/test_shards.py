@@ -0,0 +1,206 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from csgobeans import export
+from csgobeans import shards
+from csgobeans.db import Database
+from csgobeans.pool import ConnectionPool
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_file_path = os.path.join(self.db_dir, 'testdb.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir)
+
+    def populate(self, count, users=20):
+        db = Database(self.db_file_path, shards=count)
+        db.migrate()
+        db.populate_beans_from_file()
+        user_ids = []
+        for i in range(users):
+            user_id = db.login_steam_user(1000 + i)
+            db.give_user_id_beans(user_id, [(1, i + 1)])
+            db.record_trade(user_id, 'item-%d' % i)
+            user_ids.append(user_id)
+        db.close()
+        return user_ids
+
+    def assert_users_intact(self, count, user_ids):
+        db = Database(self.db_file_path, shards=count)
+        for i, user_id in enumerate(user_ids):
+            self.assertEqual(user_id, db.user_id_from_steam_id(1000 + i))
+            self.assertEqual(
+                [(1, i + 1)],
+                [(bean_id, qty) for bean_id, qty, _
+                 in db.list_inventory_from_user_id(user_id)])
+            self.assertEqual(
+                ['item-%d' % i],
+                [item for _, item, _
+                 in db.list_trades_from_user_id(user_id)])
+            self.assertEqual(2, db.user_version(user_id))
+        self.assertEqual(
+            [1000 + i for i in range(len(user_ids))],
+            db.steam_ids_from_user_ids(user_ids))
+        db.close()
+
+    def expected_rows(self, table, users=20):
+        # One quality and one color row per user.
+        return users * 2 if table == 'user_breakdowns' else users
+
+    def rebalance(self, old, new):
+        db = Database(self.db_file_path, shards=max(old, new))
+        db.migrate_shards(new)
+        moved = shards.rebalance(db.db, old, new, batch_size=3)
+        shards.store_shards(db.db, new)
+        db.close()
+        return moved
+
+    def trade_ids(self, count):
+        return [
+            trade_id
+            for rows in shards.fan_out(
+                shards.shard_paths(self.db_file_path, count),
+                'SELECT trade_id FROM trades')
+            for trade_id, in rows]
+
+    def rows_per_file(self, count, table):
+        paths = shards.shard_paths(self.db_file_path, count)
+        return [rows[0][0] for rows in shards.fan_out(
+            [self.db_file_path] + paths,
+            'SELECT COUNT(*) FROM {}'.format(table))]
+
+    def test_shard_for(self):
+        self.assertEqual(shards.shard_for(42, 4), shards.shard_for(42, 4))
+        used = set(shards.shard_for(user_id, 4) for user_id in range(100))
+        self.assertEqual({0, 1, 2, 3}, used)
+
+    def test_check_count(self):
+        shards.check_count(0)
+        shards.check_count(shards.MAX_SHARDS)
+        with self.assertRaises(ValueError):
+            shards.check_count(shards.MAX_SHARDS + 1)
+
+    def test_rows_live_in_their_shard(self):
+        user_ids = self.populate(3)
+        self.assertEqual([20, 0, 0, 0], self.rows_per_file(3, 'auth'))
+        for table in shards.SHARDED_TABLES:
+            counts = self.rows_per_file(3, table)
+            self.assertEqual(0, counts[0])
+            self.assertEqual(self.expected_rows(table), sum(counts))
+
+        for user_id in user_ids:
+            path = shards.shard_path(
+                self.db_file_path, shards.shard_for(user_id, 3))
+            connection = sqlite3.connect(path)
+            self.assertIsNotNone(connection.execute(
+                'SELECT 1 FROM inventory WHERE user_id = ?', (user_id,)
+            ).fetchone())
+            connection.close()
+        self.assert_users_intact(3, user_ids)
+
+    def test_trade_ids_are_unique_across_shards(self):
+        self.populate(3)
+        trade_ids = self.trade_ids(3)
+        self.assertEqual(len(trade_ids), len(set(trade_ids)))
+        self.assertTrue(all(
+            trade_id > shards.TRADE_ID_RANGE for trade_id in trade_ids))
+
+    def test_trade_ids_stay_unique_after_rebalance(self):
+        user_ids = self.populate(4)
+        self.rebalance(4, 2)
+        self.rebalance(2, 4)
+
+        db = Database(self.db_file_path, shards=4)
+        for user_id in user_ids:
+            db.record_trade(user_id, 'recorded-%d' % user_id)
+            db.redeem_items(user_id, [('redeemed-%d' % user_id, 1, 1)])
+        db.close()
+
+        trade_ids = self.trade_ids(4)
+        self.assertEqual(len(user_ids) * 3, len(trade_ids))
+        self.assertEqual(len(trade_ids), len(set(trade_ids)))
+        for index, rows in enumerate(shards.fan_out(
+            shards.shard_paths(self.db_file_path, 4),
+            "SELECT seq FROM sqlite_sequence WHERE name = 'trades'"
+        )):
+            first, last = shards.trade_id_range(index)
+            self.assertTrue(first <= rows[0][0] < last)
+
+    def test_redeem_items_checks_every_shard(self):
+        user_ids = self.populate(3, users=10)
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(shards.shard_for(user_id, 3), user_id)
+        first, second = list(by_shard.values())[:2]
+
+        db = Database(self.db_file_path, shards=3)
+        self.assertEqual([True], db.redeem_items(first, [('knife', 1, 1)]))
+        self.assertEqual([False], db.redeem_items(second, [('knife', 1, 1)]))
+        db.close()
+
+    def test_layout_mismatch(self):
+        self.populate(0)
+        with self.assertRaises(shards.ShardLayoutError):
+            Database(self.db_file_path, shards=2).migrate()
+
+        connection = sqlite3.connect(self.db_file_path)
+        shards.check_layout(connection, 0)
+        with self.assertRaises(shards.ShardLayoutError):
+            shards.check_layout(connection, 2)
+        connection.close()
+
+    def test_rebalance(self):
+        user_ids = self.populate(0)
+
+        for old, new in ((0, 3), (3, 5), (5, 2), (2, 0)):
+            self.assertGreater(self.rebalance(old, new), 0)
+            self.assertEqual(0, self.rebalance(new, new))
+
+            connection = sqlite3.connect(self.db_file_path)
+            self.assertEqual(new, shards.stored_shards(connection))
+            connection.close()
+            for table in shards.SHARDED_TABLES:
+                counts = self.rows_per_file(new, table)
+                self.assertEqual(self.expected_rows(table), sum(counts))
+                if new:
+                    self.assertEqual(0, counts[0])
+            self.assert_users_intact(new, user_ids)
+
+    def test_pool(self):
+        user_ids = self.populate(2)
+        pool = ConnectionPool(self.db_file_path, shards=2)
+        connection = pool.checkout()
+        for schema in ('main', 'shard0', 'shard1'):
+            self.assertEqual('wal', connection.execute(
+                'PRAGMA {}.journal_mode'.format(schema)).fetchone()[0])
+        db = Database(
+            self.db_file_path,
+            connection=connection,
+            release=pool.checkin,
+            shards=2)
+        self.assertEqual(user_ids[0], db.user_id_from_steam_id(1000))
+        db.record_trade(user_ids[0], 'pooled')
+        self.assertTrue(db.already_traded(user_ids[0], 'pooled'))
+        db.close()
+        pool.close()
+
+    def test_export(self):
+        user_ids = self.populate(3)
+        connection = export.connect_readonly(self.db_file_path, 3)
+        out_dir = os.path.join(self.db_dir, 'out')
+        os.mkdir(out_dir)
+        counts = export.export_tables(
+            connection, sorted(export.TABLES), out_dir, shards=3)
+        self.assertEqual(
+            {'auth': 20, 'inventory': 20, 'steam': 20, 'trades': 20},
+            counts)
+        counts = export.export_tables(
+            connection, ['trades'], out_dir, shards=3, user_id=user_ids[0])
+        self.assertEqual({'trades': 1}, counts)
+        connection.close()
@@ -0,0 +1,170 @@
+import functools
+import json
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from csgobeans import steam
+from csgobeans.cache import InventoryCache
+from csgobeans.inventory import load_csgo_inventory, parse_csgo_inventory
+
+from bench.stub_steam import (
+    StubSteamServer, make_inventory, make_inventory_page)
+
+
+class TestParseInventory(unittest.TestCase):
+    def test_legacy_format(self):
+        text = json.dumps(make_inventory("1", 3))
+        chunks = [text[i:i + 5] for i in range(0, len(text), 5)]
+        items, more_items, last_assetid = parse_csgo_inventory(chunks)
+        self.assertEqual(
+            [("100000", "Stub Skin 0 (Field-Tested)"),
+             ("100001", "Stub Skin 1 (Field-Tested)"),
+             ("100002", "Stub Skin 2 (Field-Tested)")],
+            items)
+        self.assertFalse(more_items)
+
+    def test_paginated_format(self):
+        page = make_inventory_page("1", 5, 2, start_assetid="100000")
+        items, more_items, last_assetid = parse_csgo_inventory(
+            [json.dumps(page)])
+        self.assertEqual(
+            ["100001", "100002"], [item_id for item_id, _ in items])
+        self.assertTrue(more_items)
+        self.assertEqual("100002", last_assetid)
+
+    def test_unsuccessful(self):
+        with self.assertRaises(AssertionError):
+            parse_csgo_inventory(['{"success": false}'])
+
+
+class TestSteamClient(unittest.TestCase):
+    def setUp(self):
+        self.server = StubSteamServer(inventory_size=3).start()
+        self.client = steam.SteamClient(
+            base_url=self.server.base_url, retry_backoff=0)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_load_inventory_reuses_connection(self):
+        for _ in range(3):
+            inventory, too_many, retry_after = load_csgo_inventory(
+                "76561197960265728", self.client)
+            self.assertFalse(too_many)
+            self.assertEqual(3, len(inventory))
+
+        self.assertEqual(3, self.server.counters['requests'])
+        self.assertEqual(1, self.server.counters['connections'])
+
+    def test_load_paginated_inventory(self):
+        self.server.inventory_size = 5
+        inventory, too_many, retry_after = load_csgo_inventory(
+            "76561197960265728", self.client, page_size=2)
+        self.assertFalse(too_many)
+        self.assertEqual(5, len(inventory))
+        self.assertEqual(5, len(set(inventory)))
+        self.assertEqual(3, self.server.counters['requests'])
+
+    def test_paging_stops_without_cursor(self):
+        self.server.inventory_size = 5
+        self.server.broken_cursor = 'missing'
+        inventory, too_many, retry_after = load_csgo_inventory(
+            "76561197960265728", self.client, page_size=2)
+        self.assertFalse(too_many)
+        self.assertEqual(2, len(inventory))
+        self.assertEqual(1, self.server.counters['requests'])
+
+    def test_paging_stops_on_repeated_cursor(self):
+        self.server.inventory_size = 5
+        self.server.broken_cursor = 'repeat'
+        inventory, too_many, retry_after = load_csgo_inventory(
+            "76561197960265728", self.client, page_size=2)
+        self.assertFalse(too_many)
+        self.assertEqual(2, len(inventory))
+        self.assertEqual(2, len(set(inventory)))
+        self.assertEqual(2, self.server.counters['requests'])
+
+    def test_paging_stops_at_max_pages(self):
+        self.server.inventory_size = 5
+        inventory, too_many, retry_after = load_csgo_inventory(
+            "76561197960265728", self.client, page_size=1, max_pages=3)
+        self.assertEqual(3, len(inventory))
+        self.assertEqual(3, self.server.counters['requests'])
+
+    def test_later_page_too_many_requests(self):
+        self.server.inventory_size = 5
+        self.server.throttle_every = 2
+        cache = InventoryCache(self.cache_dir)
+        loader = functools.partial(
+            load_csgo_inventory, client=self.client, page_size=2)
+        self.assertEqual(
+            ([], True, "60"), cache.get("76561197960265728", loader))
+        self.assertEqual(2, self.server.counters['requests'])
+
+        inventory, too_many, retry_after = cache.get(
+            "76561197960265728", loader)
+        self.assertTrue(too_many)
+        self.assertEqual(1, cache.stats()["backoff"])
+        self.assertEqual(2, self.server.counters['requests'])
+
+    def test_too_many_requests(self):
+        self.server.throttle_every = 1
+        inventory, too_many, retry_after = load_csgo_inventory(
+            "76561197960265728", self.client)
+        self.assertEqual([], inventory)
+        self.assertTrue(too_many)
+        self.assertEqual("60", retry_after)
+
+    def test_rate_limited(self):
+        class Exhausted:
+            def acquire(self, max_wait):
+                return 2.5
+
+        self.client.rate_limiter = Exhausted()
+        with self.assertRaises(steam.SteamRateLimited):
+            self.client.post(steam.OPENID_LOGIN_PATH)
+        with self.assertRaises(steam.SteamRateLimited):
+            load_csgo_inventory("76561197960265728", self.client)
+        self.assertEqual(0, self.server.counters['requests'])
+
+    def test_rate_limited_does_not_back_off(self):
+        class Exhausted:
+            def acquire(self, max_wait):
+                return 2.5
+
+        cache = InventoryCache(self.cache_dir)
+        loader = functools.partial(load_csgo_inventory, client=self.client)
+        self.client.rate_limiter = Exhausted()
+        with self.assertRaises(steam.SteamRateLimited):
+            cache.get("76561197960265728", loader)
+
+        self.client.rate_limiter = None
+        inventory, too_many, retry_after = cache.get(
+            "76561197960265728", loader)
+        self.assertFalse(too_many)
+        self.assertEqual(3, len(inventory))
+        self.assertEqual(0, cache.stats()["backoff"])
+
+    def test_check_authentication(self):
+        response = self.client.post(
+            steam.OPENID_LOGIN_PATH,
+            data={"openid.mode": "check_authentication"})
+        self.assertIn("is_valid:true", response.text)
+
+    def test_read_timeout(self):
+        self.server.latency = 0.5
+        client = steam.SteamClient(
+            base_url=self.server.base_url,
+            read_timeout=0.05,
+            retries=1,
+            retry_backoff=0)
+        with self.assertRaises(requests.Timeout):
+            client.get(steam.CSGO_INVENTORY_PATH % "1")
+        self.assertEqual(2, self.server.counters['requests'])
+        client.close()